@@ -48,6 +48,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'lacteos.metrics.MetricsMiddleware',
+    'lacteos.profiling.ProfilingMiddleware',
+    'lacteos.slow_queries.SlowQueryMiddleware',
+    'django.middleware.gzip.GZipMiddleware',
+    'lacteos.middleware.ReplicaStickyMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -60,15 +65,22 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's backend with render times reported to lacteos.metrics
+        'BACKEND': 'lacteos.templating.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Parse each template once per process
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -86,6 +98,131 @@ DATABASES = {
     }
 }
 
+# Optional read-only replica for reporting views (dashboard, exports, analytics).
+# Locally a second SQLite file refreshed with `manage.py refresh_replica`. It is opened
+# with mode=ro, so a write routed to it by mistake fails instead of diverging the copy.
+if os.getenv("REPLICA_DB_NAME"):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': Path(os.getenv("REPLICA_DB_NAME")).resolve().as_uri() + '?mode=ro',
+        'OPTIONS': {'uri': True},
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Shops. Each branch keeps its sales, sale items, sales archive and change feed in its own
+# database, so checkouts at different shops do not queue on one SQLite write lock. The
+# catalog, users and customers stay in default, which also holds DEFAULT_BRANCH's sales.
+# BRANCHES="norte,sur" adds db_norte.sqlite3 and db_sur.sqlite3. Only append to the list:
+# a branch's position fixes the id range of its sales (lacteos.branches).
+DEFAULT_BRANCH = os.getenv("DEFAULT_BRANCH", "principal")
+BRANCH_DATABASES = {DEFAULT_BRANCH: 'default'}
+for branch in filter(None, (name.strip() for name in os.getenv("BRANCHES", "").split(','))):
+    DATABASES[f'branch_{branch}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_{branch}.sqlite3',
+    }
+    BRANCH_DATABASES[branch] = f'branch_{branch}'
+
+DATABASE_ROUTERS = ['lacteos.routers.BranchRouter', 'lacteos.routers.ReplicaRouter']
+
+# Seconds a worker keeps its database connections open between requests (0 closes them
+# after every request). Persistent connections are checked before reuse.
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = int(os.getenv("DB_CONN_MAX_AGE", "0"))
+    database['CONN_HEALTH_CHECKS'] = True
+
+# Seconds a client keeps reading from the primary after it writes
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "60"))
+
+
+# Admission control for write endpoints (lacteos.admission). Per scope, each user
+# (or client address, plus the username tried for logins) may make `rate` requests per
+# second with bursts of `burst`, all users together `global_rate` / `global_burst` (login
+# has no global limit), and at most `concurrency` run at once per process, waiting up to
+# ADMISSION_QUEUE_SECONDS for a slot.
+# Requests over a limit get a 429 with Retry-After instead of queueing on the database.
+# Behind a reverse proxy set ADMISSION_CLIENT_IP_HEADER to the header it puts the client
+# address in (X-Forwarded-For, X-Real-IP); only the address the proxy added is trusted.
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_QUEUE_SECONDS = float(os.getenv("ADMISSION_QUEUE_SECONDS", "0.5"))
+ADMISSION_CLIENT_IP_HEADER = os.getenv("ADMISSION_CLIENT_IP_HEADER", "")
+ADMISSION_LIMITS = {
+    'checkout': {
+        'rate': 1, 'burst': 5,
+        'global_rate': float(os.getenv("ADMISSION_CHECKOUT_RATE", "50")), 'global_burst': 100,
+        'concurrency': int(os.getenv("ADMISSION_CHECKOUT_CONCURRENCY", "4")),
+    },
+    'login': {
+        'rate': 0.2, 'burst': 5,
+        'concurrency': int(os.getenv("ADMISSION_LOGIN_CONCURRENCY", "4")),
+    },
+}
+
+
+# Warm WSGI/ASGI workers up before they take traffic (lacteos.warmup): compile the URL
+# patterns and templates, connect to the databases and fill the catalog caches. Startup
+# cost is broken down by `manage.py startup_report`. Turn off with gunicorn --preload,
+# where the warm-up would run in the master and share its connections with the workers.
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+
+
+# Cache used for template fragments (product and sale cards) and cached counts
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'lacteos',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+
+# Prometheus metrics at /metrics. Scrapers send METRICS_TOKEN as a bearer token.
+# With several worker processes point METRICS_DIR at a directory they share.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+METRICS_FLUSH_SECONDS = 5
+
+
+# Change feed at /api/changes/ (lacteos.changes). Integrations send CHANGE_FEED_TOKEN as a
+# bearer token. Events older than the retention are removed by `manage.py prune_changes`.
+# With concurrent writers (PostgreSQL) ids can commit out of order; a settle delay of a few
+# seconds keeps readers from moving past an id that is not committed yet.
+CHANGE_FEED_TOKEN = os.getenv("CHANGE_FEED_TOKEN", "")
+CHANGE_FEED_RETENTION_DAYS = int(os.getenv("CHANGE_FEED_RETENTION_DAYS", "30"))
+CHANGE_FEED_SETTLE_SECONDS = float(os.getenv("CHANGE_FEED_SETTLE_SECONDS", "0"))
+
+
+# Queries at least this slow (ms) are logged with their plan, see `manage.py slow_queries`.
+# 0 turns the slow-query log off. Each process buffers them and queues a job to store them
+# at most every SLOW_QUERY_FLUSH_SECONDS, so they show up once `run_workers` has run it.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_FLUSH_SECONDS = float(os.getenv("SLOW_QUERY_FLUSH_SECONDS", "60"))
+
+
+# Opt-in request profiling, off unless PROFILING_ENABLED=1. Sampled requests and
+# requests with an admin's X-Lacteos-Profile header are profiled into PROFILING_DIR.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED") == "1"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_DIR = Path(os.getenv("PROFILING_DIR", BASE_DIR / 'profiles'))
+PROFILING_KEEP = int(os.getenv("PROFILING_KEEP", "200"))
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+
+
+# Session storage, see `manage.py bench_sessions` for the queries each one costs.
+# "db" is Django's default, "signed_cookies" keeps them in a signed cookie with no
+# server-side storage. "cached_db" reads sessions through the cache and only writes them
+# when they change; it needs a cache all workers share (Redis, Memcached), otherwise a
+# logout in one worker leaves the session alive in the others' caches (check lacteos.E001).
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.getenv("SESSION_MODE", "db")]
+
+# Flash messages travel in a signed cookie instead of the session
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -113,6 +250,9 @@ LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
 
+# Calendar used by sales reports, matching the dates templates display (lacteos.dates)
+REPORT_TIME_ZONE = 'America/Lima'
+
 USE_I18N = True
 
 USE_TZ = True
@@ -122,6 +262,23 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATICFILES_DIRS = [BASE_DIR / 'static']
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Fingerprinted names plus precompressed .gz/.br copies, run collectstatic on deploy.
+# Product images are named by content hash, so identical uploads share one file;
+# run gc_media periodically to remove the ones no product uses any more.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'product_images': {
+        'BACKEND': 'lacteos.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'lacteos.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
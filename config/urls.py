@@ -15,16 +15,17 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.contrib.auth import views as auth_views
 from . import views
+from lacteos.decorators import admission_control
 from django.conf import settings
 from django.conf.urls.static import static
 
 urlpatterns = [
     path("", include("lacteos.urls"), name="lacteos"),
     path('', views.home, name='home'),# Auth URLs
-    path('accounts/login/', auth_views.LoginView.as_view(), name='login'),
+    path('accounts/login/', admission_control('login')(auth_views.LoginView.as_view()), name='login'),
     path('accounts/logout/', views.logout_view, name='logout'),
     path('accounts/signup/', views.signup, name='signup'),
     
@@ -52,4 +53,10 @@ urlpatterns = [
     path('superadmin/', admin.site.urls),
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+# runserver serves static files itself while DEBUG is on
+if not settings.DEBUG:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'), views.static_asset, name='static_asset'),
+    ]
\ No newline at end of file
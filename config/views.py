@@ -1,4 +1,12 @@
+import mimetypes
+import re
+from pathlib import Path
+from django.conf import settings
+from django.http import FileResponse, Http404
 from django.shortcuts import render, redirect
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_safe
 from django.contrib.auth import login, logout
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
@@ -31,4 +39,39 @@ def logout_view(request):
     """Custom logout view that accepts GET requests"""
     logout(request)
     messages.success(request, 'Has cerrado sesión exitosamente.')
-    return redirect('home')
\ No newline at end of file
+    return redirect('home')
+
+
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+STATIC_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+@require_safe
+def static_asset(request, path):
+    """Serve collected static files, preferring precompressed variants"""
+    try:
+        full_path = Path(safe_join(settings.STATIC_ROOT, path))
+    except ValueError:
+        raise Http404
+    if not full_path.is_file():
+        raise Http404
+
+    content_type = mimetypes.guess_type(full_path.name)[0] or 'application/octet-stream'
+    accept_encoding = request.headers.get('Accept-Encoding', '')
+    encoding = None
+    for candidate, suffix in STATIC_ENCODINGS:
+        variant = full_path.with_name(full_path.name + suffix)
+        if candidate in accept_encoding and variant.is_file():
+            full_path, encoding = variant, candidate
+            break
+
+    response = FileResponse(full_path.open('rb'), content_type=content_type)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if HASHED_NAME.search(path):
+        # Fingerprinted names change whenever the content does
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
@@ -8,9 +8,16 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
 import os
+import time
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
+started = time.perf_counter()
 application = get_wsgi_application()
+
+# Pay for URL, template, connection and cache setup here rather than on the first requests
+from lacteos.warmup import warm_up_worker  # noqa: E402
+
+warm_up_worker(setup_seconds=time.perf_counter() - started)
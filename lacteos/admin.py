@@ -1,7 +1,171 @@
-from django.contrib import admin
+from datetime import timedelta
+from django.conf import settings
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import Lacteo, Sale, SaleItem, PriceHistory, UserProfile
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import DateTimeField, QuerySet
+from django.utils import timezone
+from .inventory import record_new_product, record_price_change, set_stock
+from .models import ChangeEvent, Customer, Lacteo, Sale, SaleItem, PriceHistory, UserProfile, MonthlySalesSummary, ArchivedSale, Job, SlowQuery, StockMovement, StockSnapshot
+from .pagination import EstimatedCountPaginator
+
+
+# Lookups in another database matching more ids than this are cut off with a warning
+INPUT_FILTER_MATCHES = 50
+
+
+class IndexedDatesQuerySet(QuerySet):
+    """
+    QuerySet whose dates()/datetimes() step through an indexed date column
+    one period at a time (a LIMIT 1 index seek per year, month or day shown)
+    instead of truncating every matching row with SELECT DISTINCT. The
+    admin's date hierarchy links are built from these calls.
+    """
+
+    def _periods(self, field_name, kind, order, tzinfo=None):
+        field = self.model._meta.get_field(field_name)
+        aware = isinstance(field, DateTimeField) and settings.USE_TZ
+        tzinfo = tzinfo or timezone.get_current_timezone()
+        values = self.order_by(field_name).values_list(field_name, flat=True)
+        periods = []
+        lower = None
+        while True:
+            value = (values if lower is None else values.filter(**{f'{field_name}__gte': lower})).first()
+            if value is None:
+                break
+            if aware:
+                value = timezone.localtime(value, tzinfo)
+            start = value.replace(day=1, month=1) if kind == 'year' else (
+                value.replace(day=1) if kind == 'month' else value
+            )
+            if isinstance(field, DateTimeField):
+                start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+            periods.append(start)
+            if kind == 'year':
+                lower = start.replace(year=start.year + 1)
+            elif kind == 'month':
+                lower = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+            else:
+                lower = start + timedelta(days=1)
+        return periods[::-1] if order == 'DESC' else periods
+
+    def _walkable(self, field_name, kind):
+        return '__' not in field_name and kind in ('year', 'month', 'day')
+
+    def dates(self, field_name, kind, order='ASC'):
+        if not self._walkable(field_name, kind):
+            return super().dates(field_name, kind, order)
+        return self._periods(field_name, kind, order)
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if not self._walkable(field_name, kind):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        return self._periods(field_name, kind, order, tzinfo)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables too big to count or scan per page view:
+    an estimated total instead of COUNT(*), no unfiltered total or facet
+    counts, and index seeks for the date hierarchy.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return IndexedDatesQuerySet(queryset.model, queryset.query, queryset._db, queryset._hints)
+
+
+class InputFilter(admin.SimpleListFilter):
+    """
+    List filter typed into a text box, for foreign keys with too many rows
+    to list as links. Subclasses set field and return the matching ids.
+
+    When the ids come from the changelist's own database they are matched
+    with a subquery. Sales and their items are in a branch database, so
+    there the first INPUT_FILTER_MATCHES ids are fetched, with a warning
+    when more matched.
+    """
+    template = 'admin/input_filter.html'
+    field = None
+
+    def __init__(self, request, params, model, model_admin):
+        if self.field is None:
+            raise ImproperlyConfigured(f"The list filter '{type(self).__name__}' does not specify a 'field'.")
+        super().__init__(request, params, model, model_admin)
+
+    def lookups(self, request, model_admin):
+        # Never shown, SimpleListFilter only renders when there is a lookup
+        return [('', '')]
+
+    def matching_ids(self, value):
+        raise NotImplementedError('InputFilter.matching_ids() must be overridden to return a values_list of ids.')
+
+    def queryset(self, request, queryset):
+        value = (self.value() or '').strip()
+        if not value:
+            return queryset
+        matches = self.matching_ids(value)
+        if matches.db == queryset.db:
+            return queryset.filter(**{f'{self.field}__in': matches})
+        ids = list(matches[:INPUT_FILTER_MATCHES + 1])
+        if len(ids) > INPUT_FILTER_MATCHES:
+            ids = ids[:INPUT_FILTER_MATCHES]
+            messages.warning(request, (
+                f'More than {INPUT_FILTER_MATCHES} {self.title}s match "{value}", only rows of the first '
+                f'{INPUT_FILTER_MATCHES} are listed. Type more of the name or an id.'
+            ))
+        if not ids:
+            return queryset.none()
+        return queryset.filter(**{f'{self.field}__in': ids})
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'hidden': [
+                (key, value)
+                for key, values in changelist.filter_params.items()
+                if key not in (self.parameter_name, 'p')
+                for value in values
+            ],
+        }
+
+
+class ProductFilter(InputFilter):
+    title = 'product'
+    parameter_name = 'product'
+    field = 'lacteo_id'
+
+    def matching_ids(self, value):
+        products = Lacteo.objects.order_by('pk').values_list('pk', flat=True)
+        if value.isdigit():
+            return products.filter(pk=value)
+        return products.filter(name__icontains=value)
+
+
+class UserFilter(InputFilter):
+    title = 'user'
+    parameter_name = 'user'
+
+    def matching_ids(self, value):
+        users = User.objects.order_by('pk').values_list('pk', flat=True)
+        if value.isdigit():
+            return users.filter(pk=value)
+        return users.filter(username__iexact=value)
+
+
+class CreatedByFilter(UserFilter):
+    title = 'created by'
+    field = 'created_by_id'
+
+
+class ChangedByFilter(UserFilter):
+    title = 'changed by'
+    field = 'changed_by_id'
 
 
 @admin.register(Lacteo)
@@ -23,37 +187,55 @@ class LacteoAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        # The changeform view runs in a transaction, the ledger rows commit with the product
+        if not change:
+            super().save_model(request, obj, form, change)
+            record_new_product(obj, request.user)
+            return
+        set_stock(obj, obj.stock, request.user, 'Edited in admin')
+        super().save_model(request, obj, form, change)
+        record_price_change(obj, form.initial.get('price'), form.initial.get('cost_price'), request.user, 'Edited in admin')
+
 
 class SaleItemInline(admin.TabularInline):
     model = SaleItem
     extra = 1
     readonly_fields = ['subtotal', 'cost_subtotal', 'profit']
+    autocomplete_fields = ['lacteo']
 
 
 @admin.register(Sale)
-class SaleAdmin(admin.ModelAdmin):
+class SaleAdmin(LargeTableAdmin):
     list_display = ['id', 'sale_date', 'customer_name', 'total_amount', 'total_profit', 'roi', 'created_by']
-    list_filter = ['sale_date', 'created_by']
+    list_select_related = ['created_by']
+    list_filter = ['sale_date', CreatedByFilter]
     search_fields = ['customer_name', 'notes']
-    readonly_fields = ['total_amount', 'total_cost', 'total_profit', 'roi']
+    readonly_fields = ['total_amount', 'total_cost', 'total_profit', 'roi', 'checkout']
+    autocomplete_fields = ['created_by', 'customer']
     inlines = [SaleItemInline]
     date_hierarchy = 'sale_date'
 
 
 @admin.register(SaleItem)
-class SaleItemAdmin(admin.ModelAdmin):
+class SaleItemAdmin(LargeTableAdmin):
     list_display = ['id', 'sale', 'lacteo', 'quantity', 'unit_price', 'subtotal', 'profit']
-    list_filter = ['sale__sale_date', 'lacteo']
+    list_select_related = ['sale', 'lacteo']
+    list_filter = ['sale__sale_date', ProductFilter]
     search_fields = ['lacteo__name', 'sale__customer_name']
     readonly_fields = ['subtotal', 'cost_subtotal', 'profit']
+    raw_id_fields = ['sale']
+    autocomplete_fields = ['lacteo']
 
 
 @admin.register(PriceHistory)
-class PriceHistoryAdmin(admin.ModelAdmin):
+class PriceHistoryAdmin(LargeTableAdmin):
     list_display = ['lacteo', 'price', 'cost_price', 'changed_at', 'changed_by', 'reason']
-    list_filter = ['changed_at', 'lacteo']
+    list_select_related = ['lacteo', 'changed_by']
+    list_filter = ['changed_at', ProductFilter, ChangedByFilter]
     search_fields = ['lacteo__name', 'reason']
     readonly_fields = ['changed_at']
+    autocomplete_fields = ['lacteo', 'changed_by']
     date_hierarchy = 'changed_at'
 
 
@@ -91,3 +273,66 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_filter = ['role', 'created_at']
     search_fields = ['user__username', 'user__email', 'phone']
     readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(MonthlySalesSummary)
+class MonthlySalesSummaryAdmin(admin.ModelAdmin):
+    list_display = ['month', 'sale_count', 'item_count', 'total_amount', 'total_profit']
+    date_hierarchy = 'month'
+
+
+@admin.register(ArchivedSale)
+class ArchivedSaleAdmin(LargeTableAdmin):
+    list_display = ['id', 'sale_date', 'customer_name', 'total_amount', 'total_profit', 'archived_at']
+    search_fields = ['customer_name']
+    date_hierarchy = 'sale_date'
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_at', 'locked_by', 'finished_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['created_at', 'finished_at', 'locked_at', 'locked_by', 'last_error']
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['sql', 'view', 'count', 'total_ms', 'max_ms', 'full_scan', 'last_seen']
+    list_filter = ['full_scan', 'alias']
+    search_fields = ['sql', 'view']
+    readonly_fields = ['fingerprint', 'first_seen', 'last_seen']
+
+
+@admin.register(Customer)
+class CustomerAdmin(LargeTableAdmin):
+    list_display = ['name', 'order_count', 'lifetime_revenue', 'lifetime_profit', 'last_purchase']
+    search_fields = ['name', 'key']
+    readonly_fields = ['key', 'order_count', 'lifetime_revenue', 'lifetime_profit', 'first_purchase', 'last_purchase', 'created_at']
+
+
+@admin.register(ChangeEvent)
+class ChangeEventAdmin(LargeTableAdmin):
+    list_display = ['id', 'model', 'object_id', 'operation', 'created_at']
+    list_filter = ['model', 'operation']
+    readonly_fields = ['model', 'object_id', 'operation', 'data', 'created_at']
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(LargeTableAdmin):
+    list_display = ['created_at', 'lacteo', 'kind', 'quantity', 'sale_id', 'created_by', 'note']
+    list_select_related = ['lacteo', 'created_by']
+    list_filter = ['kind', 'created_at', ProductFilter]
+    readonly_fields = ['lacteo', 'kind', 'quantity', 'created_at', 'sale_id', 'created_by', 'note']
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        # Movements are written with the stock change, edit the product instead
+        return False
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(LargeTableAdmin):
+    list_display = ['taken_at', 'lacteo', 'stock']
+    list_select_related = ['lacteo']
+    list_filter = ['taken_at', ProductFilter]
+    readonly_fields = ['taken_at', 'lacteo', 'stock']
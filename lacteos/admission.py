@@ -0,0 +1,127 @@
+"""
+Admission control for write endpoints (checkout and login).
+
+During a burst every extra request waiting for SQLite's write lock makes
+all of them slower. A request is only let in while its user's token
+bucket and the scope's global bucket have a token, and while fewer than
+the scope's concurrency limit run in this process; waiting for a free
+slot is bounded by ADMISSION_QUEUE_SECONDS. Everything else is turned
+away at once with a 429 and a Retry-After header.
+
+Anonymous requests are told apart by client address, taken from
+ADMISSION_CLIENT_IP_HEADER when a reverse proxy sets it; login attempts
+also by the username being tried, so users behind one proxy or shop
+network do not share a bucket. Login has no global bucket: one client
+hammering it must not lock everybody else out.
+
+Buckets live in the cache, so worker processes sharing a cache share the
+rate limits. Reading and refilling a bucket is not atomic: concurrent
+requests may take the same token, which only lets a burst slightly over
+its limit through.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+
+_slots = {}
+_slots_lock = threading.Lock()
+
+
+class Rejected(Exception):
+    """The request was not admitted, the client may retry after retry_after seconds"""
+
+    def __init__(self, scope, reason, retry_after):
+        super().__init__(f'{scope}: {reason} limit reached, retry in {retry_after}s')
+        self.scope = scope
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def take_token(key, rate, burst):
+    """
+    Take a token from the bucket at key, refilled at rate per second up to
+    burst. Returns 0 when taken, otherwise the seconds until one is available.
+    """
+    now = time.time()
+    tokens, stamp = cache.get(key) or (burst, now)
+    tokens = min(burst, tokens + (now - stamp) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    cache.set(key, (tokens - 1, now), timeout=math.ceil(burst / rate) + 1)
+    return 0
+
+
+def _semaphore(scope, size):
+    with _slots_lock:
+        semaphore = _slots.get(scope)
+        if semaphore is None:
+            semaphore = _slots[scope] = threading.BoundedSemaphore(size)
+        return semaphore
+
+
+def bucket_key(scope, identity=None):
+    """Cache key of identity's bucket, or of the scope's global bucket"""
+    return f'lacteos:admission:{scope}:{identity}' if identity else f'lacteos:admission:{scope}'
+
+
+def client_address(request):
+    """
+    Address of the client. Behind a reverse proxy, the last address in
+    ADMISSION_CLIENT_IP_HEADER, the one the proxy itself added.
+    """
+    header = settings.ADMISSION_CLIENT_IP_HEADER
+    forwarded = request.headers.get(header, '') if header else ''
+    addresses = [address.strip() for address in forwarded.split(',') if address.strip()]
+    return addresses[-1] if addresses else request.META.get('REMOTE_ADDR', '')
+
+
+def client_identity(request):
+    """
+    The logged in user, or for anonymous requests the client address
+    together with the username a login form submits
+    """
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    identity = f'addr:{client_address(request)}'
+    username = request.POST.get('username', '').strip().casefold()
+    if username:
+        identity += ':login:' + sha1(username.encode()).hexdigest()[:16]
+    return identity
+
+
+@contextmanager
+def admit(scope, identity):
+    """
+    Run the block if the scope's limits allow one more request from
+    identity, otherwise raise Rejected.
+    """
+    limits = settings.ADMISSION_LIMITS[scope]
+    if not settings.ADMISSION_ENABLED:
+        yield
+        return
+
+    buckets = [('client', bucket_key(scope, identity), limits['rate'], limits['burst'])]
+    if limits.get('global_rate'):
+        buckets.append(('global', bucket_key(scope), limits['global_rate'], limits['global_burst']))
+    for reason, key, rate, burst in buckets:
+        wait = take_token(key, rate, burst)
+        if wait:
+            metrics.inc('lacteos_admission_rejections_total', (scope, reason))
+            raise Rejected(scope, reason, math.ceil(wait))
+
+    semaphore = _semaphore(scope, limits['concurrency'])
+    if not semaphore.acquire(timeout=settings.ADMISSION_QUEUE_SECONDS):
+        metrics.inc('lacteos_admission_rejections_total', (scope, 'concurrency'))
+        raise Rejected(scope, 'concurrency', 1)
+    try:
+        yield
+    finally:
+        semaphore.release()
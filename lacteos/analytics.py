@@ -0,0 +1,139 @@
+"""
+Catalog-wide pricing analytics on NumPy arrays.
+
+Lacteo.get_profit_margin() works one product at a time on Decimals. Here the
+catalog and its recent sales are read into parallel arrays (one query for
+the catalog, one grouped query per branch for units sold), so margins and
+what-if scenarios are computed for every product at once.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Sum
+from django.utils import timezone
+
+from .branches import fan_out
+from .models import Lacteo, SaleItem
+
+
+# Same fallback as checkout.unit_cost for products without a cost price
+ESTIMATED_COST_RATIO = 0.6
+MONTH_DAYS = 30
+
+
+class CatalogArrays:
+    """One entry per product, in id order"""
+
+    def __init__(self, rows, units, days):
+        self.days = days
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.names = [row[1] for row in rows]
+        self.categories = np.array([row[2] for row in rows], dtype=object)
+        self.price = np.array([row[3] for row in rows], dtype=np.float64)
+        cost = np.array([row[4] for row in rows], dtype=np.float64)
+        self.cost = np.where(cost > 0, cost, self.price * ESTIMATED_COST_RATIO)
+        self.units = np.array([units.get(row[0], 0) for row in rows], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def monthly_units(self):
+        """Units sold in the window scaled to a 30 day month"""
+        return self.units * (MONTH_DAYS / self.days)
+
+
+def load_catalog(days=MONTH_DAYS):
+    """Read every product with the units it sold in the last days, across branches"""
+    since = timezone.now() - timedelta(days=days)
+    sold = fan_out(lambda: list(
+        SaleItem.objects.filter(sale__sale_date__gte=since)
+        .values('lacteo_id')
+        .annotate(units=Sum('quantity'))
+        .order_by()
+        .values_list('lacteo_id', 'units')
+    ))
+    units = {}
+    for rows in sold.values():
+        for lacteo_id, quantity in rows:
+            units[lacteo_id] = units.get(lacteo_id, 0) + quantity
+    rows = list(
+        Lacteo.objects.order_by('id').values_list('id', 'name', 'category', 'price', 'cost_price')
+    )
+    return CatalogArrays(rows, units, days)
+
+
+def margins(price, cost):
+    """Profit margin over cost in percent, like Lacteo.get_profit_margin"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(cost > 0, (price - cost) / cost * 100, 0.0)
+
+
+def _weighted_margin(profit, cost):
+    total_cost = cost.sum()
+    return float(profit.sum() / total_cost * 100) if total_cost > 0 else 0.0
+
+
+def simulate(catalog, price_change_pct=0.0, cost_change_pct=0.0, category=None, top=10):
+    """
+    Monthly profit now and after changing price and cost by the given percents.
+
+    Only products in category are repriced when it is given, the totals still
+    cover the whole catalog. Units sold are held at the current monthly rate,
+    there is no demand elasticity.
+    """
+    affected = catalog.categories == category if category else np.ones(len(catalog), dtype=bool)
+    new_price = np.where(affected, catalog.price * (1 + price_change_pct / 100), catalog.price)
+    new_cost = np.where(affected, catalog.cost * (1 + cost_change_pct / 100), catalog.cost)
+
+    units = catalog.monthly_units
+    revenue = catalog.price * units
+    cost = catalog.cost * units
+    profit = revenue - cost
+    new_revenue = new_price * units
+    new_cost_total = new_cost * units
+    new_profit = new_revenue - new_cost_total
+    impact = new_profit - profit
+
+    current_margin = margins(catalog.price, catalog.cost)
+    new_margin = margins(new_price, new_cost)
+    order = np.argsort(-np.abs(impact), kind='stable')[:top]
+    order = order[impact[order] != 0]
+
+    def money(value):
+        return round(float(value), 2)
+
+    return {
+        'days': catalog.days,
+        'price_change_pct': price_change_pct,
+        'cost_change_pct': cost_change_pct,
+        'category': category,
+        'products': int(len(catalog)),
+        'affected_products': int(affected.sum()),
+        'unprofitable_after': int((affected & (new_price <= new_cost)).sum()),
+        'current': {
+            'revenue': money(revenue.sum()),
+            'cost': money(cost.sum()),
+            'profit': money(profit.sum()),
+            'margin_pct': money(_weighted_margin(profit, cost)),
+        },
+        'simulated': {
+            'revenue': money(new_revenue.sum()),
+            'cost': money(new_cost_total.sum()),
+            'profit': money(new_profit.sum()),
+            'margin_pct': money(_weighted_margin(new_profit, new_cost_total)),
+        },
+        'profit_change': money(impact.sum()),
+        'top_impacts': [
+            {
+                'id': int(catalog.ids[i]),
+                'name': catalog.names[i],
+                'category': catalog.categories[i],
+                'monthly_units': money(units[i]),
+                'margin_pct': money(current_margin[i]),
+                'new_margin_pct': money(new_margin[i]),
+                'profit_change': money(impact[i]),
+            }
+            for i in order
+        ],
+    }
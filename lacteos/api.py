@@ -0,0 +1,301 @@
+"""
+JSON API for POS terminals and the mobile app.
+
+Catalog endpoints read through values() so rows come back as plain dicts and
+no Lacteo instances are built. Their responses carry an ETag derived from the
+catalog version, so an unchanged catalog costs one aggregate query and a 304.
+"""
+import json
+import math
+from hashlib import sha1
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET, require_POST
+
+from .analytics import load_catalog, simulate
+from .changes import MODEL_NAMES, CursorExpired, changes_since
+from .routers import UnknownBranch, branch_scope, default_branch
+from .checkout import CheckoutError, submit_sales
+from .decorators import admission_control, in_user_branch, use_replica
+from .models import Lacteo
+from .pagination import keyset_paginate
+
+
+API_FIELDS = [
+    'id', 'name', 'category', 'price', 'stock', 'unit', 'expiration_date',
+    'description', 'imagen', 'updated_at',
+]
+DEFAULT_FIELDS = ['id', 'name', 'category', 'price', 'stock', 'unit']
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+API_MAX_BATCH = 500
+SIMULATION_MAX_DAYS = 365
+
+
+class ApiError(Exception):
+    pass
+
+
+def catalog_version():
+    """Changes whenever a product is created, edited or deleted"""
+    stats = Lacteo.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    updated = stats['updated'].timestamp() if stats['updated'] else 0
+    return f"{stats['count']}-{updated}"
+
+
+def catalog_etag(request, *args, **kwargs):
+    query = sha1(request.get_full_path().encode()).hexdigest()[:16]
+    return f'{catalog_version()}-{query}'
+
+
+def _requested_fields(request, required=('id',)):
+    raw = request.GET.get('fields', '')
+    if raw:
+        fields = [field.strip() for field in raw.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in API_FIELDS]
+        if unknown:
+            raise ApiError(f"Unknown fields: {', '.join(unknown)}")
+    else:
+        fields = list(DEFAULT_FIELDS)
+    for field in required:
+        if field not in fields:
+            fields.append(field)
+    return fields
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    return max(1, min(limit, API_MAX_PAGE_SIZE))
+
+
+def _serialize(rows):
+    rows = list(rows)
+    if rows and 'imagen' in rows[0]:
+        # The storage Lacteo.imagen saves to, which may not be the default one
+        storage = Lacteo._meta.get_field('imagen').storage
+        for row in rows:
+            row['imagen'] = storage.url(row['imagen']) if row['imagen'] else None
+    return rows
+
+
+def _error(exc):
+    return JsonResponse({'error': str(exc)}, status=400)
+
+
+@require_GET
+@condition(etag_func=catalog_etag)
+def product_list(request):
+    """Products ordered by id, filtered by category/search, cursor paginated"""
+    try:
+        fields = _requested_fields(request)
+        limit = _limit(request)
+    except ApiError as exc:
+        return _error(exc)
+
+    products = Lacteo.objects.all()
+    category = request.GET.get('category', '')
+    search_query = request.GET.get('search', '')
+    if category:
+        products = products.filter(category=category)
+    if search_query:
+        products = products.filter(name__icontains=search_query)
+    if request.GET.get('in_stock') == '1':
+        products = products.filter(stock__gt=0)
+
+    page = keyset_paginate(
+        products.values(*fields), 'id', request.GET.get('cursor'), per_page=limit, descending=False
+    )
+    return JsonResponse({
+        'results': _serialize(page),
+        'next_cursor': page.next_cursor,
+    })
+
+
+@require_GET
+@condition(etag_func=catalog_etag)
+def product_batch(request):
+    """Fetch several products by id in one query: ?ids=1,2,3"""
+    try:
+        fields = _requested_fields(request)
+        ids = [int(pk) for pk in request.GET.get('ids', '').split(',') if pk.strip()]
+    except ApiError as exc:
+        return _error(exc)
+    except ValueError:
+        return _error('ids must be a comma separated list of integers')
+    if len(ids) > API_MAX_BATCH:
+        return _error(f'At most {API_MAX_BATCH} ids per request')
+
+    rows = _serialize(Lacteo.objects.filter(pk__in=ids).order_by('id').values(*fields))
+    found = {row['id'] for row in rows}
+    return JsonResponse({
+        'results': rows,
+        'missing': [pk for pk in ids if pk not in found],
+    })
+
+
+@require_GET
+@condition(etag_func=catalog_etag)
+def product_changes(request):
+    """
+    Products created or edited after ?cursor, oldest first.
+
+    Store the returned cursor and send it back next time. Deleted products
+    are not listed; pass include_ids=1 to get every current id and prune.
+    """
+    try:
+        fields = _requested_fields(request, required=('id', 'updated_at'))
+        limit = _limit(request)
+    except ApiError as exc:
+        return _error(exc)
+
+    page = keyset_paginate(
+        Lacteo.objects.values(*fields), 'updated_at', request.GET.get('cursor'),
+        per_page=limit, descending=False
+    )
+    data = {
+        'results': _serialize(page),
+        'cursor': page.last_cursor,
+        'has_more': page.has_next,
+    }
+    if request.GET.get('include_ids') == '1':
+        data['ids'] = list(Lacteo.objects.order_by('id').values_list('id', flat=True))
+    return JsonResponse(data)
+
+
+@csrf_exempt
+@require_POST
+@admission_control('checkout', json=True)
+@in_user_branch
+def sale_batch(request):
+    """
+    Submit many sales at once: {"sales": [{"customer_name", "notes",
+    "sale_date", "idempotency_key", "items": [{"product_id", "quantity"}]}]}.
+
+    Sales are recorded in the user's branch; only admins and employees may
+    submit them, and a sale_date must fall within the current local day.
+    Uses the session login like the rest of the site. CSRF is not checked,
+    instead the body must be application/json, which a cross-site form
+    cannot send without a CORS preflight.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    profile = getattr(request.user, 'profile', None)
+    if not (profile and profile.is_employee()):
+        return JsonResponse({'error': 'Admin or employee role required'}, status=403)
+    if request.content_type != 'application/json':
+        return JsonResponse({'error': 'Content-Type must be application/json'}, status=415)
+    try:
+        payload = json.loads(request.body)
+        results = submit_sales(request.user, payload.get('sales') if isinstance(payload, dict) else None)
+    except ValueError:
+        return _error('Invalid JSON body')
+    except CheckoutError as exc:
+        return _error(exc)
+    except IntegrityError:
+        # Another request recorded one of these idempotency keys meanwhile
+        return JsonResponse({'error': 'Conflicting concurrent submission, retry the batch'}, status=409)
+
+    counts = {'created': 0, 'duplicate': 0, 'rejected': 0}
+    for result in results:
+        counts[result['status']] += 1
+    return JsonResponse({**counts, 'results': results})
+
+
+def _float_param(request, name, default=0.0):
+    try:
+        value = float(request.GET.get(name, default))
+    except ValueError:
+        value = None
+    if value is None or not math.isfinite(value):
+        raise ApiError(f'{name} must be a number')
+    return value
+
+
+@require_GET
+@use_replica
+def pricing_simulation(request):
+    """
+    What-if on monthly profit: ?price_change=5&cost_change=3&category=Leche&days=30.
+
+    Changes are percents; units sold stay at the recent monthly rate.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    if not (hasattr(request.user, 'profile') and request.user.profile.is_admin()):
+        return JsonResponse({'error': 'Admin role required'}, status=403)
+    try:
+        price_change = _float_param(request, 'price_change')
+        cost_change = _float_param(request, 'cost_change')
+        days = int(_float_param(request, 'days', 30))
+        top = int(_float_param(request, 'top', 10))
+    except ApiError as exc:
+        return _error(exc)
+    if not 0 < days <= SIMULATION_MAX_DAYS:
+        return _error(f'days must be between 1 and {SIMULATION_MAX_DAYS}')
+
+    result = simulate(
+        load_catalog(days),
+        price_change_pct=price_change,
+        cost_change_pct=cost_change,
+        category=request.GET.get('category') or None,
+        top=max(0, min(top, API_MAX_PAGE_SIZE)),
+    )
+    return JsonResponse(result)
+
+
+@require_GET
+def change_feed(request):
+    """
+    Writes to products, sales, sale items and price history after ?cursor,
+    oldest first: ?branch=norte&cursor=1234&limit=500&models=sale,sale_item.
+
+    Each branch has its own feed and cursors; products and price history
+    are in the main shop's feed (the default branch). Send the returned
+    cursor back next time; while has_more is true there
+    are more events right away. Needs CHANGE_FEED_TOKEN as a bearer token,
+    or an admin session. A 410 means the events after the cursor were
+    pruned and the consumer has to resync from the tables.
+    """
+    token = settings.CHANGE_FEED_TOKEN
+    integration = token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not integration:
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        if not (hasattr(request.user, 'profile') and request.user.profile.is_admin()):
+            return JsonResponse({'error': 'Admin role required'}, status=403)
+    try:
+        cursor = int(request.GET.get('cursor') or 0)
+        limit = _limit(request)
+    except ApiError as exc:
+        return _error(exc)
+    except ValueError:
+        return _error('cursor must be an integer')
+    if cursor < 0:
+        return _error('cursor must not be negative')
+    models = [name.strip() for name in request.GET.get('models', '').split(',') if name.strip()]
+    unknown = [name for name in models if name not in MODEL_NAMES]
+    if unknown:
+        return _error(f"Unknown models: {', '.join(unknown)}")
+
+    branch = request.GET.get('branch') or default_branch()
+    try:
+        with branch_scope(branch):
+            events, has_more = changes_since(cursor, limit, models)
+    except UnknownBranch as exc:
+        return _error(exc)
+    except CursorExpired as exc:
+        return JsonResponse({'error': str(exc), 'oldest': exc.oldest}, status=410)
+    return JsonResponse({
+        'branch': branch,
+        'results': events,
+        'cursor': events[-1]['id'] if events else cursor,
+        'has_more': has_more,
+    })
@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_delete
 
 
 class LacteosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'lacteos'
+
+    def ready(self):
+        # Register system checks
+        from . import checks  # noqa: F401
+        # Register background job handlers
+        from . import tasks  # noqa: F401
+        # Log writes to synced tables into the change feed
+        from . import changes
+        changes.connect()
+        # Take deleted sales off their customers' lifetime totals
+        from . import customers
+        customers.connect()
+        # Keep branch databases consistent with the shared tables
+        from django.contrib.auth.models import User
+        from . import branches
+        from .models import Customer, Lacteo
+        post_migrate.connect(branches.reserve_id_ranges, sender=self)
+        for model in (Lacteo, User, Customer):
+            pre_delete.connect(branches.enforce_on_branches, sender=model, dispatch_uid=f'branches_{model.__name__}')
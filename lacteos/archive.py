@@ -0,0 +1,162 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from . import changes
+from .dates import report_timezone
+from .models import ArchivedSale, ArchivedSaleItem, ChangeEvent, Lacteo, MonthlySalesSummary, Sale, SaleItem
+from .routers import branch_database
+
+
+SALE_FIELDS = [
+    'id', 'branch', 'sale_date', 'customer_name', 'total_amount', 'total_cost',
+    'total_profit', 'roi', 'created_by_id', 'notes',
+]
+ITEM_FIELDS = [
+    'id', 'sale_id', 'lacteo_id', 'quantity', 'unit_price',
+    'cost_price', 'subtotal', 'cost_subtotal', 'profit',
+]
+
+
+def archive_batch(cutoff, batch_size=1000):
+    """
+    Move up to batch_size of the current branch's sales older than cutoff
+    into its archive tables.
+
+    The monthly summaries are updated in the same transaction, so dashboard
+    totals (live + summaries) never double count or lose a sale.
+    Returns (sales_archived, items_archived).
+    """
+    with transaction.atomic(using=branch_database()):
+        sale_ids = list(
+            Sale.objects.filter(sale_date__lt=cutoff)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not sale_ids:
+            return 0, 0
+
+        sales = list(Sale.objects.filter(id__in=sale_ids).values(*SALE_FIELDS))
+        items = list(SaleItem.objects.filter(sale_id__in=sale_ids).values(*ITEM_FIELDS))
+        # Products live in the shared database, not next to the branch's items
+        names = dict(
+            Lacteo.objects.filter(pk__in={item['lacteo_id'] for item in items}).values_list('id', 'name')
+        )
+
+        ArchivedSale.objects.bulk_create([ArchivedSale(**sale) for sale in sales])
+        ArchivedSaleItem.objects.bulk_create([
+            ArchivedSaleItem(lacteo_name=names.get(item['lacteo_id'], ''), **item)
+            for item in items
+        ])
+
+        monthly = (
+            Sale.objects.filter(id__in=sale_ids)
+            .annotate(month=TruncMonth('sale_date', tzinfo=report_timezone()))
+            .values('month')
+            .annotate(
+                sale_count=Count('id'),
+                total_amount=Sum('total_amount'),
+                total_cost=Sum('total_cost'),
+                total_profit=Sum('total_profit'),
+                roi_sum=Sum('roi'),
+            )
+        )
+        units = dict(
+            SaleItem.objects.filter(sale_id__in=sale_ids)
+            .annotate(month=TruncMonth('sale__sale_date', tzinfo=report_timezone()))
+            .values('month')
+            .annotate(units=Sum('quantity'))
+            .values_list('month', 'units')
+        )
+        for row in monthly:
+            month = row['month'].date()
+            summary, _ = MonthlySalesSummary.objects.get_or_create(month=month)
+            MonthlySalesSummary.objects.filter(pk=summary.pk).update(
+                sale_count=F('sale_count') + row['sale_count'],
+                item_count=F('item_count') + (units.get(row['month']) or 0),
+                total_amount=F('total_amount') + row['total_amount'],
+                total_cost=F('total_cost') + row['total_cost'],
+                total_profit=F('total_profit') + row['total_profit'],
+                roi_sum=F('roi_sum') + row['roi_sum'],
+            )
+
+        # Logged as archived rather than deleted. _raw_delete skips the per-row
+        # delete signals, which would load every row and log it as deleted.
+        changes.record_removed(SaleItem, [item['id'] for item in items], ChangeEvent.ARCHIVE)
+        changes.record_removed(Sale, sale_ids, ChangeEvent.ARCHIVE)
+        item_rows = SaleItem.objects.filter(sale_id__in=sale_ids)
+        item_rows._raw_delete(item_rows.db)
+        sale_rows = Sale.objects.filter(id__in=sale_ids)
+        sale_rows._raw_delete(sale_rows.db)
+        return len(sales), len(items)
+
+
+def sales_totals(include_archive=True):
+    """Count and money totals over the current branch's live sales, plus archived months if asked"""
+    live = Sale.objects.aggregate(
+        count=Count('id'),
+        revenue=Sum('total_amount'),
+        cost=Sum('total_cost'),
+        profit=Sum('total_profit'),
+        roi_sum=Sum('roi'),
+    )
+    totals = {key: live[key] or 0 for key in live}
+    if include_archive:
+        archived = MonthlySalesSummary.objects.aggregate(
+            count=Sum('sale_count'),
+            revenue=Sum('total_amount'),
+            cost=Sum('total_cost'),
+            profit=Sum('total_profit'),
+            roi_sum=Sum('roi_sum'),
+        )
+        for key in totals:
+            totals[key] += archived[key] or 0
+    for key in ('revenue', 'cost', 'profit', 'roi_sum'):
+        totals[key] = Decimal(totals[key])
+    return totals
+
+
+def product_totals(include_archive=False):
+    """
+    {product name: units, revenue and profit} sold in the current branch,
+    optionally including archived items (a larger scan).
+    """
+    totals = defaultdict(lambda: {'total_quantity': 0, 'total_revenue': Decimal('0'), 'total_profit': Decimal('0')})
+    live = list(
+        SaleItem.objects.values('lacteo_id').annotate(
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum('subtotal'),
+            total_profit=Sum('profit')
+        ).order_by()
+    )
+    names = dict(Lacteo.objects.filter(pk__in=[row['lacteo_id'] for row in live]).values_list('id', 'name'))
+    sources = [(names.get(row['lacteo_id'], ''), row) for row in live]
+    if include_archive:
+        archived = ArchivedSaleItem.objects.values(name=F('lacteo_name')).annotate(
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum('subtotal'),
+            total_profit=Sum('profit')
+        ).order_by()
+        sources += [(row['name'], row) for row in archived]
+    for name, source in sources:
+        entry = totals[name]
+        entry['total_quantity'] += source['total_quantity']
+        entry['total_revenue'] += source['total_revenue']
+        entry['total_profit'] += source['total_profit']
+    return dict(totals)
+
+
+def top_selling_products(branch_totals, limit=10):
+    """Best selling products by units, from the product_totals() of one or more branches"""
+    merged = defaultdict(lambda: {'total_quantity': 0, 'total_revenue': Decimal('0'), 'total_profit': Decimal('0')})
+    for totals in branch_totals:
+        for name, values in totals.items():
+            entry = merged[name]
+            for key in entry:
+                entry[key] += values[key]
+    result = [{'lacteo__name': name, **values} for name, values in merged.items()]
+    result.sort(key=lambda row: row['total_quantity'], reverse=True)
+    return result[:limit]
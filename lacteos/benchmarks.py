@@ -0,0 +1,34 @@
+"""
+Throwaway databases for the bench_* commands.
+
+The benchmarks log users in and check out like real clients. They run
+against test databases created the way Django's test runner creates them,
+so their users, sales, change events and jobs never reach the live ones.
+SQLite test databases are files in a temporary directory rather than in
+memory: concurrent clients then wait on the write lock as they do in
+production.
+"""
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+
+@contextmanager
+def test_databases():
+    """Point every database at a fresh, migrated copy for the duration of the block"""
+    with tempfile.TemporaryDirectory(prefix='lacteos-bench-') as directory:
+        for alias in connections:
+            settings_dict = connections[alias].settings_dict
+            if settings_dict['ENGINE'] == 'django.db.backends.sqlite3' and not settings_dict['TEST'].get('MIRROR'):
+                settings_dict['TEST']['NAME'] = f'{directory}/{alias}.sqlite3'
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, aliases=set(connections))
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
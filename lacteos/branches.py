@@ -0,0 +1,155 @@
+"""
+Reading and maintaining sales spread over one database per branch.
+
+BranchRouter sends a branch's sales to its own database (BRANCH_DATABASES),
+so checkouts at different shops write to different files in parallel.
+Reports call fan_out(), which runs the same query function once per branch
+from a small thread pool and returns the per-branch results to merge.
+
+Sale and sale item ids stay unique across branches: each branch database
+numbers its rows from position * BRANCH_ID_SPAN, so an id also tells which
+branch holds the sale.
+"""
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, connections
+from django.db.models import PROTECT, SET_NULL, ProtectedError
+
+from .routers import branch_databases, branch_scope, default_branch, is_sharded
+
+
+logger = logging.getLogger(__name__)
+
+BRANCH_ID_SPAN = 10 ** 12
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def branches():
+    """Branch codes, the main shop first"""
+    return list(branch_databases())
+
+
+def user_branch(user):
+    """Branch whose database records the user's checkouts"""
+    profile = getattr(user, 'profile', None) if user.is_authenticated else None
+    branch = profile.branch if profile is not None else ''
+    if branch and branch not in branch_databases():
+        logger.warning('User %s belongs to unknown branch %r, using %s', user.pk, branch, default_branch())
+        branch = ''
+    return branch or default_branch()
+
+
+def branch_of_sale(sale_id):
+    """Branch holding the sale (or sale item) with this id, None if out of range"""
+    names = branches()
+    position = int(sale_id) // BRANCH_ID_SPAN
+    return names[position] if 0 <= position < len(names) else None
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=len(branches()), thread_name_prefix='lacteos-branch')
+        return _pool
+
+
+def _run_in_branch(branch, function):
+    try:
+        with branch_scope(branch):
+            return function()
+    finally:
+        # Worker threads have their own connections, close them like a request would
+        close_old_connections()
+
+
+def fan_out(function, only=None):
+    """
+    {branch: function()} with function run inside each branch's scope.
+
+    Branches are queried concurrently, each thread with its own database
+    connection; a single branch runs inline.
+    """
+    names = list(only or branches())
+    if len(names) == 1:
+        with branch_scope(names[0]):
+            return {names[0]: function()}
+    futures = {
+        branch: _executor().submit(contextvars.copy_context().run, _run_in_branch, branch, function)
+        for branch in names
+    }
+    return {branch: future.result() for branch, future in futures.items()}
+
+
+def reserve_id_ranges(using, **kwargs):
+    """post_migrate: start a branch database's sale and item ids at its range"""
+    from .models import Sale, SaleItem
+
+    names = [branch for branch, alias in branch_databases().items() if alias == using]
+    if not names:
+        return
+    floor = branches().index(names[0]) * BRANCH_ID_SPAN
+    if not floor:
+        return
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for model in (Sale, SaleItem):
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, floor])
+                elif row[0] < floor:
+                    cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [floor, table])
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(table)})))",
+                    [table, floor],
+                )
+            else:
+                logger.warning('Cannot reserve the id range of %s on %s', table, connection.vendor)
+
+
+def enforce_on_branches(sender, instance, using, **kwargs):
+    """
+    pre_delete for shared rows (products, users, customers): apply the
+    PROTECT and SET_NULL rules of branch rows in the other branch databases,
+    which Django's delete collector does not look at.
+    """
+    from . import changes
+
+    others = [alias for alias in set(branch_databases().values()) if alias != using]
+    relations = [
+        relation for relation in sender._meta.related_objects
+        if is_sharded(relation.related_model) and relation.on_delete in (PROTECT, SET_NULL)
+    ]
+    for alias in others:
+        for relation in relations:
+            if relation.on_delete is not PROTECT:
+                continue
+            rows = relation.related_model._base_manager.using(alias).filter(**{relation.field.name: instance})
+            protected = list(rows[:1])
+            if protected:
+                raise ProtectedError(
+                    f'Cannot delete {instance} because branch sales still reference it',
+                    set(protected),
+                )
+    for alias in others:
+        for relation in relations:
+            if relation.on_delete is not SET_NULL:
+                continue
+            model = relation.related_model
+            rows = model._base_manager.using(alias).filter(**{relation.field.name: instance})
+            ids = list(rows.values_list('pk', flat=True))
+            if not ids:
+                continue
+            rows.update(**{relation.field.name: None})
+            if model in changes.TRACKED:
+                changes.record_rows(model, ids, using=alias)
@@ -0,0 +1,164 @@
+"""
+Change-data feed for Lacteo, Sale, SaleItem and PriceHistory.
+
+Every write to those tables appends a ChangeEvent in the same transaction,
+holding the row as it was after the write. The event id is a monotonic
+sequence number, so a consumer only asks for the events after the last id
+it processed instead of re-reading whole tables.
+
+Single-object saves and deletes are logged by signal receivers (connected
+in LacteosConfig.ready); callers save inside transaction.atomic so the row
+and its event commit together. Paths that skip signals (bulk_create,
+QuerySet.update, the archive) call record() or record_rows() themselves.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Max, Min, SET_NULL
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.utils import timezone
+
+from .models import ChangeEvent, Customer, Lacteo, PriceHistory, Sale, SaleItem
+
+
+TRACKED = {
+    Lacteo: 'lacteo',
+    Sale: 'sale',
+    SaleItem: 'sale_item',
+    PriceHistory: 'price_history',
+}
+MODEL_NAMES = set(TRACKED.values())
+RELOAD_CHUNK = 500
+
+
+class CursorExpired(Exception):
+    """The events after this cursor were pruned, the consumer must resync"""
+
+    def __init__(self, oldest):
+        super().__init__(f'Events up to {oldest - 1} were pruned, resync from the tables')
+        self.oldest = oldest
+
+
+def snapshot(obj):
+    """Column values of obj, keyed by attname (lacteo_id, not lacteo)"""
+    data = {}
+    for field in obj._meta.concrete_fields:
+        value = getattr(obj, field.attname)
+        if isinstance(value, FieldFile):
+            value = value.name or None
+        data[field.attname] = value
+    return data
+
+
+def record(objects, operation):
+    """Log saved instances of tracked models, one INSERT per database they are in"""
+    events = {}
+    for obj in objects:
+        events.setdefault(obj._state.db, []).append(
+            ChangeEvent(model=TRACKED[type(obj)], object_id=obj.pk, operation=operation, data=snapshot(obj))
+        )
+    # Each branch database keeps the events of its own rows
+    for database, batch in events.items():
+        ChangeEvent.objects.using(database).bulk_create(batch)
+
+
+def record_rows(model, ids, operation=ChangeEvent.UPDATE, using=None):
+    """Log rows changed by QuerySet.update(), reading them back in chunks"""
+    ids = list(ids)
+    rows = model._base_manager.using(using)
+    for start in range(0, len(ids), RELOAD_CHUNK):
+        record(rows.filter(pk__in=ids[start:start + RELOAD_CHUNK]).order_by('pk'), operation)
+
+
+def record_removed(model, ids, operation=ChangeEvent.DELETE, using=None):
+    """Log rows that no longer exist in the live table"""
+    ChangeEvent.objects.using(using).bulk_create([
+        ChangeEvent(model=TRACKED[model], object_id=pk, operation=operation) for pk in ids
+    ])
+
+
+def changes_since(cursor=0, limit=500, models=None, settle_seconds=None):
+    """
+    Up to limit events after cursor, oldest first.
+
+    A cursor of 0 starts at the oldest event kept. Any other cursor raises
+    CursorExpired when the events right after it were already pruned. Events
+    younger than CHANGE_FEED_SETTLE_SECONDS are held back, together
+    with everything after them, so an id still uncommitted on a concurrent
+    database is not skipped.
+    """
+    if settle_seconds is None:
+        settle_seconds = settings.CHANGE_FEED_SETTLE_SECONDS
+    oldest = ChangeEvent.objects.aggregate(oldest=Min('id'))['oldest']
+    if oldest is not None and 0 < cursor < oldest - 1:
+        raise CursorExpired(oldest)
+
+    events = ChangeEvent.objects.filter(pk__gt=cursor).order_by('pk')
+    if models:
+        events = events.filter(model__in=models)
+    events = list(events.values('id', 'model', 'object_id', 'operation', 'created_at', 'data')[:limit + 1])
+    if settle_seconds:
+        settled = timezone.now() - timedelta(seconds=settle_seconds)
+        for index, event in enumerate(events):
+            if event['created_at'] > settled:
+                events = events[:index]
+                break
+    return events[:limit], len(events) > limit
+
+
+
+def prune_batch(before, batch_size=5000):
+    """
+    Delete up to batch_size of the oldest events created before before.
+
+    Deletes a range of ids from the start of the log, so the events kept
+    always follow each other and an expired cursor can be told apart.
+    Returns the number deleted.
+    """
+    bounds = ChangeEvent.objects.filter(created_at__lt=before).aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return 0
+    upto = min(bounds['last'], bounds['first'] + batch_size - 1)
+    deleted, _ = ChangeEvent.objects.filter(pk__lte=upto).delete()
+    return deleted
+
+
+def retention_cutoff(days=None):
+    if days is None:
+        days = settings.CHANGE_FEED_RETENTION_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def _saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        record([instance], ChangeEvent.CREATE if created else ChangeEvent.UPDATE)
+
+
+def _deleted(sender, instance, using, **kwargs):
+    record_removed(sender, [instance.pk], using=using)
+
+
+def _detaching(sender, instance, using, **kwargs):
+    """
+    Deleting a user or customer sets Sale/PriceHistory references to NULL
+    with a bulk UPDATE that sends no post_save; log those rows as updated.
+    """
+    for relation in sender._meta.related_objects:
+        model = relation.related_model
+        if model not in TRACKED or relation.on_delete is not SET_NULL:
+            continue
+        column = relation.field.attname
+        rows = list(model._base_manager.using(using).filter(**{relation.field.name: instance}))
+        for row in rows:
+            setattr(row, column, None)
+        record(rows, ChangeEvent.UPDATE)
+
+
+def connect():
+    for model in TRACKED:
+        post_save.connect(_saved, sender=model, dispatch_uid=f'changes_saved_{model.__name__}')
+        post_delete.connect(_deleted, sender=model, dispatch_uid=f'changes_deleted_{model.__name__}')
+    for model in (User, Customer):
+        pre_delete.connect(_detaching, sender=model, dispatch_uid=f'changes_detaching_{model.__name__}')
@@ -0,0 +1,268 @@
+from datetime import timedelta
+from decimal import Decimal
+from hashlib import sha1
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import changes, metrics
+from .customers import customers_for_names, record_sales
+from .dates import day_start, local_today
+from .inventory import sale_movements
+from .models import ChangeEvent, Lacteo, Sale, SaleItem, StockMovement
+from .routers import branch_database
+
+
+CENTS = Decimal('0.01')
+MAX_BATCH_SALES = 500
+MAX_CUSTOMER_NAME = Sale._meta.get_field('customer_name').max_length
+MAX_IDEMPOTENCY_KEY = Sale._meta.get_field('idempotency_key').max_length
+IDEMPOTENCY_CACHE_TIMEOUT = 24 * 60 * 60
+# Terminal clocks may run a little ahead of the server's
+SALE_DATE_SKEW = timedelta(minutes=5)
+
+
+class CheckoutError(Exception):
+    pass
+
+
+def unit_cost(lacteo):
+    """Cost recorded on a sale item, estimated at 60% of price when unknown"""
+    return lacteo.cost_price if lacteo.cost_price > 0 else lacteo.price * Decimal('0.6')
+
+
+def clean_idempotency_key(value):
+    """Normalize a client supplied idempotency key, None when absent"""
+    value = str(value or '').strip()
+    if not value:
+        return None
+    if len(value) > MAX_IDEMPOTENCY_KEY:
+        raise CheckoutError(f'Idempotency key is longer than {MAX_IDEMPOTENCY_KEY} characters')
+    return value
+
+
+def _idempotency_cache_key(key):
+    return 'lacteos:idempotency:' + sha1(key.encode()).hexdigest()
+
+
+def find_idempotent_sale(key):
+    """(sale_id, created_by_id) of the sale already recorded under key, or None"""
+    found = cache.get(_idempotency_cache_key(key))
+    if found is None:
+        found = Sale.objects.filter(idempotency_key=key).values_list('id', 'created_by_id').first()
+        if found is not None:
+            remember_idempotent_sale(key, *found)
+    return found
+
+
+def remember_idempotent_sale(key, sale_id, created_by_id):
+    """Keep the outcome of a keyed checkout around so retries skip the database"""
+    cache.set(_idempotency_cache_key(key), (sale_id, created_by_id), IDEMPOTENCY_CACHE_TIMEOUT)
+
+
+def _parse_sale(data):
+    """Validate one sale of a batch, return (fields, [(product_id, qty)], errors)"""
+    errors = []
+    if not isinstance(data, dict):
+        return None, [], ['Each sale must be an object']
+
+    customer_name = str(data.get('customer_name') or '')
+    if len(customer_name) > MAX_CUSTOMER_NAME:
+        errors.append(f'customer_name is longer than {MAX_CUSTOMER_NAME} characters')
+
+    sale_date = timezone.now()
+    if data.get('sale_date'):
+        sale_date = parse_datetime(str(data['sale_date']))
+        if sale_date is None:
+            errors.append('sale_date must be an ISO 8601 datetime')
+        else:
+            if timezone.is_naive(sale_date):
+                sale_date = timezone.make_aware(sale_date)
+            # Offline terminals may send today's earlier sales, never ones in closed days
+            now = timezone.now()
+            if sale_date > now + SALE_DATE_SKEW:
+                errors.append('sale_date cannot be in the future')
+            elif sale_date < day_start(local_today()):
+                errors.append('sale_date must be today')
+            else:
+                sale_date = min(sale_date, now)
+
+    lines = []
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        errors.append('items must be a non-empty list')
+        items = []
+    for position, item in enumerate(items):
+        try:
+            product_id = int(item['product_id'])
+            quantity = int(item['quantity'])
+        except (KeyError, TypeError, ValueError):
+            errors.append(f'items[{position}] needs integer product_id and quantity')
+            continue
+        if quantity <= 0:
+            errors.append(f'items[{position}] quantity must be positive')
+            continue
+        lines.append((product_id, quantity))
+
+    idempotency_key = None
+    try:
+        idempotency_key = clean_idempotency_key(data.get('idempotency_key'))
+    except CheckoutError as exc:
+        errors.append(str(exc))
+
+    fields = {
+        'customer_name': customer_name,
+        'notes': str(data.get('notes') or ''),
+        'sale_date': sale_date,
+        'idempotency_key': idempotency_key,
+    }
+    return fields, lines, errors
+
+
+def submit_sales(user, sales_data):
+    """
+    Record a batch of sales from a POS terminal in one transaction.
+
+    Sales and items go to the current branch's database, stock and customer
+    totals to the shared one; the branch transaction commits first.
+
+    All products are loaded in a single query, stock is checked in memory as
+    the batch is walked, and sales, items, stock changes and stock movements
+    are written with one bulk insert/update each. A sale that fails validation is rejected
+    without affecting the others. A sale whose idempotency_key was already
+    recorded is not created again, its result points at the original sale.
+    Returns one result dict per input sale.
+    """
+    if not isinstance(sales_data, list) or not sales_data:
+        raise CheckoutError('sales must be a non-empty list')
+    if len(sales_data) > MAX_BATCH_SALES:
+        raise CheckoutError(f'At most {MAX_BATCH_SALES} sales per request')
+
+    parsed = [_parse_sale(data) for data in sales_data]
+    product_ids = {product_id for _, lines, _ in parsed for product_id, _ in lines}
+    keys = {fields['idempotency_key'] for fields, _, _ in parsed if fields and fields['idempotency_key']}
+
+    with transaction.atomic(), transaction.atomic(using=branch_database(), savepoint=False):
+        products = Lacteo.objects.select_for_update().in_bulk(product_ids)
+        remaining = {pk: product.stock for pk, product in products.items()}
+        recorded = {
+            key: (sale_id, created_by_id)
+            for key, sale_id, created_by_id in Sale.objects.filter(idempotency_key__in=keys)
+            .values_list('idempotency_key', 'id', 'created_by_id')
+        }
+
+        results = []
+        accepted = []
+        seen = {}
+        repeats = []
+        for index, (fields, lines, errors) in enumerate(parsed):
+            key = fields['idempotency_key'] if fields else None
+            if key in recorded:
+                sale_id, created_by_id = recorded[key]
+                if created_by_id == user.pk:
+                    results.append({'index': index, 'status': 'duplicate', 'sale_id': sale_id})
+                else:
+                    results.append({'index': index, 'status': 'rejected', 'errors': ['idempotency_key already used']})
+                continue
+            if key in seen:
+                # Same key twice in one batch, answer with the first one's sale
+                result = {'index': index, 'status': 'duplicate'}
+                results.append(result)
+                repeats.append((result, seen[key]))
+                continue
+
+            errors = list(errors)
+            wanted = {}
+            for product_id, quantity in lines:
+                if product_id not in products:
+                    errors.append(f'Product {product_id} does not exist')
+                else:
+                    wanted[product_id] = wanted.get(product_id, 0) + quantity
+            for product_id, quantity in wanted.items():
+                if quantity > remaining[product_id]:
+                    metrics.inc('lacteos_checkout_stock_rejections_total', ('batch',))
+                    product = products[product_id]
+                    errors.append(f'Only {remaining[product_id]} units available for {product.name}')
+            if errors:
+                results.append({'index': index, 'status': 'rejected', 'errors': errors})
+                continue
+
+            for product_id, quantity in wanted.items():
+                remaining[product_id] -= quantity
+            items = []
+            for product_id, quantity in lines:
+                product = products[product_id]
+                item = SaleItem(
+                    lacteo=product,
+                    quantity=quantity,
+                    unit_price=product.price,
+                    cost_price=unit_cost(product).quantize(CENTS),
+                )
+                # SaleItem.save() is bypassed by bulk_create, mirror its math
+                item.subtotal = (item.quantity * item.unit_price).quantize(CENTS)
+                item.cost_subtotal = (item.quantity * item.cost_price).quantize(CENTS)
+                item.profit = item.subtotal - item.cost_subtotal
+                items.append(item)
+
+            total_amount = sum(item.subtotal for item in items)
+            total_cost = sum(item.cost_subtotal for item in items)
+            total_profit = total_amount - total_cost
+            roi = (total_profit / total_cost * 100).quantize(CENTS) if total_cost > 0 else Decimal('0')
+            sale = Sale(
+                created_by=user,
+                total_amount=total_amount,
+                total_cost=total_cost,
+                total_profit=total_profit,
+                roi=roi,
+                checkout=True,
+                **fields
+            )
+            result = {'index': index, 'status': 'created'}
+            results.append(result)
+            accepted.append((sale, items, result))
+            if key:
+                seen[key] = result
+
+        if accepted:
+            customers = customers_for_names({sale.customer_name for sale, _, _ in accepted})
+            for sale, _, _ in accepted:
+                sale.customer = customers.get(sale.customer_name)
+            Sale.objects.bulk_create([sale for sale, _, _ in accepted])
+            sale_items = []
+            for sale, items, result in accepted:
+                for item in items:
+                    item.sale = sale
+                sale_items.extend(items)
+                result['sale_id'] = sale.pk
+                result['total_amount'] = str(sale.total_amount)
+            SaleItem.objects.bulk_create(sale_items)
+            record_sales([sale for sale, _, _ in accepted])
+            changes.record([sale for sale, _, _ in accepted] + sale_items, ChangeEvent.CREATE)
+            for result, original in repeats:
+                result['sale_id'] = original['sale_id']
+
+            sold = {pk: products[pk].stock - stock for pk, stock in remaining.items() if stock != products[pk].stock}
+            Lacteo.objects.filter(pk__in=sold).update(
+                stock=Case(*[When(pk=pk, then=F('stock') - qty) for pk, qty in sold.items()]),
+                updated_at=timezone.now(),
+            )
+            changes.record_rows(Lacteo, sold)
+            movements = []
+            for sale, items, _ in accepted:
+                quantities = {}
+                for item in items:
+                    quantities[item.lacteo_id] = quantities.get(item.lacteo_id, 0) + item.quantity
+                movements.extend(sale_movements(sale.pk, quantities, user))
+            StockMovement.objects.bulk_create(movements)
+
+            def remember():
+                metrics.inc('lacteos_sales_created_total', ('batch',), len(accepted))
+                for sale, _, _ in accepted:
+                    if sale.idempotency_key:
+                        remember_idempotent_sale(sale.idempotency_key, sale.pk, user.pk)
+            transaction.on_commit(remember)
+
+    return results
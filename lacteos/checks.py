@@ -0,0 +1,30 @@
+"""
+System checks for settings that only go wrong with several worker processes.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+# Cache backends whose entries live in one process only
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_session_cache(app_configs, **kwargs):
+    """cached_db sessions must be cached where every worker sees a logout"""
+    if settings.SESSION_ENGINE != 'django.contrib.sessions.backends.cached_db':
+        return []
+    backend = settings.CACHES.get(settings.SESSION_CACHE_ALIAS, {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f'SESSION_MODE=cached_db with a per-process cache ({backend}).',
+        hint=(
+            'A logout or flush only clears the session from one worker\'s cache. '
+            'Configure a shared cache (Redis, Memcached) or use SESSION_MODE=db.'
+        ),
+        id='lacteos.E001',
+    )]
@@ -0,0 +1,147 @@
+"""
+Customer lookup and lifetime statistics.
+
+Checkout resolves the free-text customer name to a Customer through its
+normalized key (a unique index), and adds each sale to the customer's
+running totals with a single UPDATE, the web checkout from a background
+job. Reports read those totals directly instead of grouping the sales
+table by name.
+
+Totals are only ever adjusted, never recomputed: reconciled sales add the
+change in their totals (adjust_totals) and deleted sales take theirs off
+(a post_delete receiver connected in LacteosConfig.ready). First and last
+purchase dates are not moved back by a delete; backfill_customers
+recomputes everything from scratch.
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.db.models.signals import post_delete
+
+from .jobs import enqueue
+from .models import Customer, Sale
+
+
+MAX_KEY_LENGTH = Customer._meta.get_field('key').max_length
+_SPACE_RE = re.compile(r'\s+')
+
+
+def customer_key(name):
+    """Lowercase, accent-free, single-spaced form of name; '' when blank"""
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return _SPACE_RE.sub(' ', stripped).strip().casefold()[:MAX_KEY_LENGTH]
+
+
+def display_name(name):
+    return _SPACE_RE.sub(' ', name).strip()[:MAX_KEY_LENGTH]
+
+
+def customer_for_name(name):
+    """The Customer for a checkout name, created on first use; None for a blank name"""
+    key = customer_key(name)
+    if not key:
+        return None
+    customer, _ = Customer.objects.get_or_create(key=key, defaults={'name': display_name(name)})
+    return customer
+
+
+def customers_for_names(names):
+    """
+    {name: Customer} for many checkout names, with one lookup and one insert.
+
+    New customers are named after the first of their spellings in names.
+    """
+    keys = {name: customer_key(name) for name in names}
+    wanted = {key for key in keys.values() if key}
+    if not wanted:
+        return {}
+    found = Customer.objects.in_bulk(wanted, field_name='key')
+    missing = {}
+    for name, key in keys.items():
+        if key in wanted and key not in found:
+            missing.setdefault(key, Customer(key=key, name=display_name(name)))
+    if missing:
+        # Rows another request inserted meanwhile are skipped, then read back
+        Customer.objects.bulk_create(missing.values(), ignore_conflicts=True)
+        found.update(Customer.objects.in_bulk(list(missing), field_name='key'))
+    return {name: found[key] for name, key in keys.items() if key}
+
+
+def record_sales(sales):
+    """Add saved sales to their customers' lifetime totals, one UPDATE per customer"""
+    totals = {}
+    for sale in sales:
+        if sale.customer_id is None:
+            continue
+        entry = totals.setdefault(sale.customer_id, [0, 0, 0, sale.sale_date, sale.sale_date])
+        entry[0] += 1
+        entry[1] += sale.total_amount
+        entry[2] += sale.total_profit
+        entry[3] = min(entry[3], sale.sale_date)
+        entry[4] = max(entry[4], sale.sale_date)
+    for customer_id, (orders, amount, profit, first, last) in totals.items():
+        Customer.objects.filter(pk=customer_id).update(
+            order_count=F('order_count') + orders,
+            lifetime_revenue=F('lifetime_revenue') + amount,
+            lifetime_profit=F('lifetime_profit') + profit,
+            first_purchase=Coalesce(Least('first_purchase', Value(first)), Value(first)),
+            last_purchase=Coalesce(Greatest('last_purchase', Value(last)), Value(last)),
+        )
+
+
+def record_sales_later(sales):
+    """
+    Queue record_sales() for saved sales as background jobs. The job carries
+    the totals, so it adds what the sale was worth when it was queued.
+    """
+    for sale in sales:
+        if sale.customer_id is not None:
+            enqueue('customers.record_sale', {
+                'customer_id': sale.customer_id,
+                'total_amount': str(sale.total_amount),
+                'total_profit': str(sale.total_profit),
+                'sale_date': sale.sale_date.isoformat(),
+            })
+
+
+
+def adjust_totals(differences):
+    """Add {customer id: (orders, revenue, profit)} differences to lifetime totals"""
+    for customer_id, (orders, revenue, profit) in differences.items():
+        if orders or revenue or profit:
+            Customer.objects.filter(pk=customer_id).update(
+                order_count=F('order_count') + orders,
+                lifetime_revenue=F('lifetime_revenue') + revenue,
+                lifetime_profit=F('lifetime_profit') + profit,
+            )
+
+
+def total_changes(before, after):
+    """
+    adjust_totals() differences between two {sale id: (customer id, amount,
+    profit)} readings of the same sales.
+    """
+    differences = {}
+    for readings, sign in ((before, -1), (after, 1)):
+        for customer_id, amount, profit in readings.values():
+            if customer_id is None:
+                continue
+            _, revenue, earned = differences.get(customer_id, (0, 0, 0))
+            differences[customer_id] = (0, revenue + sign * amount, earned + sign * profit)
+    return differences
+
+
+def _sale_deleted(sender, instance, using, **kwargs):
+    if instance.customer_id is None:
+        return
+    differences = {instance.customer_id: (-1, -instance.total_amount, -instance.total_profit)}
+    # Only once the sale is really gone from its branch database
+    transaction.on_commit(lambda: adjust_totals(differences), using=using)
+
+
+def connect():
+    post_delete.connect(_sale_deleted, sender=Sale, dispatch_uid='customers_sale_deleted')
@@ -0,0 +1,40 @@
+"""
+Calendar days as staff see them, turned into index-friendly filters.
+
+Reports count a sale on the day it happened in REPORT_TIME_ZONE (the shop's
+America/Lima), not in UTC. A day or span of days becomes a half-open
+[start, end) range of aware datetimes, so filters compare the raw sale_date
+column and use its index. A __date lookup wraps the column in a function
+and buckets in UTC instead.
+"""
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+
+def report_timezone():
+    return ZoneInfo(getattr(settings, 'REPORT_TIME_ZONE', 'America/Lima'))
+
+
+def local_today():
+    """Today's date in the report time zone"""
+    return timezone.localdate(timezone=report_timezone())
+
+
+def day_start(day):
+    """Aware datetime of local midnight at the start of day"""
+    return datetime.combine(day, time.min, tzinfo=report_timezone())
+
+
+def day_range(first_day, last_day=None):
+    """(start, end) covering first_day to last_day inclusive, end excluded"""
+    return day_start(first_day), day_start((last_day or first_day) + timedelta(days=1))
+
+
+def in_days(field, first_day, last_day=None):
+    """Q matching field within the local days first_day to last_day inclusive"""
+    start, end = day_range(first_day, last_day)
+    return Q(**{f'{field}__gte': start, f'{field}__lt': end})
@@ -1,6 +1,11 @@
 from functools import wraps
-from django.shortcuts import redirect
+from django.http import JsonResponse
+from django.shortcuts import redirect, render
 from django.contrib import messages
+from .admission import Rejected, admit, client_identity
+from .middleware import REPLICA_STICKY_COOKIE
+from .branches import user_branch
+from .routers import branch_scope, replica_reads
 
 
 def admin_or_employee_required(view_func):
@@ -44,3 +49,51 @@ def admin_required(view_func):
         return view_func(request, *args, **kwargs)
     return _wrapped_view
 
+
+def use_replica(view_func):
+    """Decorator to serve a read-only reporting view from the replica database"""
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        # Recent writers read from the primary so they see their own changes
+        if REPLICA_STICKY_COOKIE in request.COOKIES:
+            return view_func(request, *args, **kwargs)
+
+        with replica_reads():
+            return view_func(request, *args, **kwargs)
+    return _wrapped_view
+
+
+def in_user_branch(view_func):
+    """Decorator to record the view's sales in the database of the user's branch"""
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        with branch_scope(user_branch(request.user)):
+            return view_func(request, *args, **kwargs)
+    return _wrapped_view
+
+
+def admission_control(scope, json=False):
+    """
+    Decorator to turn POSTs away with a 429 when the scope's rate or
+    concurrency limits are reached (see lacteos.admission). Other methods
+    are not limited.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method != 'POST':
+                return view_func(request, *args, **kwargs)
+            try:
+                with admit(scope, client_identity(request)):
+                    return view_func(request, *args, **kwargs)
+            except Rejected as e:
+                if json:
+                    response = JsonResponse(
+                        {'error': 'Too many requests, retry later', 'retry_after': e.retry_after}, status=429,
+                    )
+                else:
+                    response = render(request, 'retry_later.html', {'retry_after': e.retry_after}, status=429)
+                response['Retry-After'] = str(e.retry_after)
+                return response
+        return _wrapped_view
+    return decorator
@@ -0,0 +1,178 @@
+"""
+Demand forecasts and reorder suggestions for the whole catalog.
+
+Daily units per product come from one grouped SaleItem query per branch
+and are laid out as a products x days matrix. Every step of the model is an array
+operation over all products at once:
+
+- a trailing 7 day moving average, which cancels the weekday pattern;
+- simple exponential smoothing of that average, written as a dot product
+  with the smoothing weights instead of a loop over days;
+- day-of-week factors from the last few weeks, shrunk towards 1 for
+  products with little history, to shape the forecast of each day;
+- the spread of recent days around that forecast, for safety stock.
+
+Results are cached per local day under a watermark of the newest sale id
+of each branch and the newest stock movement, two index seeks: a sale or
+restock gives the next dashboard load fresh suggestions, and until then
+every load reuses them.
+"""
+import math
+from datetime import timedelta
+from hashlib import sha1
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Max, Sum
+from django.db.models.functions import TruncDate
+
+from .branches import fan_out
+from .dates import in_days, local_today, report_timezone
+from .models import Lacteo, Sale, SaleItem, StockMovement
+
+
+HISTORY_DAYS = 180
+SMOOTHING = 0.1
+SEASON_WEEKS = 8
+# Units of history at which a product's weekday pattern gets half weight
+SEASON_SHRINK_UNITS = 20
+RESIDUAL_DAYS = 28
+LEAD_TIME_DAYS = 2
+COVERAGE_DAYS = 7
+SERVICE_Z = 1.65
+FORECAST_CACHE_TIMEOUT = 60 * 60
+
+
+def daily_units(product_ids, start, days):
+    """products x days matrix of units sold in all branches, day 0 being start"""
+    per_branch = fan_out(lambda: list(
+        SaleItem.objects.filter(in_days('sale__sale_date', start, start + timedelta(days=days - 1)))
+        .annotate(day=TruncDate('sale__sale_date', tzinfo=report_timezone()))
+        .values('lacteo_id', 'day')
+        .annotate(units=Sum('quantity'))
+        .order_by()
+        .values_list('lacteo_id', 'day', 'units')
+    ))
+    # np.add.at below sums the rows of different branches for the same day
+    rows = [row for branch_rows in per_branch.values() for row in branch_rows]
+    matrix = np.zeros((len(product_ids), days), dtype=np.float64)
+    if not rows:
+        return matrix
+    lacteo_ids, sale_days, units = zip(*rows)
+    lacteo_ids = np.array(lacteo_ids, dtype=np.int64)
+    rows_index = np.searchsorted(product_ids, lacteo_ids)
+    day_index = (np.array(sale_days, dtype='datetime64[D]') - np.datetime64(start, 'D')).astype(np.int64)
+    # Skip products created after product_ids was read
+    rows_index = np.minimum(rows_index, len(product_ids) - 1)
+    known = product_ids[rows_index] == lacteo_ids
+    np.add.at(matrix, (rows_index[known], day_index[known]), np.array(units, dtype=np.float64)[known])
+    return matrix
+
+
+def weekday_factors(daily, weekdays):
+    """Per product demand of each weekday relative to its average day"""
+    recent = daily[:, -SEASON_WEEKS * 7:]
+    recent_weekdays = weekdays[-SEASON_WEEKS * 7:]
+    by_weekday = np.stack(
+        [recent[:, recent_weekdays == day].mean(axis=1) for day in range(7)], axis=1
+    )
+    average = by_weekday.mean(axis=1, keepdims=True)
+    factors = np.divide(by_weekday, average, out=np.ones_like(by_weekday), where=average > 0)
+    volume = recent.sum(axis=1, keepdims=True)
+    weight = volume / (volume + SEASON_SHRINK_UNITS)
+    return 1 + (factors - 1) * weight
+
+
+def weekly_average(daily):
+    """Mean of each day and the 6 before it; the first 6 days are dropped"""
+    totals = np.concatenate([np.zeros((daily.shape[0], 1)), daily.cumsum(axis=1)], axis=1)
+    return (totals[:, 7:] - totals[:, :-7]) / 7
+
+
+def smoothed_level(series, alpha=SMOOTHING):
+    """Last level of simple exponential smoothing of each row"""
+    days = series.shape[1]
+    weights = alpha * (1 - alpha) ** np.arange(days - 1, -1, -1)
+    return series @ weights + (1 - alpha) ** days * series[:, 0]
+
+
+def forecast(history_days=HISTORY_DAYS, lead_time=LEAD_TIME_DAYS, coverage=COVERAGE_DAYS):
+    """
+    Expected daily demand and a reorder suggestion for every product.
+
+    An order placed today arrives after lead_time days and has to last
+    another coverage days. Stock is only counted for the demand expected
+    before its expiration_date, the rest is reported as likely to expire.
+    """
+    today = local_today()
+    start = today - timedelta(days=history_days)
+    products = list(
+        Lacteo.objects.order_by('id').values_list('id', 'name', 'unit', 'stock', 'expiration_date')
+    )
+    if not products:
+        return []
+    ids, names, units, stock, expiration = zip(*products)
+    ids = np.array(ids, dtype=np.int64)
+    stock = np.maximum(np.array(stock, dtype=np.float64), 0)
+
+    daily = daily_units(ids, start, history_days)
+    weekdays = (start.weekday() + np.arange(history_days)) % 7
+    factors = weekday_factors(daily, weekdays)
+    moving_average = weekly_average(daily)
+    level = smoothed_level(moving_average)
+    fitted = moving_average[:, -RESIDUAL_DAYS:] * factors[:, weekdays[-RESIDUAL_DAYS:]]
+    spread = (daily[:, -RESIDUAL_DAYS:] - fitted).std(axis=1)
+
+    horizon = lead_time + coverage
+    future_weekdays = (today.weekday() + np.arange(horizon)) % 7
+    expected = level[:, None] * factors[:, future_weekdays]
+    cumulative = np.concatenate([np.zeros((len(ids), 1)), expected.cumsum(axis=1)], axis=1)
+    demand = cumulative[:, horizon]
+
+    days_left = (np.array(expiration, dtype='datetime64[D]') - np.datetime64(today, 'D')).astype(np.int64)
+    sellable_before_expiry = np.take_along_axis(cumulative, np.clip(days_left, 0, horizon)[:, None], axis=1)[:, 0]
+    usable = np.where(days_left >= horizon, stock, np.minimum(stock, sellable_before_expiry))
+    expiring = stock - usable
+
+    safety = SERVICE_Z * spread * math.sqrt(lead_time)
+    order = np.ceil(np.maximum(demand + safety - usable, 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cover = np.where(level > 0, usable / level, np.inf)
+
+    return [
+        {
+            'id': int(ids[i]),
+            'name': names[i],
+            'unit': units[i],
+            'stock': int(stock[i]),
+            'expiration_date': expiration[i],
+            'daily_forecast': round(float(level[i]), 2),
+            'moving_average': round(float(moving_average[i, -1]), 2),
+            'demand': round(float(demand[i]), 1),
+            'days_of_cover': None if math.isinf(cover[i]) else round(float(cover[i]), 1),
+            'expiring_units': int(expiring[i]),
+            'reorder_quantity': int(order[i]),
+        }
+        for i in range(len(ids))
+    ]
+
+
+def sales_watermark():
+    """Changes whenever a sale is made in any branch or any product's stock moves"""
+    last_sales = fan_out(lambda: Sale.objects.aggregate(last=Max('id'))['last'])
+    last_movement = StockMovement.objects.aggregate(last=Max('id'))['last']
+    return f"{':'.join(str(last) for last in last_sales.values())}-{last_movement}"
+
+
+def reorder_suggestions(limit=None, **params):
+    """Products worth reordering, least days of cover first; cached until the next sale or stock change"""
+    key_source = f'{sales_watermark()}:{local_today()}:{sorted(params.items())}'
+    key = 'lacteos:forecast:' + sha1(key_source.encode()).hexdigest()
+    results = cache.get(key)
+    if results is None:
+        results = forecast(**params)
+        cache.set(key, results, FORECAST_CACHE_TIMEOUT)
+
+    suggestions = [row for row in results if row['reorder_quantity'] > 0]
+    suggestions.sort(key=lambda row: (row['days_of_cover'] is None, row['days_of_cover'] or 0))
+    return suggestions[:limit] if limit else suggestions
@@ -0,0 +1,189 @@
+"""
+Stock-movement ledger and inventory valuation.
+
+Every change to Lacteo.stock writes StockMovement rows (sale, restock or
+adjustment) in the same transaction, so a product's stock at any past
+moment is the sum of its movements before it. StockSnapshot rows
+checkpoint those sums (the snapshot_stock command, run daily): a valuation
+starts from the nearest snapshot before the moment and only adds the
+movements since, a range read on the created_at index, instead of
+replaying every sale. Units are priced at the cost PriceHistory recorded
+as in effect at that moment.
+
+Sales booked late by lacteos.reconcile get movements dated at the sale;
+backdate_movements() folds them into the snapshots taken since.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Max, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .dates import day_start
+from .models import Lacteo, PriceHistory, StockMovement, StockSnapshot
+
+
+# Cost assumed for a product without a recorded cost, as in checkout.unit_cost
+UNKNOWN_COST_RATIO = Decimal('0.6')
+CENTS = Decimal('0.01')
+
+
+def sale_movements(sale_id, quantities, user=None, created_at=None):
+    """Unsaved SALE movements taking quantities ({product id: units}) out for a sale"""
+    created_at = created_at or timezone.now()
+    return [
+        StockMovement(
+            lacteo_id=product_id, kind=StockMovement.SALE, quantity=-quantity,
+            sale_id=sale_id, created_by=user, created_at=created_at,
+        )
+        for product_id, quantity in quantities.items() if quantity
+    ]
+
+
+def set_stock(product, stock, user=None, note=''):
+    """
+    Set product.stock to a counted value, recording the difference as a
+    restock (more units) or an adjustment (fewer). The difference is taken
+    against the locked row, not the possibly stale product instance.
+    Call inside transaction.atomic(); does not save product.
+    """
+    current = Lacteo.objects.select_for_update().values_list('stock', flat=True).get(pk=product.pk)
+    product.stock = stock
+    if stock != current:
+        StockMovement.objects.create(
+            lacteo=product, kind=StockMovement.RESTOCK if stock > current else StockMovement.ADJUSTMENT,
+            quantity=stock - current, created_by=user, note=note,
+        )
+
+
+def record_new_product(product, user=None):
+    """Opening movement and price of a product just created"""
+    if product.stock:
+        StockMovement.objects.create(
+            lacteo=product, kind=StockMovement.RESTOCK, quantity=product.stock,
+            created_by=user, note='Initial stock',
+        )
+    PriceHistory.objects.create(
+        lacteo=product, price=product.price, cost_price=product.cost_price,
+        changed_by=user, reason='Product created',
+    )
+
+
+def record_price_change(product, old_price, old_cost, user=None, reason=''):
+    """Add a PriceHistory row when the product's price or cost changed"""
+    if (product.price, product.cost_price) != (old_price, old_cost):
+        PriceHistory.objects.create(
+            lacteo=product, price=product.price, cost_price=product.cost_price,
+            changed_by=user, reason=reason,
+        )
+
+
+def backdate_movements(movements):
+    """
+    Count saved movements dated in the past into the snapshots taken since,
+    which were checkpointed without them. Call in the same transaction.
+    """
+    if not movements:
+        return
+    earliest = min(movement.created_at for movement in movements)
+    moments = StockSnapshot.objects.filter(taken_at__gt=earliest).values_list('taken_at', flat=True).distinct()
+    for taken_at in moments:
+        units = {}
+        for movement in movements:
+            if movement.created_at < taken_at:
+                units[movement.lacteo_id] = units.get(movement.lacteo_id, 0) + movement.quantity
+        snapshot = StockSnapshot.objects.filter(taken_at=taken_at, lacteo_id__in=units)
+        existing = set(snapshot.values_list('lacteo_id', flat=True))
+        if existing:
+            snapshot.update(stock=Case(
+                *[When(lacteo_id=product_id, then=F('stock') + units[product_id]) for product_id in existing]
+            ))
+        # Products out of stock then have no row
+        StockSnapshot.objects.bulk_create([
+            StockSnapshot(taken_at=taken_at, lacteo_id=product_id, stock=quantity)
+            for product_id, quantity in units.items() if product_id not in existing and quantity
+        ])
+
+
+def latest_snapshot(moment, inclusive=True):
+    """taken_at of the newest snapshot at (when inclusive) or before moment, or None"""
+    snapshots = StockSnapshot.objects.filter(**{'taken_at__lte' if inclusive else 'taken_at__lt': moment})
+    return snapshots.aggregate(latest=Max('taken_at'))['latest']
+
+
+def stock_at(moment, taken_at=None):
+    """
+    {product id: units in stock} at moment, from the snapshot taken at
+    taken_at (by default the nearest one) and the movements since.
+    """
+    if taken_at is None:
+        taken_at = latest_snapshot(moment)
+    stock = {}
+    movements = StockMovement.objects.filter(created_at__lt=moment)
+    if taken_at is not None:
+        stock.update(StockSnapshot.objects.filter(taken_at=taken_at).values_list('lacteo_id', 'stock'))
+        movements = movements.filter(created_at__gte=taken_at)
+    totals = movements.values('lacteo_id').annotate(units=Sum('quantity')).values_list('lacteo_id', 'units').order_by()
+    for product_id, units in totals:
+        stock[product_id] = stock.get(product_id, 0) + units
+    return stock
+
+
+def take_snapshot(moment):
+    """
+    Checkpoint every product's stock at moment, replacing a snapshot taken at
+    the same moment. moment should be past enough that no transaction still
+    writing movements before it is open. Returns the number of rows written.
+    """
+    if moment > timezone.now():
+        raise ValueError('Cannot snapshot stock in the future')
+    stock = stock_at(moment, latest_snapshot(moment, inclusive=False))
+    with transaction.atomic():
+        StockSnapshot.objects.filter(taken_at=moment).delete()
+        StockSnapshot.objects.bulk_create([
+            StockSnapshot(taken_at=moment, lacteo_id=product_id, stock=units)
+            for product_id, units in stock.items() if units
+        ], batch_size=1000)
+    return sum(1 for units in stock.values() if units)
+
+
+def valuation_moment(day):
+    """End of the local day, or now for today"""
+    return min(timezone.now(), day_start(day + timedelta(days=1)))
+
+
+def valuation(moment):
+    """
+    Inventory at moment priced at the costs then in effect, largest value first.
+
+    Returns a list of dicts (id, name, category, unit, stock, unit_cost,
+    value) for products with units in stock, and the total value.
+    """
+    stock = {product_id: units for product_id, units in stock_at(moment).items() if units}
+    history = PriceHistory.objects.filter(lacteo=OuterRef('pk'), changed_at__lte=moment).order_by('-changed_at', '-id')
+    products = (
+        Lacteo.objects.filter(pk__in=stock)
+        .annotate(
+            cost_then=Coalesce(Subquery(history.values('cost_price')[:1]), F('cost_price')),
+            price_then=Coalesce(Subquery(history.values('price')[:1]), F('price')),
+        )
+        .values('id', 'name', 'category', 'unit', 'cost_then', 'price_then')
+    )
+    rows = []
+    for product in products:
+        cost = product['cost_then'] if product['cost_then'] > 0 else product['price_then'] * UNKNOWN_COST_RATIO
+        cost = Decimal(cost).quantize(CENTS)
+        units = stock[product['id']]
+        rows.append({
+            'id': product['id'],
+            'name': product['name'],
+            'category': product['category'],
+            'unit': product['unit'],
+            'stock': units,
+            'unit_cost': cost,
+            'value': cost * units,
+        })
+    rows.sort(key=lambda row: row['value'], reverse=True)
+    return rows, sum((row['value'] for row in rows), Decimal('0'))
@@ -0,0 +1,150 @@
+"""
+Small database-backed job queue.
+
+Request code calls enqueue() to store a Job row; the run_workers command
+claims due jobs and runs the function registered under the job's name.
+Failed jobs are retried with exponential backoff until max_attempts.
+
+Jobs run at least once: a worker that dies after the handler finished but
+before the job was marked done runs it again once requeued. Handlers that
+only write to the default database can register with atomic=True, so
+their writes and the done mark commit together and they run exactly once.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+JOB_REGISTRY = {}
+ATOMIC_JOBS = set()
+RETRY_BASE_SECONDS = 10
+RETRY_MAX_SECONDS = 60 * 60
+
+
+def job(name, atomic=False):
+    """
+    Decorator registering a function as the handler for jobs called name.
+
+    With atomic the handler runs in a transaction on the default database
+    that also marks the job done.
+    """
+    def decorator(func):
+        JOB_REGISTRY[name] = func
+        if atomic:
+            ATOMIC_JOBS.add(name)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=5):
+    """Store a job to run name(**payload) in the background after delay seconds"""
+    if name not in JOB_REGISTRY:
+        raise ValueError(f'Unknown job {name!r}')
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts,
+    )
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+
+def claim_next(worker_id):
+    """
+    Atomically take the oldest due job for this worker, or None.
+
+    Databases with SKIP LOCKED use it; SQLite instead flips the status with a
+    conditional UPDATE, so only one worker can win each job.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.PENDING, run_at__lte=now).order_by('run_at', 'id')
+    claim = {'status': Job.RUNNING, 'locked_by': worker_id, 'locked_at': now, 'attempts': F('attempts') + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pk = due.select_for_update(skip_locked=True).values_list('id', flat=True).first()
+            if pk is None:
+                return None
+            Job.objects.filter(pk=pk).update(**claim)
+            return Job.objects.get(pk=pk)
+
+    for pk in due.values_list('id', flat=True)[:10]:
+        if Job.objects.filter(pk=pk, status=Job.PENDING).update(**claim):
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome, scheduling a retry on failure"""
+    handler = JOB_REGISTRY.get(job.name)
+    done = Job.objects.filter(pk=job.pk)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for {job.name!r}')
+        if job.name in ATOMIC_JOBS:
+            with transaction.atomic():
+                handler(**job.payload)
+                done.update(status=Job.DONE, finished_at=timezone.now(), locked_by='')
+            return True
+        handler(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Job %s #%s failed (attempt %s)', job.name, job.pk, job.attempts)
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, last_error=error, finished_at=timezone.now(), locked_by=''
+            )
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.PENDING,
+                last_error=error,
+                run_at=timezone.now() + timedelta(seconds=retry_delay(job.attempts)),
+                locked_by='',
+            )
+        return False
+
+    done.update(status=Job.DONE, finished_at=timezone.now(), locked_by='')
+    return True
+
+
+def requeue_stale(older_than):
+    """Put back jobs whose worker died mid-run; returns how many were requeued"""
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff).update(
+        status=Job.PENDING, locked_by=''
+    )
+
+
+def work(worker_id, stop, poll_interval=1.0, once=False):
+    """Worker loop: claim and run jobs until stop is set (or the queue is empty if once)"""
+    processed = 0
+    try:
+        while not stop.is_set():
+            try:
+                job = claim_next(worker_id)
+                if job is None:
+                    if once:
+                        break
+                    stop.wait(poll_interval)
+                    continue
+                run_job(job)
+                processed += 1
+            except DatabaseError:
+                # "database is locked" and dropped connections are passing, keep the worker alive
+                logger.exception('Worker %s lost its database, retrying', worker_id)
+                close_old_connections()
+                stop.wait(poll_interval)
+    finally:
+        connection.close()
+    return processed
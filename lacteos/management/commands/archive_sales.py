@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from datetime import timedelta
+from lacteos.archive import archive_batch
+from lacteos.branches import branches
+from lacteos.models import Sale
+from lacteos.routers import branch_scope
+
+
+class Command(BaseCommand):
+    help = 'Moves old sales into the archive tables and compacts them into monthly summaries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='Archive sales older than this many days (default: 365)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of sales moved per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--branch',
+            action='append',
+            choices=branches(),
+            help='Only archive this branch, can be repeated (default: every branch)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many sales would be archived',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        batch_size = options['batch_size']
+
+        # The dashboard's 7 and 30 day windows read live sales only
+        if days < 31:
+            raise CommandError('--days must be at least 31 so recent reports keep their data.')
+        if batch_size <= 0:
+            raise CommandError('--batch-size must be positive.')
+
+        cutoff = timezone.now() - timedelta(days=days)
+
+        total_sales = 0
+        total_items = 0
+        for branch in options['branch'] or branches():
+            with branch_scope(branch):
+                if options['dry_run']:
+                    pending = Sale.objects.filter(sale_date__lt=cutoff).count()
+                    self.stdout.write(f'{branch}: {pending} sales older than {cutoff:%Y-%m-%d} would be archived')
+                    continue
+                while True:
+                    sales, items = archive_batch(cutoff, batch_size)
+                    if not sales:
+                        break
+                    total_sales += sales
+                    total_items += items
+                    self.stdout.write(f'{branch}: archived {total_sales} sales so far...')
+
+        if options['dry_run']:
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully archived {total_sales} sales with {total_items} items older than {cutoff:%Y-%m-%d}'
+            )
+        )
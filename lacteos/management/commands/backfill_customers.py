@@ -0,0 +1,183 @@
+import time
+from collections import defaultdict
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from lacteos import changes
+from lacteos.branches import branches, fan_out
+from lacteos.customers import customer_key, customers_for_names
+from lacteos.models import ArchivedSale, Customer, Sale
+from lacteos.routers import branch_database, branch_scope
+
+
+NAME_CHUNK = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates customers from existing sale names, links sales to them in batches and '
+        'recomputes lifetime totals (run it while checkout traffic is low)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Sales linked / customers recomputed per transaction (default: 2000)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help='Seconds to pause between batches (default: 0)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('--batch-size must be positive.')
+        self.sleep = options['sleep']
+        started = time.monotonic()
+
+        created = self.create_customers()
+        self.stdout.write(f'Created {created} customers')
+        linked = 0
+        for branch in branches():
+            with branch_scope(branch):
+                linked += self.link_sales(batch_size)
+        self.stdout.write(f'Linked {linked} sales')
+        updated = self.recompute_totals(batch_size)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Recomputed totals of {updated} customers ({elapsed:.1f}s)'))
+
+    def pause(self):
+        if self.sleep:
+            time.sleep(self.sleep)
+
+    def create_customers(self):
+        before = Customer.objects.count()
+        # Most used spelling first, so it becomes the customer's display name
+        counts = defaultdict(int)
+        for rows in fan_out(self.name_counts).values():
+            for name, uses in rows:
+                counts[name] += uses
+        names = sorted(counts, key=lambda name: (-counts[name], name))
+        for start in range(0, len(names), NAME_CHUNK):
+            customers_for_names(names[start:start + NAME_CHUNK])
+        return Customer.objects.count() - before
+
+    def name_counts(self):
+        """(customer_name, sales) of the current branch's unlinked and archived sales"""
+        rows = []
+        for queryset in (Sale.objects.filter(customer__isnull=True), ArchivedSale.objects.all()):
+            names = queryset.exclude(customer_name='').values('customer_name').annotate(uses=Count('id')).order_by()
+            rows.extend((row['customer_name'], row['uses']) for row in names)
+        return rows
+
+    def link_sales(self, batch_size):
+        """Link the current branch's sales to their customers"""
+        unlinked = Sale.objects.filter(customer__isnull=True).exclude(customer_name='')
+        linked = 0
+        last_id = 0
+        while True:
+            rows = list(
+                unlinked.filter(pk__gt=last_id).order_by('pk').values_list('id', 'customer_name')[:batch_size]
+            )
+            if not rows:
+                return linked
+            last_id = rows[-1][0]
+            customers = dict(Customer.objects.filter(
+                key__in={customer_key(name) for _, name in rows}
+            ).values_list('key', 'id'))
+            by_customer = defaultdict(list)
+            for sale_id, name in rows:
+                customer_id = customers.get(customer_key(name))
+                if customer_id:
+                    by_customer[customer_id].append(sale_id)
+            database = branch_database()
+            with transaction.atomic(using=database):
+                for customer_id, sale_ids in by_customer.items():
+                    linked += Sale.objects.filter(pk__in=sale_ids, customer__isnull=True).update(customer_id=customer_id)
+                changes.record_rows(
+                    Sale, [sale_id for sale_ids in by_customer.values() for sale_id in sale_ids], using=database,
+                )
+            self.stdout.write(f'Linked sales up to id {last_id}...')
+            self.pause()
+
+    @staticmethod
+    def merge(totals, key, row):
+        current = totals.get(key)
+        if current is None:
+            totals[key] = dict(row)
+            return
+        current['orders'] += row['orders']
+        current['revenue'] += row['revenue']
+        current['profit'] += row['profit']
+        current['first'] = min(current['first'], row['first'])
+        current['last'] = max(current['last'], row['last'])
+
+    def archived_totals(self):
+        """Lifetime totals of archived sales in every branch, by customer key"""
+        totals = {}
+
+        def branch_rows():
+            return list(
+                ArchivedSale.objects.exclude(customer_name='').values('customer_name')
+                .annotate(
+                    orders=Count('id'), revenue=Sum('total_amount'), profit=Sum('total_profit'),
+                    first=Min('sale_date'), last=Max('sale_date'),
+                )
+                .order_by()
+            )
+
+        for rows in fan_out(branch_rows).values():
+            for row in rows:
+                self.merge(totals, customer_key(row['customer_name']), row)
+        return totals
+
+    def live_totals(self, customer_ids):
+        """Totals of live sales in every branch, by customer id"""
+        totals = {}
+
+        def branch_rows():
+            return list(
+                Sale.objects.filter(customer_id__in=customer_ids)
+                .values('customer_id')
+                .annotate(
+                    orders=Count('id'), revenue=Sum('total_amount'), profit=Sum('total_profit'),
+                    first=Min('sale_date'), last=Max('sale_date'),
+                )
+                .order_by()
+            )
+
+        for rows in fan_out(branch_rows).values():
+            for row in rows:
+                self.merge(totals, row['customer_id'], row)
+        return totals
+
+    def recompute_totals(self, batch_size):
+        archived = self.archived_totals()
+        updated = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                customers = list(Customer.objects.filter(pk__gt=last_id).order_by('pk')[:batch_size])
+                if not customers:
+                    return updated
+                last_id = customers[-1].pk
+                live = self.live_totals([customer.pk for customer in customers])
+                for customer in customers:
+                    parts = [part for part in (live.get(customer.pk), archived.get(customer.key)) if part]
+                    customer.order_count = sum(part['orders'] for part in parts)
+                    customer.lifetime_revenue = sum((part['revenue'] for part in parts), Decimal('0'))
+                    customer.lifetime_profit = sum((part['profit'] for part in parts), Decimal('0'))
+                    customer.first_purchase = min((part['first'] for part in parts), default=None)
+                    customer.last_purchase = max((part['last'] for part in parts), default=None)
+                Customer.objects.bulk_update(customers, [
+                    'order_count', 'lifetime_revenue', 'lifetime_profit', 'first_purchase', 'last_purchase',
+                ])
+                updated += len(customers)
+            self.pause()
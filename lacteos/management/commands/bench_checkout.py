@@ -0,0 +1,114 @@
+import threading
+import time
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+from lacteos.admission import bucket_key
+from lacteos.benchmarks import test_databases
+from lacteos.inventory import record_new_product
+from lacteos.models import Lacteo
+
+
+BENCH_PREFIX = 'bench-checkout-'
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Floods checkout from concurrent clients, without and then with admission control, '
+        'and reports throughput and tail latency. Runs against throwaway test databases.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clients',
+            type=int,
+            default=32,
+            help='Concurrent clients, each logged in as its own user (default: 32)',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=20,
+            help='Checkouts each client submits back to back (default: 20)',
+        )
+
+    def client_loop(self, client, product, requests, results, start):
+        start.wait()
+        try:
+            for _ in range(requests):
+                began = time.perf_counter()
+                response = client.post('/purchase/', {'item_id': [product.pk], 'quantity': ['1']})
+                results.append((response.status_code, time.perf_counter() - began))
+        finally:
+            close_old_connections()
+
+    def run_round(self, clients, product, requests):
+        results = []
+        start = threading.Event()
+        threads = [
+            threading.Thread(target=self.client_loop, args=(client, product, requests, results, start))
+            for client in clients
+        ]
+        for thread in threads:
+            thread.start()
+        began = time.perf_counter()
+        start.set()
+        for thread in threads:
+            thread.join()
+        return results, time.perf_counter() - began
+
+    def report(self, label, results, elapsed):
+        admitted = [seconds for status, seconds in results if status == 302]
+        rejected = [seconds for status, seconds in results if status == 429]
+        errors = len(results) - len(admitted) - len(rejected)
+        self.stdout.write(
+            f'{label:10} {len(admitted):>6} {len(rejected):>6} {errors:>6} {len(admitted) / elapsed:>9.1f} '
+            f'{percentile(admitted, 0.5) * 1000:>8.0f} {percentile(admitted, 0.99) * 1000:>8.0f} '
+            f'{max(admitted, default=0) * 1000:>8.0f} {percentile(rejected, 0.99) * 1000:>10.0f}'
+        )
+
+    def handle(self, *args, **options):
+        clients, requests = options['clients'], options['requests']
+        if clients <= 0 or requests <= 0:
+            raise CommandError('--clients and --requests must be positive.')
+
+        # Clients check out for real, against copies of the databases dropped at the end
+        with test_databases():
+            self.benchmark(clients, requests)
+
+    def benchmark(self, clients, requests):
+        users = [User.objects.create_user(f'{BENCH_PREFIX}{index}') for index in range(clients)]
+        logged_in = []
+        for user in users:
+            client = Client(raise_request_exception=False)
+            client.force_login(user)
+            logged_in.append(client)
+        product = Lacteo.objects.create(
+            name='Bench', category='Bench', price=1, stock=clients * requests * 2, unit='u',
+            expiration_date=timezone.localdate() + timedelta(days=30),
+        )
+        record_new_product(product)
+        self.stdout.write(
+            f"{'Admission':10} {'OK':>6} {'429':>6} {'Errors':>6} {'Sales/s':>9} "
+            f"{'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'429 p99 ms':>10}"
+        )
+        for enabled in (False, True):
+            # Start every round with full buckets
+            cache.delete_many([bucket_key('checkout')] + [
+                bucket_key('checkout', f'user:{user.pk}') for user in users
+            ])
+            with override_settings(ADMISSION_ENABLED=enabled):
+                results, elapsed = self.run_round(logged_in, product, requests)
+            self.report('on' if enabled else 'off', results, elapsed)
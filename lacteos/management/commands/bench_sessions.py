@@ -0,0 +1,107 @@
+from contextlib import ExitStack
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from lacteos.benchmarks import test_databases
+from lacteos.inventory import record_new_product
+from lacteos.models import Lacteo
+
+
+MESSAGE_STORAGES = {
+    'session': 'django.contrib.messages.storage.session.SessionStorage',
+    'cookie': 'django.contrib.messages.storage.cookie.CookieStorage',
+}
+BENCH_PASSWORD = 'bench-sessions-password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares database queries per request, on every database, for each session and message '
+        'storage. Runs against throwaway test databases.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rounds',
+            type=int,
+            default=3,
+            help='Times the browsing scenario is repeated per configuration (default: 3)',
+        )
+
+    def scenario(self, product):
+        """A customer browsing, logging in, looking around and logging out"""
+        return [
+            ('get', '/', None),
+            ('get', '/products/', None),
+            ('post', '/accounts/login/', {'username': 'bench-sessions', 'password': BENCH_PASSWORD}),
+            ('get', '/', None),
+            ('get', '/products/', None),
+            ('get', f'/products/{product.pk}/', None),
+            ('get', '/sales/', None),
+            ('get', '/accounts/logout/', None),
+            ('get', '/', None),
+        ]
+
+    def run_configuration(self, product, rounds):
+        totals = {'requests': 0, 'queries': 0, 'session_reads': 0, 'session_writes': 0}
+        for _ in range(rounds):
+            client = Client()
+            for method, path, data in self.scenario(product):
+                # Sessions, replicas and branches may each live on their own database
+                with ExitStack() as stack:
+                    captures = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+                    getattr(client, method)(path, data)
+                queries = [query['sql'] for captured in captures for query in captured.captured_queries]
+                session_sql = [sql for sql in queries if 'django_session' in sql]
+                totals['requests'] += 1
+                totals['queries'] += len(queries)
+                totals['session_reads'] += sum(sql.startswith('SELECT') for sql in session_sql)
+                totals['session_writes'] += sum(not sql.startswith('SELECT') for sql in session_sql)
+        return totals
+
+    def handle(self, *args, **options):
+        rounds = max(1, options['rounds'])
+        with test_databases():
+            self.benchmark(rounds)
+
+    def benchmark(self, rounds):
+        configurations = [
+            (engine, storage)
+            for engine in settings.SESSION_ENGINES
+            for storage in MESSAGE_STORAGES
+        ]
+        self.stdout.write(
+            f"{'Sessions':16} {'Messages':9} {'Queries/req':>12} {'Session reads/req':>18} {'Session writes/req':>19}"
+        )
+
+        User.objects.create_user('bench-sessions', password=BENCH_PASSWORD)
+        product = Lacteo.objects.create(
+            name='Bench', category='Bench', price=1, stock=100, unit='u',
+            expiration_date=timezone.localdate() + timedelta(days=30),
+        )
+        record_new_product(product)
+        for engine, storage in configurations:
+            with override_settings(
+                SESSION_ENGINE=settings.SESSION_ENGINES[engine],
+                MESSAGE_STORAGE=MESSAGE_STORAGES[storage],
+                ALLOWED_HOSTS=['testserver'],
+                SLOW_QUERY_MS=0,
+                # Every round logs the same user in; throttled logins would skew the counts
+                ADMISSION_ENABLED=False,
+            ):
+                totals = self.run_configuration(product, rounds)
+            requests = totals['requests']
+            current = (
+                settings.SESSION_ENGINE == settings.SESSION_ENGINES[engine]
+                and settings.MESSAGE_STORAGE == MESSAGE_STORAGES[storage]
+            )
+            line = (
+                f"{engine:16} {storage:9} {totals['queries'] / requests:>12.2f} "
+                f"{totals['session_reads'] / requests:>18.2f} {totals['session_writes'] / requests:>19.2f}"
+            )
+            self.stdout.write(self.style.SUCCESS(line + '  <- configured') if current else line)
@@ -1,10 +1,13 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
 from django.contrib.auth.models import User
 from decimal import Decimal
 from datetime import timedelta
 import random
+from lacteos.branches import branches
 from lacteos.models import Lacteo, Sale, SaleItem
+from lacteos.routers import branch_database, branch_scope, default_branch
 
 
 class Command(BaseCommand):
@@ -17,8 +20,18 @@ class Command(BaseCommand):
             default=20,
             help='Number of mock sales to create (default: 20)',
         )
+        parser.add_argument(
+            '--branch',
+            choices=branches(),
+            default=default_branch(),
+            help=f'Branch the sales are made at (default: {default_branch()})',
+        )
 
     def handle(self, *args, **options):
+        with branch_scope(options['branch']):
+            self.create_sales(options)
+
+    def create_sales(self, options):
         count = options['count']
         
         # Get or create a user for sales
@@ -59,34 +72,35 @@ class Command(BaseCommand):
             # Random customer (or empty for walk-in)
             customer_name = random.choice(customer_names) if random.random() > 0.2 else ''
             
-            # Create sale
-            sale = Sale.objects.create(
-                sale_date=sale_date,
-                customer_name=customer_name,
-                total_amount=Decimal('0'),
-                created_by=user,
-                notes=f'Mock sale #{i+1}'
-            )
+            with transaction.atomic(using=branch_database()):
+                # Create sale
+                sale = Sale.objects.create(
+                    sale_date=sale_date,
+                    customer_name=customer_name,
+                    total_amount=Decimal('0'),
+                    created_by=user,
+                    notes=f'Mock sale #{i+1}'
+                )
             
-            # Add 1-5 items to each sale
-            num_items = random.randint(1, 5)
-            selected_lacteos = random.sample(lacteos, min(num_items, len(lacteos)))
+                # Add 1-5 items to each sale
+                num_items = random.randint(1, 5)
+                selected_lacteos = random.sample(lacteos, min(num_items, len(lacteos)))
             
-            for lacteo in selected_lacteos:
-                quantity = random.randint(1, 10)
-                unit_price = lacteo.price
-                cost_price = lacteo.cost_price if lacteo.cost_price > 0 else lacteo.price * Decimal('0.6')
+                for lacteo in selected_lacteos:
+                    quantity = random.randint(1, 10)
+                    unit_price = lacteo.price
+                    cost_price = lacteo.cost_price if lacteo.cost_price > 0 else lacteo.price * Decimal('0.6')
                 
-                SaleItem.objects.create(
-                    sale=sale,
-                    lacteo=lacteo,
-                    quantity=quantity,
-                    unit_price=unit_price,
-                    cost_price=cost_price
-                )
+                    SaleItem.objects.create(
+                        sale=sale,
+                        lacteo=lacteo,
+                        quantity=quantity,
+                        unit_price=unit_price,
+                        cost_price=cost_price
+                    )
             
-            # Recalculate totals
-            sale.calculate_totals()
+                # Recalculate totals
+                sale.calculate_totals()
             created_count += 1
         
         self.stdout.write(
@@ -0,0 +1,59 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from lacteos.forecasting import COVERAGE_DAYS, HISTORY_DAYS, LEAD_TIME_DAYS, forecast
+
+
+class Command(BaseCommand):
+    help = 'Forecasts daily demand per product and suggests reorder quantities'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--history-days',
+            type=int,
+            default=HISTORY_DAYS,
+            help=f'Days of sales history to fit on (default: {HISTORY_DAYS})',
+        )
+        parser.add_argument(
+            '--lead-time',
+            type=int,
+            default=LEAD_TIME_DAYS,
+            help=f'Days until an order placed today arrives (default: {LEAD_TIME_DAYS})',
+        )
+        parser.add_argument(
+            '--coverage',
+            type=int,
+            default=COVERAGE_DAYS,
+            help=f'Days an order should last once it arrives (default: {COVERAGE_DAYS})',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='List every product, not only those that need reordering',
+        )
+
+    def handle(self, *args, **options):
+        if options['history_days'] < 14:
+            raise CommandError('--history-days must be at least 14.')
+        if options['lead_time'] < 0 or options['coverage'] <= 0:
+            raise CommandError('--lead-time must not be negative and --coverage must be positive.')
+
+        started = time.monotonic()
+        rows = forecast(
+            history_days=options['history_days'],
+            lead_time=options['lead_time'],
+            coverage=options['coverage'],
+        )
+        elapsed = time.monotonic() - started
+        if not options['all']:
+            rows = [row for row in rows if row['reorder_quantity'] > 0]
+
+        self.stdout.write(
+            f"{'Product':30} {'Stock':>7} {'Per day':>8} {'Cover':>7} {'Expiring':>9} {'Order':>7}"
+        )
+        for row in rows:
+            cover = '-' if row['days_of_cover'] is None else f"{row['days_of_cover']:.1f}"
+            self.stdout.write(
+                f"{row['name'][:30]:30} {row['stock']:>7} {row['daily_forecast']:>8.2f} "
+                f"{cover:>7} {row['expiring_units']:>9} {row['reorder_quantity']:>7}"
+            )
+        self.stdout.write(self.style.SUCCESS(f'{len(rows)} products listed ({elapsed:.2f}s)'))
@@ -0,0 +1,72 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from lacteos.models import Lacteo
+from lacteos.storage import product_image_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes product image files that no product references, with one walk of the image '
+        'directory and one query for the names in use'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=float,
+            default=24,
+            help='Keep files modified in the last N hours, uploads may not be saved yet (default: 24)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the files that would be deleted',
+        )
+
+    def handle(self, *args, **options):
+        if options['min_age'] < 0:
+            raise CommandError('--min-age must not be negative.')
+
+        storage = product_image_storage()
+        upload_dir = Lacteo._meta.get_field('imagen').upload_to.strip('/')
+        root = storage.path(upload_dir)
+        if not os.path.isdir(root):
+            self.stdout.write(f'{root} does not exist, nothing to collect')
+            return
+
+        started = time.monotonic()
+        cutoff = time.time() - options['min_age'] * 3600
+        referenced = set(
+            Lacteo.objects.exclude(imagen__isnull=True).exclude(imagen='')
+            .values_list('imagen', flat=True).iterator()
+        )
+
+        scanned = deleted = recent = freed = 0
+        for directory, subdirectories, files in os.walk(root, topdown=False):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                scanned += 1
+                name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+                if name in referenced:
+                    continue
+                stat = os.stat(path)
+                if stat.st_mtime > cutoff:
+                    recent += 1
+                    continue
+                deleted += 1
+                freed += stat.st_size
+                if options['dry_run']:
+                    self.stdout.write(f'Would delete {name}')
+                else:
+                    os.remove(path)
+            # Hash fan-out directories left empty
+            if directory != root and not options['dry_run'] and not os.listdir(directory):
+                os.rmdir(directory)
+
+        elapsed = time.monotonic() - started
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} of {scanned} files ({freed / 1024:.0f} KiB), '
+            f'kept {recent} recent unreferenced files ({elapsed:.2f}s)'
+        ))
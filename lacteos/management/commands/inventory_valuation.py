@@ -0,0 +1,35 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from lacteos.dates import local_today
+from lacteos.inventory import valuation, valuation_moment
+
+
+class Command(BaseCommand):
+    help = 'Values the inventory at the close of a day, at the costs in effect then'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=date.fromisoformat,
+            default=None,
+            help='Day to value the stock at the end of, YYYY-MM-DD (default: today, up to now)',
+        )
+
+    def handle(self, *args, **options):
+        day = options['date'] or local_today()
+        if day > local_today():
+            raise CommandError('--date must not be in the future.')
+
+        started = time.monotonic()
+        rows, total = valuation(valuation_moment(day))
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(f"{'Product':30} {'Stock':>7} {'Unit cost':>10} {'Value':>12}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['name'][:30]:30} {row['stock']:>7} {row['unit_cost']:>10} {row['value']:>12}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Inventory value at the end of {day}: {total} ({len(rows)} products, {elapsed * 1000:.0f} ms)'
+        ))
@@ -0,0 +1,53 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from lacteos.branches import branches
+from lacteos.changes import prune_batch, retention_cutoff
+from lacteos.routers import branch_scope
+
+
+class Command(BaseCommand):
+    help = 'Deletes change-feed events older than the retention period, oldest first and in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Keep events from the last N days (default: CHANGE_FEED_RETENTION_DAYS, 30)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Events deleted per statement (default: 5000)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between batches so requests can take the write lock (default: 0.1)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('--batch-size must be positive.')
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days must not be negative.')
+
+        cutoff = retention_cutoff(options['days'])
+        deleted_total = 0
+        started = time.monotonic()
+        for branch in branches():
+            while True:
+                with branch_scope(branch):
+                    deleted = prune_batch(cutoff, batch_size)
+                if not deleted:
+                    break
+                deleted_total += deleted
+                self.stdout.write(f'{branch}: deleted {deleted_total} events...')
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted_total} change events older than {cutoff:%Y-%m-%d %H:%M} ({elapsed:.1f}s)'))
@@ -0,0 +1,75 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from lacteos.branches import branches
+from lacteos.changes import MODEL_NAMES, CursorExpired, changes_since
+from lacteos.routers import branch_scope, default_branch
+
+
+class Command(BaseCommand):
+    help = (
+        'Prints change-feed events after a cursor as JSON lines, the same data as /api/changes/. '
+        'The cursor to resume from is written to stderr. Each branch keeps its own feed and cursor.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--branch',
+            choices=branches(),
+            default=default_branch(),
+            help=f'Branch whose feed to read, product changes are in the main one (default: {default_branch()})',
+        )
+        parser.add_argument(
+            '--cursor',
+            type=int,
+            default=0,
+            help='Last event id already processed (default: 0, the oldest event kept)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Events read per query (default: 1000)',
+        )
+        parser.add_argument(
+            '--max-events',
+            type=int,
+            default=0,
+            help='Stop after this many events (default: 0, until caught up)',
+        )
+        parser.add_argument(
+            '--models',
+            default='',
+            help=f"Comma separated models to include: {', '.join(sorted(MODEL_NAMES))} (default: all)",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('--batch-size must be positive.')
+        models = [name.strip() for name in options['models'].split(',') if name.strip()]
+        unknown = [name for name in models if name not in MODEL_NAMES]
+        if unknown:
+            raise CommandError(f"Unknown models: {', '.join(unknown)}")
+
+        cursor = options['cursor']
+        remaining = options['max_events'] or None
+        pulled = 0
+        while remaining is None or remaining > 0:
+            limit = batch_size if remaining is None else min(batch_size, remaining)
+            try:
+                with branch_scope(options['branch']):
+                    events, has_more = changes_since(cursor, limit, models)
+            except CursorExpired as exc:
+                raise CommandError(str(exc))
+            for event in events:
+                self.stdout.write(json.dumps(event, cls=DjangoJSONEncoder))
+            if events:
+                cursor = events[-1]['id']
+                pulled += len(events)
+                if remaining is not None:
+                    remaining -= len(events)
+            if not has_more:
+                break
+
+        self.stderr.write(self.style.SUCCESS(f'Pulled {pulled} events, next cursor: {cursor}'))
@@ -0,0 +1,51 @@
+import time
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired database sessions in small chunks, unlike clearsessions which does it in one statement'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Sessions deleted per statement (default: 1000)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between chunks so requests can take the write lock (default: 0.1)',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size <= 0:
+            raise CommandError('--chunk-size must be positive.')
+        if settings.SESSION_ENGINE.endswith('signed_cookies'):
+            self.stdout.write('Sessions are stored in signed cookies, nothing to purge.')
+            return
+
+        now = timezone.now()
+        expired = Session.objects.filter(expire_date__lt=now)
+        deleted_total = 0
+        started = time.monotonic()
+        while True:
+            # expire_date is indexed, so each chunk is an index range scan
+            keys = list(expired.order_by('expire_date').values_list('session_key', flat=True)[:chunk_size])
+            if not keys:
+                break
+            deleted, _ = Session.objects.filter(session_key__in=keys).delete()
+            deleted_total += deleted
+            self.stdout.write(f'Deleted {deleted_total} expired sessions...')
+            if len(keys) < chunk_size:
+                break
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Purged {deleted_total} expired sessions ({elapsed:.1f}s)'))
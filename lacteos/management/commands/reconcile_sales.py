@@ -0,0 +1,116 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from lacteos.branches import branches
+from lacteos.models import Sale
+from lacteos.reconcile import book_sales, drifted_sale_ids, fix_sale_totals, ledger_start, unbooked_sale_ids
+from lacteos.routers import branch_scope
+
+
+class Command(BaseCommand):
+    help = (
+        'Finds sales whose totals disagree with their items, and sales missing from the stock '
+        'ledger, and fixes them in set-based chunks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Sale ids checked and fixed per transaction (default: 5000)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help='Seconds to pause between chunks to leave room for live traffic (default: 0)',
+        )
+        parser.add_argument(
+            '--branch',
+            action='append',
+            choices=branches(),
+            help='Only check this branch, can be repeated (default: every branch)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report drifted and unbooked sales, do not fix them',
+        )
+        parser.add_argument(
+            '--book-unbooked',
+            action='store_true',
+            help=(
+                'Also book checkout sales missing from the stock ledger, taking their units out of stock '
+                '(default: only report them)'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size <= 0:
+            raise CommandError('--chunk-size must be positive.')
+
+        totals = [0, 0, 0, 0]
+        started = time.monotonic()
+        # Sales from before the ledger existed have no movements to check
+        self.since = ledger_start()
+        for branch in options['branch'] or branches():
+            with branch_scope(branch):
+                counts = self.reconcile(branch, chunk_size, options)
+            totals = [total + count for total, count in zip(totals, counts)]
+        drifted_total, fixed_total, unbooked_total, booked_total = totals
+
+        elapsed = time.monotonic() - started
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f'{drifted_total} sales have drifted totals, {unbooked_total} are missing from the stock ledger '
+                f'({elapsed:.1f}s)'
+            ))
+        elif options['book_unbooked']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Fixed {fixed_total} of {drifted_total} drifted sales, booked {booked_total} of {unbooked_total} '
+                f'sales missing from the stock ledger ({elapsed:.1f}s)'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Fixed {fixed_total} of {drifted_total} drifted sales ({elapsed:.1f}s)'
+            ))
+            if unbooked_total:
+                self.stdout.write(self.style.WARNING(
+                    f'{unbooked_total} checkout sales are missing from the stock ledger, '
+                    f'run again with --book-unbooked to book them'
+                ))
+
+    def reconcile(self, branch, chunk_size, options):
+        """Check and fix the current branch's sales; returns (drifted, fixed, unbooked, booked)"""
+        bounds = Sale.objects.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            self.stdout.write(f'{branch}: no sales to reconcile.')
+            return 0, 0, 0, 0
+
+        first, last = bounds['first'], bounds['last']
+        drifted_total = 0
+        fixed_total = 0
+        unbooked_total = 0
+        booked_total = 0
+        for start in range(first, last + 1, chunk_size):
+            end = start + chunk_size
+            drifted = drifted_sale_ids(start, end)
+            drifted_total += len(drifted)
+            if drifted and not options['dry_run']:
+                fixed_total += fix_sale_totals(drifted)
+            # Fixed totals first, so a booked sale adds its corrected totals to the customer
+            unbooked = unbooked_sale_ids(start, end, self.since) if self.since else []
+            unbooked_total += len(unbooked)
+            if unbooked and options['book_unbooked'] and not options['dry_run']:
+                booked_total += book_sales(unbooked)
+
+            done = min(end, last + 1) - first
+            self.stdout.write(
+                f'{branch}: checked ids {start}-{min(end, last + 1) - 1} '
+                f'({done * 100 // (last + 1 - first)}%): {len(drifted)} drifted, {len(unbooked)} unbooked'
+            )
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        return drifted_total, fixed_total, unbooked_total, booked_total
@@ -0,0 +1,46 @@
+import sqlite3
+from urllib.parse import unquote, urlsplit
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from lacteos.routers import REPLICA_ALIAS
+
+
+def database_file(settings_dict):
+    """Path of an SQLite database, also when its NAME is a file: URI"""
+    name = str(settings_dict['NAME'])
+    if settings_dict.get('OPTIONS', {}).get('uri') and name.startswith('file:'):
+        return unquote(urlsplit(name).path)
+    return name
+
+
+class Command(BaseCommand):
+    help = 'Copies the primary SQLite database onto the reporting replica using the backup API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages',
+            type=int,
+            default=1024,
+            help='Pages copied per backup step, so writers are not blocked for long (default: 1024)',
+        )
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError('No replica database configured. Set REPLICA_DB_NAME.')
+
+        primary = settings.DATABASES['default']
+        replica = settings.DATABASES[REPLICA_ALIAS]
+        sqlite_engine = 'django.db.backends.sqlite3'
+        if primary['ENGINE'] != sqlite_engine or replica['ENGINE'] != sqlite_engine:
+            raise CommandError('refresh_replica only supports SQLite databases.')
+
+        # The site opens the replica read-only; the refresh writes the file directly
+        source = sqlite3.connect(database_file(primary))
+        target = sqlite3.connect(database_file(replica))
+        try:
+            source.backup(target, pages=options['pages'])
+        finally:
+            target.close()
+            source.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Replica {database_file(replica)} refreshed from {database_file(primary)}'))
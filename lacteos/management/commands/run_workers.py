@@ -0,0 +1,87 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from lacteos.jobs import requeue_stale, work
+
+
+class Command(BaseCommand):
+    help = 'Runs background jobs from the database queue with a pool of threads or processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Number of concurrent workers (default: 2)',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=['thread', 'process'],
+            default='thread',
+            help='Run workers as threads or forked processes (default: thread)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds an idle worker waits before polling again (default: 1)',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=600,
+            help='Requeue jobs left running longer than this many seconds (default: 600)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no due jobs are left instead of polling forever',
+        )
+
+    def handle(self, *args, **options):
+        count = options['workers']
+        if count <= 0:
+            raise CommandError('--workers must be positive.')
+
+        requeued = requeue_stale(options['stale_after'])
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale jobs'))
+
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        kwargs = {'poll_interval': options['poll_interval'], 'once': options['once']}
+
+        if options['mode'] == 'process':
+            # Forked children must not share the parent's database connections
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            stop = context.Event()
+            workers = [
+                context.Process(target=work, args=(f'{prefix}:p{i}', stop), kwargs=kwargs, daemon=True)
+                for i in range(count)
+            ]
+        else:
+            stop = threading.Event()
+            workers = [
+                threading.Thread(target=work, args=(f'{prefix}:t{i}', stop), kwargs=kwargs, daemon=True)
+                for i in range(count)
+            ]
+
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        self.stdout.write(f'Starting {count} {options["mode"]} workers')
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(timeout=0.5)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping workers...')
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
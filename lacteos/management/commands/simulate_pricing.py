@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+from lacteos.analytics import load_catalog, simulate
+
+
+class Command(BaseCommand):
+    help = 'Estimates monthly profit after a price and/or cost change across the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--price-change',
+            type=float,
+            default=0,
+            help='Percent change applied to prices, e.g. 5 or -2.5 (default: 0)',
+        )
+        parser.add_argument(
+            '--cost-change',
+            type=float,
+            default=0,
+            help='Percent change applied to cost prices (default: 0)',
+        )
+        parser.add_argument(
+            '--category',
+            type=str,
+            default=None,
+            help='Only reprice products in this category (default: all)',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Days of sales used to estimate monthly units (default: 30)',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help='Number of most affected products to list (default: 10)',
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] <= 0:
+            raise CommandError('--days must be positive.')
+
+        result = simulate(
+            load_catalog(options['days']),
+            price_change_pct=options['price_change'],
+            cost_change_pct=options['cost_change'],
+            category=options['category'],
+            top=options['top'],
+        )
+        current, simulated = result['current'], result['simulated']
+
+        self.stdout.write(
+            f"{result['affected_products']} of {result['products']} products repriced, "
+            f"monthly units from the last {result['days']} days"
+        )
+        self.stdout.write(f"{'':12}{'Current':>14}{'Simulated':>14}")
+        for label, key in [('Revenue', 'revenue'), ('Cost', 'cost'), ('Profit', 'profit'), ('Margin %', 'margin_pct')]:
+            self.stdout.write(f'{label:12}{current[key]:>14,.2f}{simulated[key]:>14,.2f}')
+
+        if result['top_impacts']:
+            self.stdout.write('\nMost affected products:')
+            for product in result['top_impacts']:
+                self.stdout.write(
+                    f"  {product['name'][:30]:30} {product['margin_pct']:>8.2f}% -> "
+                    f"{product['new_margin_pct']:>8.2f}%  {product['profit_change']:>+12,.2f}"
+                )
+        if result['unprofitable_after']:
+            self.stdout.write(self.style.WARNING(
+                f"{result['unprofitable_after']} products would sell at or below cost"
+            ))
+
+        style = self.style.SUCCESS if result['profit_change'] >= 0 else self.style.ERROR
+        self.stdout.write(style(f"Monthly profit change: {result['profit_change']:+,.2f}"))
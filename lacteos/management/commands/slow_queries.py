@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from lacteos.models import SlowQuery
+
+
+ORDERINGS = {
+    'total': '-total_ms',
+    'max': '-max_ms',
+    'count': '-count',
+}
+
+
+class Command(BaseCommand):
+    help = 'Reports the slowest query shapes recorded by the slow-query log'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Number of queries to list (default: 20)',
+        )
+        parser.add_argument(
+            '--order',
+            choices=sorted(ORDERINGS),
+            default='total',
+            help='Rank by total time, worst single run or number of runs (default: total)',
+        )
+        parser.add_argument(
+            '--scans-only',
+            action='store_true',
+            help='Only list queries whose plan scans a whole table',
+        )
+        parser.add_argument(
+            '--plans',
+            action='store_true',
+            help='Print the query plan under each query',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Delete every recorded slow query and exit',
+        )
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted, _ = SlowQuery.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} slow queries'))
+            return
+
+        queries = SlowQuery.objects.order_by(ORDERINGS[options['order']])
+        if options['scans_only']:
+            queries = queries.filter(full_scan=True)
+        queries = list(queries[:options['limit']])
+        if not queries:
+            self.stdout.write('No slow queries recorded.')
+            return
+
+        self.stdout.write(f"{'Total ms':>10} {'Runs':>6} {'Avg ms':>8} {'Max ms':>8}  {'Scan':4}  View")
+        for query in queries:
+            scan = self.style.WARNING('SCAN') if query.full_scan else '    '
+            self.stdout.write(
+                f'{query.total_ms:>10.1f} {query.count:>6} {query.avg_ms:>8.1f} {query.max_ms:>8.1f}  '
+                f'{scan}  {query.view or "-"}'
+            )
+            self.stdout.write(f'    {query.sql[:300]}')
+            if options['plans'] and query.plan:
+                for line in query.plan.splitlines():
+                    self.stdout.write(f'      {line}')
+        scans = sum(query.full_scan for query in queries)
+        self.stdout.write(self.style.SUCCESS(f'{len(queries)} query shapes listed, {scans} with full table scans'))
@@ -0,0 +1,33 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from lacteos.dates import day_start, local_today
+from lacteos.inventory import take_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Checkpoints every product's stock at local midnight, so inventory valuations "
+        'only add up the movements since (run it daily, after midnight)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=date.fromisoformat,
+            default=None,
+            help='Snapshot the stock at the start of this day, YYYY-MM-DD (default: today)',
+        )
+
+    def handle(self, *args, **options):
+        day = options['date'] or local_today()
+        if day > local_today():
+            raise CommandError('--date must not be in the future.')
+
+        started = time.monotonic()
+        moment = day_start(day)
+        rows = take_snapshot(moment)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Snapshot of {rows} products at {moment:%Y-%m-%d %H:%M %Z} ({elapsed:.2f}s)'
+        ))
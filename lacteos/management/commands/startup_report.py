@@ -0,0 +1,94 @@
+import json
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Run in a fresh interpreter, so nothing is imported or warmed up yet
+WORKER_SCRIPT = (
+    'import json, time; started = time.perf_counter(); import {module}; '
+    'from lacteos.warmup import last_report; '
+    'print(json.dumps({{"total": time.perf_counter() - started, "steps": last_report}}))'
+)
+
+
+def parse_importtime(output):
+    """[(module, self microseconds)] from the stderr of python -X importtime"""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header line
+        modules.append((fields[2].strip(), int(fields[0])))
+    return modules
+
+
+class Command(BaseCommand):
+    help = (
+        'Starts a worker the way the WSGI/ASGI server does, in a new process, and breaks its '
+        'startup time down into imports per package and warm-up steps'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--asgi',
+            action='store_true',
+            help='Start config.asgi instead of config.wsgi',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Packages and modules to list by import time (default: 15)',
+        )
+
+    def handle(self, *args, **options):
+        if options['top'] <= 0:
+            raise CommandError('--top must be positive.')
+        module = 'config.asgi' if options['asgi'] else 'config.wsgi'
+
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', WORKER_SCRIPT.format(module=module)],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        wall = time.perf_counter() - started
+        if result.returncode:
+            raise CommandError(f'Starting {module} failed:\n{result.stderr[-2000:]}')
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+
+        # The worker module's own time is the setup and warm-up listed below
+        modules = [(name, microseconds) for name, microseconds in parse_importtime(result.stderr) if name != module]
+        packages = defaultdict(int)
+        for name, microseconds in modules:
+            packages[name.split('.')[0]] += microseconds
+        imports = sum(packages.values()) / 1e6
+
+        self.stdout.write(f'Process start to ready: {wall:.3f}s (interpreter start-up included)')
+        self.stdout.write(f'Import {module} and warm up: {report["total"]:.3f}s')
+        self.stdout.write(f'  of which imports: {imports:.3f}s in {len(modules)} modules')
+
+        self.stdout.write('')
+        self.stdout.write(f'Import time by package (top {options["top"]}):')
+        for name, microseconds in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'  {microseconds / 1e6:8.3f}s  {name}')
+
+        self.stdout.write('')
+        self.stdout.write(f'Slowest modules, own time (top {options["top"]}):')
+        for name, microseconds in sorted(modules, key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'  {microseconds / 1e6:8.3f}s  {name}')
+
+        self.stdout.write('')
+        if not report['steps']:
+            self.stdout.write('Warm-up is off (WARMUP_ENABLED=0)')
+            return
+        self.stdout.write('Initialization and warm-up:')
+        for step, seconds, detail in report['steps']:
+            self.stdout.write(f'  {seconds:8.3f}s  {step:<10} {detail}')
+        warmup = sum(seconds for _, seconds, _ in report['steps'])
+        self.stdout.write(self.style.SUCCESS(f'Worker ready after {wall:.3f}s, {warmup:.3f}s of it setup and warm-up'))
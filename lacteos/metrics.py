@@ -0,0 +1,225 @@
+"""
+In-process metrics exposed in the Prometheus text format at /metrics.
+
+Each process aggregates counters and histograms in memory under a lock;
+recording is a dict update. With several worker processes, set METRICS_DIR
+to a directory they share: every process then writes a snapshot of its
+totals there at most once per METRICS_FLUSH_SECONDS, and /metrics adds up
+the snapshots of all processes. Without METRICS_DIR only the process
+serving the scrape is reported.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+HTTP_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+# name: (type, help, label names, buckets)
+METRICS = {
+    'lacteos_http_requests_total': (
+        'counter', 'Requests served, by URL name, method and status class', ('view', 'method', 'status'), None),
+    'lacteos_http_request_duration_seconds': (
+        'histogram', 'Time to produce a response, by URL name', ('view',), LATENCY_BUCKETS),
+    'lacteos_db_queries_total': (
+        'counter', 'SQL queries run while serving requests, by URL name', ('view',), None),
+    'lacteos_db_time_seconds_total': (
+        'counter', 'Time spent in SQL queries while serving requests, by URL name', ('view',), None),
+    'lacteos_db_query_duration_seconds': (
+        'histogram', 'Duration of single SQL queries, by database alias', ('alias',), QUERY_BUCKETS),
+    'lacteos_template_render_seconds': (
+        'histogram', 'Template render time, by template name', ('template',), LATENCY_BUCKETS),
+    'lacteos_sales_created_total': (
+        'counter', 'Sales recorded, by channel', ('source',), None),
+    'lacteos_checkout_stock_rejections_total': (
+        'counter', 'Sale lines refused or cut down for lack of stock, by channel', ('source',), None),
+    'lacteos_admission_rejections_total': (
+        'counter', 'Write requests turned away with a 429, by scope and limit reached', ('scope', 'reason'), None),
+}
+
+
+class Registry:
+    """Counters and histograms of this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.flush_lock = threading.Lock()
+        self.last_flush = 0.0
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, tuple(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        buckets = METRICS[name][3]
+        key = (name, tuple(labels))
+        with self.lock:
+            # Per-bucket counts, then sum and count
+            state = self.histograms.get(key)
+            if state is None:
+                state = self.histograms[key] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(state)] for (name, labels), state in self.histograms.items()],
+            }
+
+    def flush(self, force=False):
+        """Write this process's snapshot to METRICS_DIR, at most once per METRICS_FLUSH_SECONDS"""
+        directory = metrics_dir()
+        now = time.monotonic()
+        if directory is None or (not force and now - self.last_flush < getattr(settings, 'METRICS_FLUSH_SECONDS', 5)):
+            return
+        # A scrape waits, a request just skips while another thread is writing
+        if not self.flush_lock.acquire(blocking=force):
+            return
+        try:
+            self.last_flush = now
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f'{os.getpid()}.json'
+            temporary = path.with_suffix('.tmp')
+            temporary.write_text(json.dumps(self.snapshot()))
+            os.replace(temporary, path)
+        finally:
+            self.flush_lock.release()
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+
+
+def metrics_dir():
+    directory = getattr(settings, 'METRICS_DIR', None)
+    return Path(directory) if directory else None
+
+
+def collect():
+    """Snapshots of every process, this one included"""
+    directory = metrics_dir()
+    if directory is None:
+        return [registry.snapshot()]
+    registry.flush(force=True)
+    snapshots = []
+    for path in directory.glob('*.json'):
+        try:
+            snapshots.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _merge(snapshots):
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, state in snapshot['histograms']:
+            key = (name, tuple(labels))
+            total = histograms.setdefault(key, [0] * len(state))
+            for index, value in enumerate(state):
+                total[index] += value
+    return counters, histograms
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def render_text(snapshots):
+    """Prometheus text exposition of the merged snapshots"""
+    counters, histograms = _merge(snapshots)
+    lines = []
+    for name, (kind, help_text, label_names, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(label_names, labels)} {value:g}')
+            continue
+        for (metric, labels), state in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, state):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(label_names, labels, [("le", f"{bound:g}")])} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(label_names, labels, [("le", "+Inf")])} {state[-1]}')
+            lines.append(f'{name}_sum{_labels(label_names, labels)} {state[-2]:g}')
+            lines.append(f'{name}_count{_labels(label_names, labels)} {state[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryTimer:
+    """execute_wrapper counting and timing the queries of one request"""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            observe('lacteos_db_query_duration_seconds', elapsed, (self.alias,))
+
+
+class MetricsMiddleware:
+    """Record request count, latency and SQL time per URL name"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timers = []
+        with ExitStack() as stack:
+            for connection in connections.all():
+                timer = QueryTimer(connection.alias)
+                timers.append(timer)
+                stack.enter_context(connection.execute_wrapper(timer))
+            started = time.perf_counter()
+            response = self.get_response(request)
+            elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        inc('lacteos_http_requests_total', (view, method, f'{response.status_code // 100}xx'))
+        observe('lacteos_http_request_duration_seconds', elapsed, (view,))
+        inc('lacteos_db_queries_total', (view,), sum(timer.count for timer in timers))
+        inc('lacteos_db_time_seconds_total', (view,), sum(timer.seconds for timer in timers))
+        registry.flush()
+        return response
@@ -0,0 +1,32 @@
+from django.conf import settings
+
+from .routers import replica_configured, reset_write_flag, wrote_to_primary
+
+
+REPLICA_STICKY_COOKIE = 'lacteos_primary'
+
+
+class ReplicaStickyMiddleware:
+    """
+    Pin a client to the primary database for a while after it writes.
+
+    The replica lags behind the primary until the next refresh, so after a
+    write the client gets a short-lived cookie and use_replica views read from
+    the primary until it expires, letting users see their own changes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset_write_flag()
+        response = self.get_response(request)
+        if replica_configured() and wrote_to_primary():
+            response.set_cookie(
+                REPLICA_STICKY_COOKIE,
+                '1',
+                max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 60),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
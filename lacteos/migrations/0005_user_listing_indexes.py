@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 05:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('lacteos', '0004_lacteo_imagen'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='role',
+            field=models.CharField(choices=[('customer', 'Cliente'), ('employee', 'Empleado'), ('admin', 'Administrador')], db_index=True, default='customer', max_length=20),
+        ),
+        # auth_user belongs to django.contrib.auth, so its extra indexes are
+        # created here. NOCASE lets SQLite use them for istartswith (LIKE 'x%').
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS lacteos_user_username_prefix ON auth_user (username COLLATE NOCASE);',
+            'DROP INDEX IF EXISTS lacteos_user_username_prefix;',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS lacteos_user_email_prefix ON auth_user (email COLLATE NOCASE);',
+            'DROP INDEX IF EXISTS lacteos_user_email_prefix;',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS lacteos_user_date_joined ON auth_user (date_joined, id);',
+            'DROP INDEX IF EXISTS lacteos_user_date_joined;',
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.8 on 2026-10-19 05:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lacteos', '0005_user_listing_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlySalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month', unique=True)),
+                ('sale_count', models.IntegerField(default=0)),
+                ('item_count', models.IntegerField(default=0, help_text='Units sold')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_cost', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_profit', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('roi_sum', models.DecimalField(decimal_places=2, default=0, help_text='Sum of per-sale ROI, for averages', max_digits=16)),
+            ],
+            options={
+                'verbose_name_plural': 'Monthly Sales Summaries',
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedSale',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('sale_date', models.DateTimeField(db_index=True)),
+                ('customer_name', models.CharField(blank=True, max_length=100)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('total_cost', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('total_profit', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('roi', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('notes', models.TextField(blank=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-sale_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedSaleItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('lacteo_name', models.CharField(help_text='Product name at archive time', max_length=100)),
+                ('quantity', models.IntegerField()),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('cost_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('subtotal', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('cost_subtotal', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('profit', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('lacteo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='lacteos.lacteo')),
+                ('sale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='lacteos.archivedsale')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lacteos', '0007_lacteo_updated_at_sale_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lacteo',
+            name='category',
+            field=models.CharField(db_index=True, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='lacteo',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
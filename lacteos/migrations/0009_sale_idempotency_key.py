@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 05:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lacteos', '0008_lacteo_api_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Client supplied key that makes checkout retries safe', max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-19 05:47
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lacteos', '0010_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(help_text='Hash of the normalized SQL', max_length=40, unique=True)),
+                ('sql', models.TextField(help_text='Normalized SQL')),
+                ('example', models.TextField(blank=True, help_text='Last slow occurrence with its parameters')),
+                ('view', models.CharField(blank=True, help_text='URL name of the last view that ran it', max_length=200)),
+                ('alias', models.CharField(default='default', max_length=50)),
+                ('plan', models.TextField(blank=True, help_text='EXPLAIN QUERY PLAN output')),
+                ('full_scan', models.BooleanField(db_index=True, default=False)),
+                ('count', models.IntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('first_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'Slow queries',
+                'ordering': ['-total_ms'],
+            },
+        ),
+    ]
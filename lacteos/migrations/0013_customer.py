@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-19 05:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lacteos', '0012_sale_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Name as first entered', max_length=100)),
+                ('key', models.CharField(help_text='Lowercase name without accents or extra spaces', max_length=100, unique=True)),
+                ('order_count', models.IntegerField(default=0)),
+                ('lifetime_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('lifetime_profit', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('first_purchase', models.DateTimeField(blank=True, null=True)),
+                ('last_purchase', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+                'indexes': [models.Index(fields=['-lifetime_revenue'], name='lacteos_customer_revenue_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='customer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales', to='lacteos.customer'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:02
+
+import django.db.models.deletion
+import lacteos.routers
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lacteos', '0014_change_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedsale',
+            name='branch',
+            field=models.CharField(default=lacteos.routers.current_branch, max_length=30),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='branch',
+            field=models.CharField(default=lacteos.routers.current_branch, help_text='Shop where the sale was made', max_length=30),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='branch',
+            field=models.CharField(blank=True, help_text='Shop the user sells at; empty for the main shop', max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='archivedsale',
+            name='created_by',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='archivedsaleitem',
+            name='lacteo',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='lacteos.lacteo'),
+        ),
+        migrations.AlterField(
+            model_name='sale',
+            name='created_by',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='sale',
+            name='customer',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales', to='lacteos.customer'),
+        ),
+        migrations.AlterField(
+            model_name='saleitem',
+            name='lacteo',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, to='lacteos.lacteo'),
+        ),
+    ]
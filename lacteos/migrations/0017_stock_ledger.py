@@ -0,0 +1,77 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def opening_balances(apps, schema_editor):
+    """Start the ledger with each product's current stock as an adjustment"""
+    Lacteo = apps.get_model('lacteos', 'Lacteo')
+    StockMovement = apps.get_model('lacteos', 'StockMovement')
+    db = schema_editor.connection.alias
+    StockMovement.objects.using(db).bulk_create([
+        StockMovement(lacteo_id=pk, kind='adjustment', quantity=stock, note='Opening balance')
+        for pk, stock in Lacteo.objects.using(db).exclude(stock=0).values_list('pk', 'stock').iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lacteos', '0016_price_history_changed_at_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sale', 'Venta'), ('restock', 'Reposición'), ('adjustment', 'Ajuste')], max_length=20)),
+                ('quantity', models.IntegerField(help_text='Units added, negative for units taken out')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('sale_id', models.BigIntegerField(blank=True, help_text='Sale that took the units out', null=True)),
+                ('note', models.CharField(blank=True, max_length=200)),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(db_index=True, help_text='Includes the movements made before this moment')),
+                ('stock', models.IntegerField()),
+            ],
+            options={
+                'ordering': ['-taken_at', 'lacteo'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='pricehistory',
+            index=models.Index(fields=['lacteo', 'changed_at'], name='lacteos_price_product_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='lacteo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='lacteos.lacteo'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='lacteo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lacteos.lacteo'),
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('taken_at', 'lacteo'), name='lacteos_snapshot_product_unique'),
+        ),
+        migrations.RunPython(opening_balances, migrations.RunPython.noop, hints={'model_name': 'stockmovement'}),
+    ]
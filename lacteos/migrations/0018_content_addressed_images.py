@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:18
+
+import lacteos.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lacteos', '0017_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lacteo',
+            name='imagen',
+            field=models.ImageField(default=None, null=True, storage=lacteos.storage.product_image_storage, upload_to='productos/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lacteos', '0018_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='checkout',
+            field=models.BooleanField(default=False, help_text='Made at checkout, which takes its units out of stock; mock and admin sales are not'),
+        ),
+    ]
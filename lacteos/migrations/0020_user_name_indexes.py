@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 07:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('lacteos', '0019_sale_checkout'),
+    ]
+
+    operations = [
+        # Name prefix search in user management, see 0005 for the other auth_user indexes
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS lacteos_user_first_name_prefix ON auth_user (first_name COLLATE NOCASE);',
+            'DROP INDEX IF EXISTS lacteos_user_first_name_prefix;',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS lacteos_user_last_name_prefix ON auth_user (last_name COLLATE NOCASE);',
+            'DROP INDEX IF EXISTS lacteos_user_last_name_prefix;',
+        ),
+    ]
@@ -1,21 +1,25 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from decimal import Decimal
+from .routers import current_branch
+from .storage import product_image_storage
 
 
 class Lacteo(models.Model):
     name = models.CharField(max_length=100)
-    category = models.CharField(max_length=50)
+    category = models.CharField(max_length=50, db_index=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.IntegerField()
     unit = models.CharField(max_length=20)
     expiration_date = models.DateField()
     description = models.TextField(blank=True)
     cost_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Purchase cost per unit")
-    imagen = models.ImageField(upload_to='productos/', null=True, default=None)
+    imagen = models.ImageField(upload_to='productos/', storage=product_image_storage, null=True, default=None)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -31,18 +35,50 @@ class Lacteo(models.Model):
         return self.price - self.cost_price
 
 
+class Customer(models.Model):
+    """A buyer, identified by the normalized form of the name typed at checkout"""
+    name = models.CharField(max_length=100, help_text="Name as first entered")
+    key = models.CharField(max_length=100, unique=True, help_text="Lowercase name without accents or extra spaces")
+    order_count = models.IntegerField(default=0)
+    lifetime_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    lifetime_profit = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    first_purchase = models.DateTimeField(null=True, blank=True)
+    last_purchase = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+        indexes = [
+            models.Index(fields=['-lifetime_revenue'], name='lacteos_customer_revenue_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
 class Sale(models.Model):
-    sale_date = models.DateTimeField(default=timezone.now)
+    # Sales live in their branch's database (lacteos.routers.BranchRouter), so references
+    # to shared tables in the default database carry no database constraint
+    branch = models.CharField(max_length=30, default=current_branch, help_text="Shop where the sale was made")
+    sale_date = models.DateTimeField(default=timezone.now, db_index=True)
     customer_name = models.CharField(max_length=100, blank=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     total_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total_profit = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     roi = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Return on Investment percentage")
-    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False)
     notes = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, unique=True, help_text="Client supplied key that makes checkout retries safe")
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True, related_name='sales', db_constraint=False)
+    checkout = models.BooleanField(default=False, help_text="Made at checkout, which takes its units out of stock; mock and admin sales are not")
 
     class Meta:
         ordering = ['-sale_date']
+        indexes = [
+            # "My purchases" and per-employee reports: one user's sales by date
+            models.Index(fields=['created_by', 'sale_date'], name='lacteos_sale_user_date_idx'),
+        ]
 
     def __str__(self):
         return f"Sale #{self.id} - {self.sale_date.strftime('%Y-%m-%d %H:%M')}"
@@ -62,7 +98,7 @@ class Sale(models.Model):
 
 class SaleItem(models.Model):
     sale = models.ForeignKey(Sale, on_delete=models.CASCADE)
-    lacteo = models.ForeignKey(Lacteo, on_delete=models.PROTECT)
+    lacteo = models.ForeignKey(Lacteo, on_delete=models.PROTECT, db_constraint=False)
     quantity = models.IntegerField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     cost_price = models.DecimalField(max_digits=10, decimal_places=2, help_text="Cost price at time of sale")
@@ -87,13 +123,17 @@ class PriceHistory(models.Model):
     lacteo = models.ForeignKey(Lacteo, on_delete=models.CASCADE, related_name='price_history')
     price = models.DecimalField(max_digits=10, decimal_places=2)
     cost_price = models.DecimalField(max_digits=10, decimal_places=2)
-    changed_at = models.DateTimeField(default=timezone.now)
+    changed_at = models.DateTimeField(default=timezone.now, db_index=True)
     changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     reason = models.CharField(max_length=200, blank=True)
 
     class Meta:
         ordering = ['-changed_at']
         verbose_name_plural = "Price Histories"
+        indexes = [
+            # Price in effect for a product at a past moment (inventory valuation)
+            models.Index(fields=['lacteo', 'changed_at'], name='lacteos_price_product_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.lacteo.name} - {self.price} ({self.changed_at.strftime('%Y-%m-%d')})"
@@ -107,7 +147,8 @@ class UserProfile(models.Model):
     ]
     
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
-    role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='customer')
+    role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='customer', db_index=True)
+    branch = models.CharField(max_length=30, blank=True, help_text="Shop the user sells at; empty for the main shop")
     phone = models.CharField(max_length=20, blank=True)
     address = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -144,3 +185,199 @@ def save_user_profile(sender, instance, **kwargs):
         instance.profile.save()
     else:
         UserProfile.objects.get_or_create(user=instance)
+
+
+class MonthlySalesSummary(models.Model):
+    """Compacted totals of archived sales, one row per calendar month"""
+    month = models.DateField(unique=True, help_text="First day of the month")
+    sale_count = models.IntegerField(default=0)
+    item_count = models.IntegerField(default=0, help_text="Units sold")
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_profit = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    roi_sum = models.DecimalField(max_digits=16, decimal_places=2, default=0, help_text="Sum of per-sale ROI, for averages")
+
+    class Meta:
+        ordering = ['-month']
+        verbose_name_plural = "Monthly Sales Summaries"
+
+    def __str__(self):
+        return f"{self.month.strftime('%Y-%m')} - {self.sale_count} sales"
+
+
+class ArchivedSale(models.Model):
+    """A Sale moved out of the live table by the archive_sales command"""
+    id = models.BigIntegerField(primary_key=True)
+    branch = models.CharField(max_length=30, default=current_branch)
+    sale_date = models.DateTimeField(db_index=True)
+    customer_name = models.CharField(max_length=100, blank=True)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    total_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total_profit = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    roi = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_constraint=False)
+    notes = models.TextField(blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-sale_date']
+
+    def __str__(self):
+        return f"Archived sale #{self.id} - {self.sale_date.strftime('%Y-%m-%d %H:%M')}"
+
+
+class ArchivedSaleItem(models.Model):
+    """A SaleItem moved out of the live table together with its sale"""
+    id = models.BigIntegerField(primary_key=True)
+    sale = models.ForeignKey(ArchivedSale, on_delete=models.CASCADE, related_name='items')
+    lacteo = models.ForeignKey(Lacteo, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_constraint=False)
+    lacteo_name = models.CharField(max_length=100, help_text="Product name at archive time")
+    quantity = models.IntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    cost_price = models.DecimalField(max_digits=10, decimal_places=2)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    cost_subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    profit = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.lacteo_name} x{self.quantity} - Archived sale #{self.sale_id}"
+
+
+class Job(models.Model):
+    """A unit of background work, picked up by the run_workers command"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pendiente'),
+        (RUNNING, 'En ejecución'),
+        (DONE, 'Completado'),
+        (FAILED, 'Fallido'),
+    ]
+
+    name = models.CharField(max_length=100, help_text="Registered job name")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='lacteos_job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+
+class SlowQuery(models.Model):
+    """A query shape that ran over SLOW_QUERY_MS, aggregated by fingerprint"""
+    fingerprint = models.CharField(max_length=40, unique=True, help_text="Hash of the normalized SQL")
+    sql = models.TextField(help_text="Normalized SQL")
+    example = models.TextField(blank=True, help_text="Last slow occurrence with its parameters")
+    view = models.CharField(max_length=200, blank=True, help_text="URL name of the last view that ran it")
+    alias = models.CharField(max_length=50, default='default')
+    plan = models.TextField(blank=True, help_text="EXPLAIN QUERY PLAN output")
+    full_scan = models.BooleanField(default=False, db_index=True)
+    count = models.IntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-total_ms']
+        verbose_name_plural = 'Slow queries'
+
+    def __str__(self):
+        return f"{self.sql[:80]} ({self.count}x)"
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.count if self.count else 0
+
+
+
+class ChangeEvent(models.Model):
+    """
+    One write to Lacteo, Sale, SaleItem or PriceHistory, for downstream sync.
+
+    The id is the feed's sequence number: readers ask for events after the
+    last id they processed (see lacteos.changes).
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ARCHIVE = 'archive'
+    OPERATION_CHOICES = [
+        (CREATE, 'Creado'),
+        (UPDATE, 'Modificado'),
+        (DELETE, 'Eliminado'),
+        (ARCHIVE, 'Archivado'),
+    ]
+
+    model = models.CharField(max_length=20, help_text="lacteo, sale, sale_item or price_history")
+    object_id = models.BigIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder, help_text="Row after the write; empty for deletes")
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.id} {self.operation} {self.model} {self.object_id}"
+
+
+class StockMovement(models.Model):
+    """
+    One change to a product's stock. Lacteo.stock is the running sum of its
+    movements, written in the same transaction (see lacteos.inventory).
+    """
+    SALE = 'sale'
+    RESTOCK = 'restock'
+    ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = [
+        (SALE, 'Venta'),
+        (RESTOCK, 'Reposición'),
+        (ADJUSTMENT, 'Ajuste'),
+    ]
+
+    lacteo = models.ForeignKey(Lacteo, on_delete=models.CASCADE, related_name='stock_movements')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    quantity = models.IntegerField(help_text="Units added, negative for units taken out")
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    # Sales live in their branch database, so this is a plain id (unique across branches)
+    sale_id = models.BigIntegerField(null=True, blank=True, help_text="Sale that took the units out")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    note = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+
+    def __str__(self):
+        return f"{self.lacteo_id} {self.kind} {self.quantity:+d} ({self.created_at.strftime('%Y-%m-%d %H:%M')})"
+
+
+class StockSnapshot(models.Model):
+    """Stock of a product at taken_at, a checkpoint that valuations start from"""
+    taken_at = models.DateTimeField(db_index=True, help_text="Includes the movements made before this moment")
+    lacteo = models.ForeignKey(Lacteo, on_delete=models.CASCADE, related_name='+')
+    stock = models.IntegerField()
+
+    class Meta:
+        ordering = ['-taken_at', 'lacteo']
+        constraints = [
+            models.UniqueConstraint(fields=['taken_at', 'lacteo'], name='lacteos_snapshot_product_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.lacteo_id}: {self.stock} at {self.taken_at.strftime('%Y-%m-%d %H:%M')}"
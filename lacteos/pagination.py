@@ -0,0 +1,187 @@
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+COUNT_CACHE_TIMEOUT = 60
+# Below this many rows an exact COUNT(*) is cheap and an estimate not worth it
+ESTIMATE_MIN_ROWS = 10000
+
+
+def encode_cursor(*values):
+    """Encode the sort key of the last row of a page as an opaque token"""
+    raw = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a token produced by encode_cursor, or None if it is invalid"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list):
+        return None
+    return values
+
+
+class KeysetPage:
+    """One page of a keyset paginated queryset"""
+
+    def __init__(self, items, next_cursor, last_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        # Cursor after the last row, to resume later even when this was the last page
+        self.last_cursor = last_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _row_value(row, field):
+    """Read field from a model instance or a values() dict"""
+    if isinstance(row, dict):
+        return row['id' if field == 'pk' else field]
+    return getattr(row, field)
+
+
+def row_cursor(row, field):
+    value = _row_value(row, field)
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return encode_cursor(value, _row_value(row, 'pk'))
+
+
+def _cursor_key(queryset, field, values):
+    """(field value, pk) of a decoded cursor converted to the column types, or None if they do not fit"""
+    if not values or len(values) != 2:
+        return None
+    meta = queryset.model._meta
+    try:
+        model_field = meta.pk if field == 'pk' else meta.get_field(field)
+        return model_field.to_python(values[0]), int(values[1])
+    except (FieldDoesNotExist, ValidationError, ValueError, TypeError):
+        return None
+
+
+def keyset_paginate(queryset, field, cursor=None, per_page=50, descending=True):
+    """
+    Paginate by (field, pk) instead of OFFSET so every page is an index seek.
+
+    The cursor holds the field value and pk of the last row already shown;
+    the next page starts strictly after it. Works on values() querysets as
+    long as field and id are among the selected columns.
+    """
+    if descending:
+        queryset = queryset.order_by(f'-{field}', '-pk')
+        after = 'lt'
+    else:
+        queryset = queryset.order_by(field, 'pk')
+        after = 'gt'
+
+    # A tampered or stale cursor starts over at the first page
+    key = _cursor_key(queryset, field, decode_cursor(cursor))
+    if key is not None:
+        value, pk = key
+        queryset = queryset.filter(
+            Q(**{f'{field}__{after}': value}) |
+            Q(**{field: value, f'pk__{after}': pk})
+        )
+    else:
+        cursor = None
+
+    items = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = row_cursor(items[-1], field)
+    last_cursor = row_cursor(items[-1], field) if items else cursor
+    return KeysetPage(items, next_cursor, last_cursor)
+
+
+def cached_count(queryset, timeout=COUNT_CACHE_TIMEOUT):
+    """
+    Return queryset.count(), reusing a recent result for the same query.
+
+    Exact counts on large tables are a full scan; listings only need an
+    approximate total, so a count a minute old is good enough.
+    """
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        # none() or an empty __in, which matches nothing without a query
+        return 0
+    digest = hashlib.sha1(f'{queryset.db}:{sql}:{params}'.encode()).hexdigest()
+    key = f'lacteos:count:{digest}'
+    total = cache.get(key)
+    if total is None:
+        total = queryset.count()
+        cache.set(key, total, timeout)
+    return total
+
+
+def estimated_table_rows(queryset):
+    """
+    Row count of an unfiltered queryset's table from the database statistics,
+    or None when the query is filtered or no estimate is available.
+
+    PostgreSQL keeps one in pg_class.reltuples; SQLite in sqlite_stat1 once
+    ANALYZE has run. Both are refreshed by (auto)vacuum/ANALYZE, not per write.
+    """
+    query = queryset.query
+    if query.where or query.combinator or query.distinct or query.is_sliced:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+                row = cursor.fetchone()
+                rows = row[0] if row else None
+            elif connection.vendor == 'sqlite':
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                rows = int(row[0].split()[0]) if row else None
+            else:
+                return None
+    except DatabaseError:
+        # sqlite_stat1 does not exist before the first ANALYZE
+        return None
+    if rows is None or rows < ESTIMATE_MIN_ROWS:
+        return None
+    return rows
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator whose total is estimated instead of counted on every page.
+
+    Unfiltered lists take the planner's row estimate, filtered ones a
+    cached_count() at most a minute old, so paging through a large table
+    does not run COUNT(*) on each request.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimated_table_rows(self.object_list)
+        if estimate is not None:
+            return estimate
+        return cached_count(self.object_list)
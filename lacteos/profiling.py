@@ -0,0 +1,202 @@
+"""
+Opt-in per-request profiling.
+
+ProfilingMiddleware runs cProfile around the rest of the request for a
+random sample of requests, or for requests carrying a header signed for an
+admin (see profile_token). SQL queries are timed with execute_wrapper.
+Each profile is written to PROFILING_DIR as a .prof file for pstats or
+snakeviz, plus a .json summary that the profiles admin page lists.
+
+With PROFILING_ENABLED off the middleware raises MiddlewareNotUsed, so
+Django drops it from the chain and requests pay nothing.
+"""
+import cProfile
+import io
+import json
+import pstats
+import random
+import re
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from uuid import uuid4
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+
+PROFILE_HEADER = 'X-Lacteos-Profile'
+PROFILE_ID_HEADER = 'X-Lacteos-Profile-Id'
+TOKEN_SALT = 'lacteos.profiling'
+PROFILE_NAME_RE = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$')
+MAX_RECORDED_QUERIES = 500
+STATS_LINES = 40
+
+# cProfile cannot run two profilers at once, concurrent requests go unprofiled
+_profiler_lock = threading.Lock()
+
+
+def profiles_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def profile_token(user):
+    """Value of the profiling header for this admin, valid for PROFILING_TOKEN_MAX_AGE"""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def _token_user_id(token):
+    max_age = getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 60 * 60)
+    try:
+        return int(signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=max_age))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+class QueryRecorder:
+    """execute_wrapper that times every query run on one connection"""
+
+    def __init__(self, alias, queries):
+        self.alias = alias
+        self.queries = queries
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': self.alias,
+                'sql': sql,
+                'many': many,
+                'ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+
+
+class ProfilingMiddleware:
+    """Profile sampled or admin-requested requests, see the module docstring"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+
+    def _trigger(self, request):
+        token = request.headers.get(PROFILE_HEADER)
+        if token:
+            from .models import UserProfile
+            user_id = _token_user_id(token)
+            if user_id and UserProfile.objects.filter(user_id=user_id, role='admin').exists():
+                return f'header:{user_id}'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def __call__(self, request):
+        trigger = self._trigger(request)
+        if trigger is None or not _profiler_lock.acquire(blocking=False):
+            return self.get_response(request)
+
+        try:
+            queries = []
+            profiler = cProfile.Profile()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(QueryRecorder(connection.alias, queries)))
+                started_at = timezone.now()
+                started = time.perf_counter()
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+                    duration = time.perf_counter() - started
+        finally:
+            _profiler_lock.release()
+
+        name = save_profile(profiler, {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': request.resolver_match.view_name if request.resolver_match else '',
+            'status': response.status_code,
+            'trigger': trigger,
+            'started_at': started_at.isoformat(),
+            'duration_ms': round(duration * 1000, 1),
+        }, queries)
+        response[PROFILE_ID_HEADER] = name
+        return response
+
+
+def save_profile(profiler, summary, queries):
+    """Write the .prof and .json files of one profile, returns its name"""
+    directory = profiles_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{timezone.now():%Y%m%d-%H%M%S}-{uuid4().hex[:8]}"
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(STATS_LINES)
+
+    seen = {}
+    for query in queries:
+        seen[query['sql']] = seen.get(query['sql'], 0) + 1
+    summary.update({
+        'name': name,
+        'sql_count': len(queries),
+        'sql_ms': round(sum(query['ms'] for query in queries), 1),
+        'sql_repeated': sum(count - 1 for count in seen.values()),
+        'queries': sorted(queries, key=lambda query: -query['ms'])[:MAX_RECORDED_QUERIES],
+        'stats': stream.getvalue(),
+    })
+
+    stats.dump_stats(directory / f'{name}.prof')
+    (directory / f'{name}.json').write_text(json.dumps(summary))
+    prune_profiles(directory)
+    return name
+
+
+def prune_profiles(directory=None):
+    """Keep only the newest PROFILING_KEEP profiles"""
+    directory = directory or profiles_dir()
+    keep = getattr(settings, 'PROFILING_KEEP', 200)
+    for old in sorted(directory.glob('*.json'), reverse=True)[keep:]:
+        old.unlink(missing_ok=True)
+        old.with_suffix('.prof').unlink(missing_ok=True)
+
+
+def list_profiles():
+    """Summaries of stored profiles, slowest first, without queries and stats"""
+    directory = profiles_dir()
+    if not directory.is_dir():
+        return []
+    profiles = []
+    for path in directory.glob('*.json'):
+        try:
+            summary = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        summary.pop('queries', None)
+        summary.pop('stats', None)
+        profiles.append(summary)
+    profiles.sort(key=lambda summary: -summary.get('duration_ms', 0))
+    return profiles
+
+
+def profile_path(name, suffix):
+    """Path of a stored profile file, or None for unknown or malformed names"""
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    path = profiles_dir() / f'{name}{suffix}'
+    return path if path.is_file() else None
+
+
+def read_profile(name):
+    path = profile_path(name, '.json')
+    if path is None:
+        return None
+    return json.loads(path.read_text())
@@ -0,0 +1,209 @@
+"""
+Set-based checks and fixes for Sale totals.
+
+Sale.calculate_totals() fixes one sale at a time in Python. These helpers do
+the same arithmetic in SQL over a range of ids: one grouped query finds the
+sales whose stored totals disagree with their items, and two UPDATEs with
+correlated subqueries rewrite them.
+
+A checkout commits the sale in its branch database first and the stock,
+ledger and customer totals in the default one second. When that second
+commit fails the sale is left unbooked: unbooked_sale_ids() finds such
+sales, marked Sale.checkout in the branch transaction but without SALE
+stock movements, and book_sales() writes what the lost commit would have.
+Mock and admin sales never touch stock and are not marked, so they are
+left alone. A sale is only booked while there is stock for all of it.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Case, DecimalField, ExpressionWrapper, F, Min, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Abs, Coalesce, Round
+from django.utils import timezone
+
+from . import changes
+from .customers import adjust_totals, record_sales, total_changes
+from .inventory import backdate_movements, sale_movements
+from .models import Lacteo, Sale, SaleItem, StockMovement
+
+
+logger = logging.getLogger(__name__)
+
+MONEY = DecimalField(max_digits=10, decimal_places=2)
+MONEY_TOLERANCE = Decimal('0.005')
+# calculate_totals rounds half-even while SQL ROUND rounds half-up
+ROI_TOLERANCE = Decimal('0.011')
+# Newer sales may still be committing to the default database
+UNBOOKED_GRACE = timedelta(minutes=5)
+
+
+def _money(expression):
+    return Coalesce(Round(expression, 2), Value(Decimal('0')), output_field=MONEY)
+
+
+def _roi(amount, cost):
+    """Same formula as calculate_totals: profit / cost * 100, or 0 without cost"""
+    return Case(
+        When(**{f'{cost}__gt': 0}, then=Round(
+            ExpressionWrapper((F(amount) - F(cost)) * Value(100.0) / F(cost), output_field=MONEY), 2
+        )),
+        default=Value(Decimal('0')),
+        output_field=MONEY,
+    )
+
+
+def _item_total(field):
+    """Correlated subquery summing one SaleItem column for the outer sale"""
+    return Subquery(
+        SaleItem.objects.filter(sale=OuterRef('pk'))
+        .order_by()
+        .values('sale')
+        .annotate(total=Round(Sum(field), 2))
+        .values('total'),
+        output_field=MONEY,
+    )
+
+
+def drifted_sale_ids(start_id, end_id):
+    """Ids in [start_id, end_id) whose stored totals disagree with their items"""
+    return list(
+        Sale.objects.filter(pk__gte=start_id, pk__lt=end_id)
+        .order_by()
+        .annotate(
+            item_amount=_money(Sum('saleitem__subtotal')),
+            item_cost=_money(Sum('saleitem__cost_subtotal')),
+        )
+        .annotate(
+            expected_roi=_roi('item_amount', 'item_cost'),
+            amount_drift=Abs(F('total_amount') - F('item_amount')),
+            cost_drift=Abs(F('total_cost') - F('item_cost')),
+            profit_drift=Abs(F('total_profit') - (F('item_amount') - F('item_cost'))),
+        )
+        .annotate(roi_drift=Abs(F('roi') - F('expected_roi')))
+        .filter(
+            Q(amount_drift__gte=MONEY_TOLERANCE) |
+            Q(cost_drift__gte=MONEY_TOLERANCE) |
+            Q(profit_drift__gte=MONEY_TOLERANCE) |
+            Q(roi_drift__gte=ROI_TOLERANCE)
+        )
+        .values_list('id', flat=True)
+    )
+
+
+def fix_sale_totals(sale_ids):
+    """
+    Rewrite the totals of the given sales from their items, and their
+    customers' lifetime totals by the difference; returns rows updated.
+    """
+    if not sale_ids:
+        return 0
+    sales = Sale.objects.filter(pk__in=sale_ids)
+
+    def totals():
+        rows = sales.values_list('id', 'customer_id', 'total_amount', 'total_profit')
+        return {sale_id: (customer_id, amount, profit) for sale_id, customer_id, amount, profit in rows}
+
+    # Customers are in the default database: both commit or neither, the branch first as at checkout
+    with transaction.atomic(), transaction.atomic(using=sales.db, savepoint=False):
+        before = totals()
+        updated = sales.update(
+            total_amount=Coalesce(_item_total('subtotal'), Value(Decimal('0')), output_field=MONEY),
+            total_cost=Coalesce(_item_total('cost_subtotal'), Value(Decimal('0')), output_field=MONEY),
+            updated_at=timezone.now(),
+        )
+        # A second statement, so profit and ROI see the new amount and cost
+        sales.update(
+            total_profit=F('total_amount') - F('total_cost'),
+            roi=_roi('total_amount', 'total_cost'),
+        )
+        changes.record_rows(Sale, sale_ids, using=sales.db)
+        # The customers were credited with the old totals
+        adjust_totals(total_changes(before, totals()))
+    return updated
+
+
+def ledger_start():
+    """When the stock ledger began; older sales never had movements"""
+    return StockMovement.objects.aggregate(first=Min('created_at'))['first']
+
+
+def unbooked_sale_ids(start_id, end_id, since):
+    """
+    Ids in [start_id, end_id) of the current branch's checkout sales made
+    since since that have items but no SALE stock movement.
+    """
+    sale_ids = list(
+        Sale.objects.filter(
+            pk__gte=start_id, pk__lt=end_id, checkout=True,
+            sale_date__gte=since, sale_date__lt=timezone.now() - UNBOOKED_GRACE,
+            saleitem__isnull=False,
+        )
+        .order_by().distinct().values_list('id', flat=True)
+    )
+    if not sale_ids:
+        return []
+    booked = set(
+        StockMovement.objects.filter(kind=StockMovement.SALE, sale_id__in=sale_ids)
+        .order_by().values_list('sale_id', flat=True).distinct()
+    )
+    return [sale_id for sale_id in sale_ids if sale_id not in booked]
+
+
+def book_sales(sale_ids):
+    """
+    Take the units of the current branch's unbooked checkout sales out of
+    stock, with their SALE movements (dated at the sale) and customer totals.
+    A sale that would take a product below zero is skipped. Returns the
+    sales booked.
+    """
+    sales = list(
+        Sale.objects.filter(pk__in=sale_ids, checkout=True)
+        .only('id', 'customer', 'total_amount', 'total_profit', 'sale_date', 'created_by')
+        .order_by('sale_date', 'id')
+    )
+    quantities = {}
+    items = SaleItem.objects.filter(sale_id__in=sale_ids).values_list('sale_id', 'lacteo_id', 'quantity')
+    for sale_id, product_id, quantity in items:
+        sold = quantities.setdefault(sale_id, {})
+        sold[product_id] = sold.get(product_id, 0) + quantity
+
+    with transaction.atomic():
+        product_ids = {product_id for sold in quantities.values() for product_id in sold}
+        remaining = dict(Lacteo.objects.select_for_update().filter(pk__in=product_ids).values_list('pk', 'stock'))
+        # Another run may have booked some meanwhile
+        booked = set(
+            StockMovement.objects.filter(kind=StockMovement.SALE, sale_id__in=sale_ids).values_list('sale_id', flat=True)
+        )
+        movements = []
+        totals = {}
+        booking = []
+        for sale in sales:
+            sold = quantities.get(sale.pk)
+            if sale.pk in booked or not sold:
+                continue
+            if any(quantity > remaining.get(product_id, 0) for product_id, quantity in sold.items()):
+                logger.warning('Not booking sale #%s, there is not enough stock left for it', sale.pk)
+                continue
+            for product_id, quantity in sold.items():
+                remaining[product_id] -= quantity
+                totals[product_id] = totals.get(product_id, 0) + quantity
+            # Dated at the sale, so valuations of past moments count them where they happened
+            for movement in sale_movements(sale.pk, sold, created_at=sale.sale_date):
+                movement.created_by_id = sale.created_by_id
+                movements.append(movement)
+            booking.append(sale)
+        if not booking:
+            return 0
+        Lacteo.objects.filter(pk__in=totals).update(
+            stock=Case(*[When(pk=pk, then=F('stock') - quantity) for pk, quantity in totals.items()]),
+            updated_at=timezone.now(),
+        )
+        changes.record_rows(Lacteo, totals)
+        StockMovement.objects.bulk_create(movements)
+        backdate_movements(movements)
+        record_sales(booking)
+    return len(booking)
@@ -0,0 +1,161 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+REPLICA_ALIAS = 'replica'
+# Models whose rows live in the database of their branch
+SHARDED_MODELS = {
+    'sale', 'saleitem', 'archivedsale', 'archivedsaleitem', 'monthlysalessummary', 'changeevent',
+}
+# Apps whose writes don't pin a client to the primary: saving a session changes nothing
+# the replica serves, and would otherwise keep every logged-in user off the replica
+STICKY_EXEMPT_APPS = {'sessions'}
+
+_use_replica = ContextVar('lacteos_use_replica', default=False)
+_wrote = ContextVar('lacteos_wrote', default=False)
+_branch = ContextVar('lacteos_branch', default=None)
+
+
+class UnknownBranch(Exception):
+    pass
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def replica_reads():
+    """Send reads issued inside the block to the replica, when one is configured"""
+    token = _use_replica.set(replica_configured())
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def reset_write_flag():
+    _wrote.set(False)
+
+
+def wrote_to_primary():
+    """Whether the current request has routed a write to the primary"""
+    return _wrote.get()
+
+
+def default_branch():
+    return getattr(settings, 'DEFAULT_BRANCH', 'principal')
+
+
+def branch_databases():
+    """{branch: database alias}, the main shop first"""
+    return getattr(settings, 'BRANCH_DATABASES', None) or {default_branch(): 'default'}
+
+
+def current_branch():
+    """Branch entered with branch_scope(), the main shop outside of one"""
+    return _branch.get() or default_branch()
+
+
+def branch_database(branch=None):
+    """Database alias holding branch's sales, the current branch's by default"""
+    branch = branch or current_branch()
+    try:
+        return branch_databases()[branch]
+    except KeyError:
+        raise UnknownBranch(f'Unknown branch {branch!r}') from None
+
+
+@contextmanager
+def branch_scope(branch):
+    """Send per-branch models used inside the block to branch's database"""
+    branch_database(branch)
+    token = _branch.set(branch)
+    try:
+        yield
+    finally:
+        _branch.reset(token)
+
+
+def is_sharded(model):
+    """Whether a model (or instance of it) is stored per branch"""
+    return model._meta.app_label == 'lacteos' and model._meta.model_name in SHARDED_MODELS
+
+
+class BranchRouter:
+    """
+    Route sales and the other per-branch models to their branch's database.
+
+    Rows read from a branch database stay with it (the instance hint), so
+    related lookups and saves follow them; anything else goes to the branch
+    entered with branch_scope(). The main shop's database is left to
+    ReplicaRouter, which may serve its reads from the replica.
+    """
+
+    def _database(self, model, hints):
+        if not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None and is_sharded(instance) and instance._state.db:
+            database = instance._state.db
+        else:
+            database = branch_database()
+        if database in ('default', REPLICA_ALIAS):
+            return None
+        return database
+
+    def db_for_read(self, model, **hints):
+        return self._database(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._database(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        sharded = is_sharded(obj1), is_sharded(obj2)
+        if not any(sharded):
+            return None
+        if all(sharded):
+            databases = {obj1._state.db, obj2._state.db}
+            if databases <= {'default', REPLICA_ALIAS}:
+                return None
+            return len(databases) == 1
+        # A branch's rows may point at the shared catalog, users and customers
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == 'default' or db not in branch_databases().values():
+            return None
+        return app_label == 'lacteos' and model_name in SHARDED_MODELS
+
+
+class ReplicaRouter:
+    """
+    Route reporting reads to the read-only replica and everything else to default.
+
+    Reads only go to the replica inside replica_reads(), which the use_replica
+    view decorator enters. Writes always go to the primary and, except for
+    sessions, are recorded so ReplicaStickyMiddleware can pin the user to the
+    primary for a while.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            return REPLICA_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in STICKY_EXEMPT_APPS:
+            _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', REPLICA_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary refreshed by refresh_replica
+        return db != REPLICA_ALIAS
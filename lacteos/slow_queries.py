@@ -0,0 +1,236 @@
+"""
+Slow-query log.
+
+SlowQueryMiddleware times every query a request runs. Queries that take at
+least SLOW_QUERY_MS are logged with the view that issued them and stored in
+SlowQuery, one row per normalized SQL fingerprint, so the same query with
+different parameters is counted once. The first time a process sees a
+fingerprint it also reads the query plan (EXPLAIN QUERY PLAN on SQLite),
+and flags plans that scan a whole table. The slow_queries command reports
+the worst offenders.
+
+Slow queries show up when the database is busy, so the request does not
+write them: they are summed up in a per-process buffer, and every
+SLOW_QUERY_FLUSH_SECONDS a request hands the buffer to a slow_queries.store
+job (one insert) that the run_workers command stores. Entries still in the
+buffer when a process exits are lost, and a full buffer drops new
+fingerprints until the next flush.
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .jobs import enqueue
+from .models import SlowQuery
+
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+MAX_EXAMPLE_LENGTH = 4000
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_ROWS_RE = re.compile(r'(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+')
+_SPACE_RE = re.compile(r'\s+')
+# SQLite "SCAN table" without an index; PostgreSQL "Seq Scan"
+_FULL_SCAN_RE = re.compile(r'^SCAN (?!CONSTANT ROW)(?!.*\bUSING\b.*\bINDEX\b)|Seq Scan', re.MULTILINE)
+
+# Fingerprints whose plan this process already read
+_explained = set()
+
+# Entries waiting to be stored, by fingerprint; see flush_slow_queries()
+MAX_PENDING = 500
+_pending = {}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def normalize_sql(sql):
+    """SQL with literals, placeholders and value lists collapsed"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('(...)', sql)
+    sql = _ROWS_RE.sub(r'\1, ...', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def explain(alias, sql, params, many=False):
+    """Query plan text for sql, or '' when it cannot be explained"""
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return ''
+    if many:
+        params = params[0] if params else None
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                rows = cursor.fetchall()
+                depth = {0: -1}
+                lines = []
+                for node, parent, _, detail in rows:
+                    depth[node] = depth.get(parent, -1) + 1
+                    lines.append('  ' * depth[node] + detail)
+                return '\n'.join(lines)
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return '\n'.join(str(row[0]) for row in cursor.fetchall())
+    except DatabaseError:
+        logger.debug('Could not explain %s', sql, exc_info=True)
+        return ''
+
+
+def is_full_scan(plan):
+    return bool(_FULL_SCAN_RE.search(plan))
+
+
+class SlowQueryRecorder:
+    """execute_wrapper collecting the queries of one request over the threshold"""
+
+    def __init__(self, alias, threshold_ms, slow):
+        self.alias = alias
+        self.threshold_ms = threshold_ms
+        self.slow = slow
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if elapsed_ms >= self.threshold_ms:
+                self.slow.append((self.alias, sql, params, many, elapsed_ms))
+
+
+def record_slow_queries(slow, view=''):
+    """Log the collected slow queries and fold them into this process's buffer"""
+    for alias, sql, params, many, elapsed_ms in slow:
+        logger.warning('Slow query (%.1f ms) in %s: %s', elapsed_ms, view or '-', sql)
+        normalized = normalize_sql(sql)
+        key = fingerprint(normalized)
+        plan = None
+        if key not in _explained:
+            # Reading the plan takes no write lock, unlike storing it
+            plan = explain(alias, sql, params, many)
+            _explained.add(key)
+
+        with _pending_lock:
+            entry = _pending.get(key)
+            if entry is None:
+                if len(_pending) >= MAX_PENDING:
+                    continue
+                entry = _pending[key] = {
+                    'fingerprint': key, 'sql': normalized, 'count': 0, 'total_ms': 0, 'max_ms': 0,
+                }
+            entry.update(view=view, alias=alias, last_seen=timezone.now().isoformat())
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            if elapsed_ms >= entry['max_ms']:
+                entry.update(max_ms=elapsed_ms, example=f'{sql} -- params: {params!r}'[:MAX_EXAMPLE_LENGTH])
+            if plan is not None:
+                entry.update(plan=plan, full_scan=is_full_scan(plan))
+
+
+def take_pending():
+    """Empty the buffer, returning its entries"""
+    global _last_flush
+    with _pending_lock:
+        entries = list(_pending.values())
+        _pending.clear()
+        _last_flush = time.monotonic()
+    return entries
+
+
+def flush_slow_queries(force=False):
+    """
+    Queue the buffered entries as one slow_queries.store job, at most once
+    per SLOW_QUERY_FLUSH_SECONDS unless force; returns how many were queued.
+    """
+    if not force and time.monotonic() - _last_flush < getattr(settings, 'SLOW_QUERY_FLUSH_SECONDS', 60):
+        return 0
+    entries = take_pending()
+    if entries:
+        enqueue('slow_queries.store', {'entries': entries})
+    return len(entries)
+
+
+def store_slow_queries(entries):
+    """Fold buffered entries into SlowQuery rows, one per fingerprint"""
+    for entry in entries:
+        key = entry['fingerprint']
+        last_seen = parse_datetime(entry['last_seen'])
+        fields = {
+            'view': entry['view'],
+            'alias': entry['alias'],
+            'example': entry['example'],
+            'last_seen': last_seen,
+        }
+        if 'plan' in entry:
+            fields.update(plan=entry['plan'], full_scan=entry['full_scan'])
+        changes = dict(
+            fields,
+            count=F('count') + entry['count'],
+            total_ms=F('total_ms') + entry['total_ms'],
+            max_ms=Greatest('max_ms', Value(entry['max_ms'])),
+        )
+        if SlowQuery.objects.filter(fingerprint=key).update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                SlowQuery.objects.create(
+                    fingerprint=key,
+                    sql=entry['sql'],
+                    count=entry['count'],
+                    total_ms=entry['total_ms'],
+                    max_ms=entry['max_ms'],
+                    first_seen=last_seen,
+                    **fields
+                )
+        except IntegrityError:
+            # Another job stored this fingerprint first
+            SlowQuery.objects.filter(fingerprint=key).update(**changes)
+
+
+class SlowQueryMiddleware:
+    """Collect queries slower than SLOW_QUERY_MS; removed from the chain when it is 0"""
+
+    def __init__(self, get_response):
+        self.threshold_ms = getattr(settings, 'SLOW_QUERY_MS', 0)
+        if not self.threshold_ms:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        slow = []
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(SlowQueryRecorder(connection.alias, self.threshold_ms, slow))
+                )
+            response = self.get_response(request)
+
+        if slow:
+            match = request.resolver_match
+            record_slow_queries(slow, match.view_name if match else '')
+        try:
+            flush_slow_queries()
+        except DatabaseError:
+            logger.exception('Could not queue slow queries')
+        return response
@@ -0,0 +1,87 @@
+import gzip
+import hashlib
+import os
+import posixpath
+import uuid
+
+import brotli
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.storage import FileSystemStorage, storages
+
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.txt', '.json', '.map')
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Fingerprinted static files with precompressed .gz and .br siblings.
+
+    collectstatic writes the variants once so the static view never has to
+    compress on the fly.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                self.write_compressed(name)
+
+    def write_compressed(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        variants = [
+            ('.gz', gzip.compress(content, compresslevel=9, mtime=0)),
+            ('.br', brotli.compress(content)),
+        ]
+        for suffix, compressed in variants:
+            # Tiny files can grow when compressed, serve those as they are
+            if len(compressed) < len(content):
+                with open(self.path(name + suffix), 'wb') as handle:
+                    handle.write(compressed)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that names uploads after the SHA-256 of their content.
+
+    upload_to/ab/abcdef...jpg: the same photo uploaded twice, for two
+    product variants say, is stored once and both rows point at it.
+    Files are never renamed with random suffixes and are only removed by
+    the gc_media command once nothing references them.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content in _save, identical names are the same file
+        return name
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        directory = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1].lower()
+        hexdigest = digest.hexdigest()
+        return posixpath.join(directory, hexdigest[:2], hexdigest + extension)
+
+    def _save(self, name, content):
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # Mark it as in use again, gc_media skips recently touched files
+            os.utime(self.path(name))
+            return name
+        # Write under a temporary name and move it in place, so a concurrent
+        # upload of the same content never sees a partial file
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+def product_image_storage():
+    """Storage of Lacteo.imagen, the 'product_images' entry of STORAGES"""
+    return storages['product_images']
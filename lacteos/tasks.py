@@ -0,0 +1,26 @@
+"""Background jobs run by the run_workers command, see lacteos.jobs"""
+from decimal import Decimal
+
+from django.utils.dateparse import parse_datetime
+
+from .customers import record_sales
+from .jobs import job
+from .models import Sale
+from .slow_queries import store_slow_queries
+
+
+@job('customers.record_sale', atomic=True)
+def record_customer_sale(customer_id, total_amount, total_profit, sale_date):
+    """Add a sale queued by customers.record_sales_later to its customer's totals"""
+    record_sales([Sale(
+        customer_id=customer_id,
+        total_amount=Decimal(total_amount),
+        total_profit=Decimal(total_profit),
+        sale_date=parse_datetime(sale_date),
+    )])
+
+
+@job('slow_queries.store', atomic=True)
+def store_slow_query_entries(entries):
+    """Store the slow queries a web process buffered, see lacteos.slow_queries"""
+    store_slow_queries(entries)
@@ -0,0 +1,34 @@
+import time
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from .metrics import observe
+
+
+class TimedTemplate(Template):
+    """Template that reports its render time to the metrics registry"""
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            observe(
+                'lacteos_template_render_seconds',
+                time.perf_counter() - started,
+                (self.template.name or '<string>',),
+            )
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The regular Django template backend, with timed templates"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -1,3 +1,907 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+import unittest
+import unittest.mock
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import admission
+from .admin import INPUT_FILTER_MATCHES, InputFilter, ProductFilter
+from .branches import BRANCH_ID_SPAN, branch_of_sale, branches
+from .customers import adjust_totals, customer_for_name, record_sales
+from . import forecasting
+from .dates import day_start, local_today
+from .inventory import record_new_product, set_stock, stock_at, take_snapshot, valuation
+from .jobs import ATOMIC_JOBS, JOB_REGISTRY, claim_next, enqueue, job, requeue_stale, retry_delay, run_job
+from .pagination import encode_cursor, keyset_paginate
+from .models import ChangeEvent, Customer, Job, Lacteo, PriceHistory, Sale, SaleItem, StockMovement, StockSnapshot
+from .reconcile import book_sales, drifted_sale_ids, fix_sale_totals, unbooked_sale_ids
+from .management.commands.refresh_replica import database_file
+from .routers import BranchRouter, branch_database, branch_scope, reset_write_flag, wrote_to_primary
+
+
+# Rendered pages must not depend on a collectstatic manifest
+plain_static_files = override_settings(STORAGES={
+    **settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+
+
+def make_product(name='Leche', price='3.00', cost_price='2.00', stock=10):
+    product = Lacteo.objects.create(
+        name=name, category='Leche', price=price, cost_price=cost_price, stock=stock,
+        unit='L', expiration_date=date(2030, 1, 1),
+    )
+    record_new_product(product)
+    return product
+
+
+def make_employee(username='emp', branch='', role='employee'):
+    user = User.objects.create_user(username, password='pw')
+    user.profile.role = role
+    user.profile.branch = branch
+    user.profile.save()
+    return user
+
+
+def ledger_stock(product):
+    return StockMovement.objects.filter(lacteo=product).aggregate(units=Sum('quantity'))['units']
+
+
+@plain_static_files
+@override_settings(ADMISSION_ENABLED=False)
+class CheckoutTestCase(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        # Idempotency keys are remembered in the cache, which no transaction rolls back
+        cache.clear()
+
+    def post_batch(self, sales):
+        return self.client.post('/api/sales/batch/', json.dumps({'sales': sales}), content_type='application/json')
+
+
+class BranchRoutingTests(CheckoutTestCase):
+    def test_shared_models_stay_in_default(self):
+        router = BranchRouter()
+        for branch in branches():
+            with branch_scope(branch):
+                self.assertIsNone(router.db_for_write(Lacteo))
+                self.assertIsNone(router.db_for_read(User))
+
+    def test_sales_go_to_the_branch_database(self):
+        router = BranchRouter()
+        for branch in branches():
+            with branch_scope(branch):
+                database = branch_database()
+                expected = None if database == 'default' else database
+                self.assertEqual(router.db_for_write(Sale), expected)
+                self.assertEqual(router.db_for_read(SaleItem), expected)
+
+    @unittest.skipUnless(len(branches()) > 1, 'needs a second branch, run with BRANCHES=norte')
+    def test_checkout_in_another_branch(self):
+        branch = branches()[1]
+        product = make_product(stock=5)
+        self.client.force_login(make_employee(branch=branch))
+
+        response = self.client.post('/purchase/', {'customer_name': 'Ana', 'item_id': [product.pk], 'quantity': ['2']})
+
+        self.assertEqual(response.status_code, 302)
+        with branch_scope(branch):
+            sale = Sale.objects.get()
+        self.assertEqual(sale._state.db, branch_database(branch))
+        self.assertGreaterEqual(sale.pk, BRANCH_ID_SPAN)
+        self.assertEqual(branch_of_sale(sale.pk), branch)
+        self.assertTrue(sale.checkout)
+        self.assertFalse(Sale.objects.using('default').exists())
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 3)
+        self.assertEqual(ledger_stock(product), 3)
+        self.assertTrue(StockMovement.objects.filter(sale_id=sale.pk, kind=StockMovement.SALE).exists())
+
+
+class ReplicaRouterTests(TestCase):
+    def test_session_writes_do_not_pin_to_the_primary(self):
+        reset_write_flag()
+        SessionStore().save()
+        self.assertFalse(wrote_to_primary())
+
+        make_product()
+        self.assertTrue(wrote_to_primary())
+
+    def test_refresh_finds_the_file_behind_a_read_only_uri(self):
+        settings_dict = {'NAME': 'file:///srv/lacteos/replica%20db.sqlite3?mode=ro', 'OPTIONS': {'uri': True}}
+        self.assertEqual(database_file(settings_dict), '/srv/lacteos/replica db.sqlite3')
+        self.assertEqual(database_file({'NAME': '/srv/lacteos/db.sqlite3'}), '/srv/lacteos/db.sqlite3')
+
+
+class IdempotencyTests(CheckoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product(stock=10)
+        self.user = make_employee()
+        self.client.force_login(self.user)
+
+    def sales_count(self):
+        with branch_scope(branches()[0]):
+            return Sale.objects.count()
+
+    def test_web_checkout_retry_returns_the_first_sale(self):
+        data = {'item_id': [self.product.pk], 'quantity': ['2'], 'idempotency_key': 'pos-1'}
+        first = self.client.post('/purchase/', data)
+        second = self.client.post('/purchase/', data)
+
+        self.assertEqual(self.sales_count(), 1)
+        self.assertEqual(first['Location'], second['Location'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+
+    def test_batch_duplicate_keys(self):
+        sale = {'idempotency_key': 'pos-2', 'items': [{'product_id': self.product.pk, 'quantity': 1}]}
+        first = self.post_batch([sale, sale]).json()
+        second = self.post_batch([sale]).json()
+
+        self.assertEqual([result['status'] for result in first['results']], ['created', 'duplicate'])
+        sale_id = first['results'][0]['sale_id']
+        self.assertEqual(first['results'][1]['sale_id'], sale_id)
+        self.assertEqual(second['results'], [{'index': 0, 'status': 'duplicate', 'sale_id': sale_id}])
+        self.assertEqual(self.sales_count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 9)
+
+    def test_key_of_another_user_is_rejected(self):
+        sale = {'idempotency_key': 'pos-3', 'items': [{'product_id': self.product.pk, 'quantity': 1}]}
+        self.post_batch([sale])
+        self.client.force_login(make_employee('other'))
+
+        result = self.post_batch([sale]).json()['results'][0]
+
+        self.assertEqual(result['status'], 'rejected')
+        self.assertEqual(self.sales_count(), 1)
+
+
+class BatchCheckoutTests(CheckoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.milk = make_product('Leche', stock=5)
+        self.cheese = make_product('Queso', price='8.00', cost_price='5.00', stock=2)
+        self.client.force_login(make_employee())
+
+    def test_partial_failure(self):
+        response = self.post_batch([
+            {'customer_name': 'Ana', 'items': [
+                {'product_id': self.milk.pk, 'quantity': 2}, {'product_id': self.cheese.pk, 'quantity': 1},
+            ]},
+            {'items': [{'product_id': self.cheese.pk, 'quantity': 2}]},
+            {'items': [{'product_id': 999999, 'quantity': 1}]},
+            {'items': [{'product_id': self.milk.pk, 'quantity': 'x'}]},
+            {'sale_date': '2020-01-01T00:00:00', 'items': [{'product_id': self.milk.pk, 'quantity': 1}]},
+            {'items': [{'product_id': self.milk.pk, 'quantity': 3}]},
+        ])
+
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in data['results']],
+            ['created', 'rejected', 'rejected', 'rejected', 'rejected', 'created'],
+        )
+        self.assertEqual((data['created'], data['rejected']), (2, 4))
+        self.assertEqual(data['results'][0]['total_amount'], '14.00')
+        self.milk.refresh_from_db()
+        self.cheese.refresh_from_db()
+        self.assertEqual((self.milk.stock, self.cheese.stock), (0, 1))
+        self.assertEqual((ledger_stock(self.milk), ledger_stock(self.cheese)), (0, 1))
+
+    def test_customers_cannot_submit(self):
+        self.client.force_login(User.objects.create_user('cus', password='pw'))
+        response = self.post_batch([{'items': [{'product_id': self.milk.pk, 'quantity': 1}]}])
+        self.assertEqual(response.status_code, 403)
+
+
+class UnbookedSaleTests(CheckoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product(stock=10)
+        self.since = timezone.now() - timedelta(hours=1)
+        StockMovement.objects.update(created_at=self.since)
+
+    def make_sale(self, quantity, **fields):
+        """A sale whose default database commit never happened: no stock change, no movement"""
+        with branch_scope(branches()[-1]):
+            sale = Sale.objects.create(total_amount=0, sale_date=timezone.now() - timedelta(minutes=30), **fields)
+            SaleItem.objects.create(
+                sale=sale, lacteo=self.product, quantity=quantity,
+                unit_price=Decimal('3.00'), cost_price=Decimal('2.00'),
+            )
+        return sale
+
+    def unbooked(self, sale):
+        with branch_scope(branches()[-1]):
+            return unbooked_sale_ids(0, sale.pk + 1, self.since)
+
+    def test_checkout_sale_missing_from_the_ledger_is_booked_once(self):
+        sale = self.make_sale(4, checkout=True)
+
+        unbooked = self.unbooked(sale)
+        self.assertEqual(unbooked, [sale.pk])
+        with branch_scope(branches()[-1]):
+            self.assertEqual(book_sales(unbooked), 1)
+            self.assertEqual(book_sales(unbooked), 0)
+        self.assertEqual(self.unbooked(sale), [])
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 6)
+        self.assertEqual(ledger_stock(self.product), 6)
+
+    def test_mock_and_admin_sales_are_left_alone(self):
+        sale = self.make_sale(4)
+
+        self.assertEqual(self.unbooked(sale), [])
+        with branch_scope(branches()[-1]):
+            self.assertEqual(book_sales([sale.pk]), 0)
+        call_command('reconcile_sales', '--book-unbooked', stdout=StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+        self.assertEqual(ledger_stock(self.product), 10)
+
+    def test_stock_is_never_taken_below_zero(self):
+        first = self.make_sale(7, checkout=True)
+        second = self.make_sale(7, checkout=True)
+
+        with branch_scope(branches()[-1]):
+            self.assertEqual(book_sales([first.pk, second.pk]), 1)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+        self.assertEqual(self.unbooked(second), [second.pk])
+
+    def test_command_only_reports_without_the_flag(self):
+        self.make_sale(4, checkout=True)
+        out = StringIO()
+
+        call_command('reconcile_sales', stdout=out)
+
+        self.assertIn('1 checkout sales are missing from the stock ledger', out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+
+        call_command('reconcile_sales', '--book-unbooked', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 6)
+
+
+class CustomerTotalsTests(CheckoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product(stock=10)
+        self.customer = customer_for_name('Ana')
+        with branch_scope(branches()[-1]):
+            self.sales = []
+            for quantity in (1, 2):
+                sale = Sale.objects.create(customer=self.customer, total_amount=0)
+                SaleItem.objects.create(
+                    sale=sale, lacteo=self.product, quantity=quantity,
+                    unit_price=Decimal('3.00'), cost_price=Decimal('2.00'),
+                )
+                sale.calculate_totals()
+                self.sales.append(sale)
+        record_sales(self.sales)
+
+    def assertTotals(self, orders, revenue, profit):
+        self.customer.refresh_from_db()
+        self.assertEqual(
+            (self.customer.order_count, self.customer.lifetime_revenue, self.customer.lifetime_profit),
+            (orders, Decimal(revenue), Decimal(profit)),
+        )
+
+    def test_deleted_sale_is_taken_off(self):
+        self.assertTotals(2, '9.00', '3.00')
+        with self.captureOnCommitCallbacks(using=self.sales[0]._state.db, execute=True):
+            self.sales[0].delete()
+        self.assertTotals(1, '6.00', '2.00')
+
+    def test_reconciled_sale_changes_the_totals(self):
+        sale = self.sales[1]
+        with branch_scope(branches()[-1]):
+            Sale.objects.filter(pk=sale.pk).update(total_amount=Decimal('100.00'), total_profit=Decimal('50.00'))
+            # As record_sales credited the drifted totals
+            Customer.objects.filter(pk=self.customer.pk).update(
+                lifetime_revenue=Decimal('103.00'), lifetime_profit=Decimal('51.00'),
+            )
+
+            fix_sale_totals([sale.pk])
+
+        self.assertTotals(2, '9.00', '3.00')
+
+    def test_checkout_without_valid_items_leaves_nothing(self):
+        self.client.force_login(make_employee())
+        self.client.post('/purchase/', {'customer_name': 'Luis', 'item_id': [self.product.pk], 'quantity': ['0x']})
+        self.assertFalse(Customer.objects.filter(name='Luis').exists())
+        self.assertTotals(2, '9.00', '3.00')
+
+
+class StockLedgerTests(CheckoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start = day_start(local_today())
+        self.product = make_product(stock=10)
+        StockMovement.objects.update(created_at=self.start - timedelta(days=3, hours=-1))
+        PriceHistory.objects.update(changed_at=self.start - timedelta(days=3, hours=-1))
+        StockMovement.objects.create(
+            lacteo=self.product, kind=StockMovement.SALE, quantity=-4, created_at=self.start - timedelta(days=2, hours=-1),
+        )
+        PriceHistory.objects.create(
+            lacteo=self.product, price=Decimal('3.00'), cost_price=Decimal('2.50'),
+            changed_at=self.start - timedelta(days=1, hours=-1),
+        )
+        Lacteo.objects.filter(pk=self.product.pk).update(stock=6, cost_price=Decimal('2.50'))
+        self.admin = make_employee('boss', role='admin')
+        self.client.force_login(self.admin)
+
+    def edit(self, stock):
+        return self.client.post(f'/products/{self.product.pk}/edit/', {
+            'name': 'Leche', 'category': 'Leche', 'price': '3.00', 'cost_price': '2.50',
+            'stock': str(stock), 'unit': 'L', 'expiration_date': '2030-01-01',
+        })
+
+    def valued_at(self, days_ago):
+        """Total of the valuation report for the local day days_ago"""
+        day = local_today() - timedelta(days=days_ago)
+        response = self.client.get('/inventory/valuation/', {'date': day.isoformat()})
+        return response.context['total']
+
+    def test_product_edit_records_the_difference(self):
+        self.edit(12)
+        self.edit(9)
+
+        movements = StockMovement.objects.filter(lacteo=self.product, created_by=self.admin).order_by('id')
+        self.assertEqual(
+            [(movement.kind, movement.quantity) for movement in movements],
+            [(StockMovement.RESTOCK, 6), (StockMovement.ADJUSTMENT, -3)],
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 9)
+        self.assertEqual(ledger_stock(self.product), 9)
+
+    def test_valuation_at_past_dates(self):
+        self.edit(12)
+        # 10 units at 2.00, 6 at 2.00, 6 at 2.50 after the cost change, 12 at 2.50 after the restock
+        expected = [Decimal('20.00'), Decimal('12.00'), Decimal('15.00'), Decimal('30.00')]
+
+        self.assertEqual([self.valued_at(days_ago) for days_ago in (3, 2, 1, 0)], expected)
+        take_snapshot(self.start - timedelta(days=2))
+        take_snapshot(self.start - timedelta(days=1))
+        self.assertEqual(StockSnapshot.objects.filter(lacteo=self.product).count(), 2)
+        self.assertEqual([self.valued_at(days_ago) for days_ago in (3, 2, 1, 0)], expected)
+
+    def test_booked_sale_is_dated_at_the_sale(self):
+        take_snapshot(self.start)
+        sale_date = self.start - timedelta(hours=2)
+        with branch_scope(branches()[-1]):
+            sale = Sale.objects.create(total_amount=0, sale_date=sale_date, checkout=True)
+            SaleItem.objects.create(
+                sale=sale, lacteo=self.product, quantity=4, unit_price=Decimal('3.00'), cost_price=Decimal('2.50'),
+            )
+            self.assertEqual(book_sales([sale.pk]), 1)
+
+        movement = StockMovement.objects.get(sale_id=sale.pk)
+        self.assertEqual(movement.created_at, sale_date)
+        self.assertEqual(StockSnapshot.objects.get(taken_at=self.start, lacteo=self.product).stock, 2)
+        self.assertEqual(stock_at(sale_date - timedelta(hours=1))[self.product.pk], 6)
+        self.assertEqual(stock_at(self.start)[self.product.pk], 2)
+        self.assertEqual(valuation(timezone.now())[1], Decimal('5.00'))
+
+
+class JobTestMixin:
+    def setUp(self):
+        self.calls = []
+
+        @job('tests.record')
+        def record(value):
+            self.calls.append(value)
+
+        @job('tests.fail')
+        def fail():
+            raise RuntimeError('boom')
+
+        for name in ('tests.record', 'tests.fail'):
+            self.addCleanup(JOB_REGISTRY.pop, name)
+            self.addCleanup(ATOMIC_JOBS.discard, name)
+
+
+class JobQueueTests(JobTestMixin, TestCase):
+    def test_a_job_is_claimed_once(self):
+        enqueue('tests.record', {'value': 1})
+
+        first = claim_next('w1')
+        self.assertEqual((first.status, first.locked_by, first.attempts), (Job.RUNNING, 'w1', 1))
+        self.assertIsNone(claim_next('w2'))
+
+    def test_jobs_wait_for_their_time(self):
+        enqueue('tests.record', {'value': 1}, delay=60)
+        self.assertIsNone(claim_next('w1'))
+
+    def test_failed_job_is_retried_with_backoff(self):
+        enqueue('tests.fail')
+
+        self.assertFalse(run_job(claim_next('w1')))
+
+        failed = Job.objects.get()
+        self.assertEqual((failed.status, failed.attempts, failed.locked_by), (Job.PENDING, 1, ''))
+        self.assertIn('RuntimeError: boom', failed.last_error)
+        self.assertGreater(failed.run_at, timezone.now() + timedelta(seconds=retry_delay(1) - 5))
+        self.assertIsNone(claim_next('w1'))
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(claim_next('w1').attempts, 2)
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        self.assertEqual([retry_delay(attempts) for attempts in (1, 2, 3)], [10, 20, 40])
+        self.assertEqual(retry_delay(20), 60 * 60)
+
+    def test_gives_up_at_max_attempts(self):
+        enqueue('tests.fail', max_attempts=2)
+
+        for _ in range(2):
+            Job.objects.update(run_at=timezone.now())
+            run_job(claim_next('w1'))
+
+        failed = Job.objects.get()
+        self.assertEqual((failed.status, failed.attempts), (Job.FAILED, 2))
+        self.assertIsNotNone(failed.finished_at)
+        Job.objects.update(run_at=timezone.now())
+        self.assertIsNone(claim_next('w1'))
+
+    def test_stale_jobs_are_requeued(self):
+        enqueue('tests.record', {'value': 1})
+        claim_next('w1')
+        Job.objects.update(locked_at=timezone.now() - timedelta(minutes=20))
+
+        self.assertEqual(requeue_stale(600), 1)
+        self.assertEqual(claim_next('w2').attempts, 2)
+
+
+class RunWorkersTests(JobTestMixin, TransactionTestCase):
+    # Workers are threads with their own connections, they only see committed jobs
+
+    def test_run_workers_drains_the_queue(self):
+        for value in range(3):
+            enqueue('tests.record', {'value': value})
+
+        call_command('run_workers', '--once', '--workers', '2', stdout=StringIO())
+
+        self.assertEqual(sorted(self.calls), [0, 1, 2])
+        self.assertEqual(set(Job.objects.values_list('status', flat=True)), {Job.DONE})
+
+
+ADMISSION_LIMITS = {
+    'checkout': {'rate': 0.01, 'burst': 2, 'global_rate': 100, 'global_burst': 100, 'concurrency': 1},
+    'login': {'rate': 0.01, 'burst': 1, 'concurrency': 1},
+}
+
+
+@plain_static_files
+@override_settings(ADMISSION_ENABLED=True, ADMISSION_LIMITS=ADMISSION_LIMITS, ADMISSION_QUEUE_SECONDS=0)
+class AdmissionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        admission._slots.clear()
+        self.addCleanup(admission._slots.clear)
+        self.product = make_product(stock=10)
+        self.client.force_login(make_employee())
+
+    def checkout(self):
+        return self.client.post('/purchase/', {'item_id': [self.product.pk], 'quantity': ['1']})
+
+    def test_token_bucket_refills_at_its_rate(self):
+        self.assertEqual(admission.take_token('bucket', 1, 2), 0)
+        self.assertEqual(admission.take_token('bucket', 1, 2), 0)
+        wait = admission.take_token('bucket', 1, 2)
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 1)
+
+    def test_checkout_over_the_burst_gets_429(self):
+        self.assertEqual([self.checkout().status_code for _ in range(2)], [302, 302])
+
+        response = self.checkout()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertTemplateUsed(response, 'retry_later.html')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+
+    def test_api_gets_a_json_429(self):
+        sale = {'items': [{'product_id': self.product.pk, 'quantity': 1}]}
+        for _ in range(2):
+            self.client.post('/api/sales/batch/', json.dumps({'sales': [sale]}), content_type='application/json')
+
+        response = self.client.post('/api/sales/batch/', json.dumps({'sales': [sale]}), content_type='application/json')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['retry_after'], int(response['Retry-After']))
+
+    def test_no_free_slot_gets_429(self):
+        slot = admission._semaphore('checkout', 1)
+        slot.acquire()
+        try:
+            response = self.checkout()
+        finally:
+            slot.release()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.checkout().status_code, 302)
+
+    def test_gets_are_not_limited(self):
+        for _ in range(5):
+            self.assertNotEqual(self.client.get('/purchase/').status_code, 429)
+
+    def test_login_buckets_are_per_username(self):
+        self.client.logout()
+        attempt = {'username': 'ana', 'password': 'wrong'}
+
+        self.assertEqual(self.client.post('/accounts/login/', attempt).status_code, 200)
+        self.assertEqual(self.client.post('/accounts/login/', attempt).status_code, 429)
+        self.assertEqual(self.client.post('/accounts/login/', {'username': 'luis', 'password': 'wrong'}).status_code, 200)
+
+
+@override_settings(CHANGE_FEED_TOKEN='feed-token', CHANGE_FEED_SETTLE_SECONDS=0)
+class ChangeFeedTests(CheckoutTestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('Leche', 'Queso', 'Yogur'):
+            make_product(name)
+
+    def feed(self, **params):
+        return self.client.get('/api/changes/', params, HTTP_AUTHORIZATION='Bearer feed-token')
+
+    def walk(self, limit, **params):
+        """Every event id the feed hands out, following its cursor"""
+        ids, cursor = [], 0
+        while True:
+            data = self.feed(cursor=cursor, limit=limit, **params).json()
+            ids.extend(event['id'] for event in data['results'])
+            cursor = data['cursor']
+            if not data['has_more']:
+                return ids, cursor
+
+    def test_pages_follow_each_other_without_gaps(self):
+        expected = list(ChangeEvent.objects.order_by('id').values_list('id', flat=True))
+        self.assertEqual(len(expected), 6)
+
+        ids, cursor = self.walk(limit=4)
+
+        self.assertEqual(ids, expected)
+        self.assertEqual(cursor, expected[-1])
+        self.assertEqual(self.feed(cursor=cursor).json()['results'], [])
+
+    def test_models_filter(self):
+        data = self.feed(models='lacteo').json()
+        self.assertEqual([event['model'] for event in data['results']], ['lacteo'] * 3)
+        self.assertEqual(self.feed(models='lacteo,nope').status_code, 400)
+
+    def test_needs_the_token_or_an_admin(self):
+        self.assertEqual(self.client.get('/api/changes/').status_code, 401)
+        self.client.force_login(make_employee())
+        self.assertEqual(self.client.get('/api/changes/').status_code, 403)
+        self.client.force_login(make_employee('boss', role='admin'))
+        self.assertEqual(self.client.get('/api/changes/').status_code, 200)
+
+    def test_bad_cursor_and_branch(self):
+        self.assertEqual(self.feed(cursor='x').status_code, 400)
+        self.assertEqual(self.feed(cursor=-1).status_code, 400)
+        self.assertEqual(self.feed(branch='nowhere').status_code, 400)
+
+    def test_sales_are_in_their_branch_feed(self):
+        branch = branches()[-1]
+        self.client.force_login(make_employee(branch=branch))
+        self.client.post('/purchase/', {'item_id': [Lacteo.objects.first().pk], 'quantity': ['1']})
+
+        sale_events = [event['model'] for event in self.feed(branch=branch, models='sale,sale_item').json()['results']]
+        self.assertEqual(sorted(set(sale_events)), ['sale', 'sale_item'])
+        if branch != branches()[0]:
+            self.assertEqual(self.feed(models='sale').json()['results'], [])
+
+    def test_event_rolls_back_with_its_row(self):
+        with branch_scope(branches()[-1]):
+            database = branch_database()
+            before = ChangeEvent.objects.count()
+            with self.assertRaises(RuntimeError), transaction.atomic(using=database):
+                Sale.objects.create(total_amount=0)
+                self.assertEqual(ChangeEvent.objects.count(), before + 1)
+                raise RuntimeError
+            self.assertEqual(ChangeEvent.objects.count(), before)
+
+    def test_young_events_wait_to_settle(self):
+        with override_settings(CHANGE_FEED_SETTLE_SECONDS=60):
+            self.assertEqual(self.feed().json()['results'], [])
+        ChangeEvent.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        with override_settings(CHANGE_FEED_SETTLE_SECONDS=60):
+            self.assertEqual(len(self.feed().json()['results']), 6)
+
+    def test_pruning_keeps_the_newest_and_expires_old_cursors(self):
+        ids = list(ChangeEvent.objects.order_by('id').values_list('id', flat=True))
+        ChangeEvent.objects.filter(pk__in=ids[:4]).update(created_at=timezone.now() - timedelta(days=40))
+
+        call_command('prune_changes', '--days', '30', '--batch-size', '3', '--sleep', '0', stdout=StringIO())
+
+        self.assertEqual(list(ChangeEvent.objects.order_by('id').values_list('id', flat=True)), ids[4:])
+        expired = self.feed(cursor=ids[1])
+        self.assertEqual(expired.status_code, 410)
+        self.assertEqual(expired.json()['oldest'], ids[4])
+        # Up to date with the pruned events: nothing was missed
+        self.assertEqual([event['id'] for event in self.feed(cursor=ids[3]).json()['results']], ids[4:])
+        self.assertEqual([event['id'] for event in self.feed().json()['results']], ids[4:])
+
+
+class ProductImageTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media = directory.name
+        media_root = override_settings(MEDIA_ROOT=self.media)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def with_image(self, name, content, filename='foto.JPG'):
+        product = make_product(name)
+        product.imagen = SimpleUploadedFile(filename, content)
+        product.save()
+        return product
+
+    def image_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, filename), self.media).replace(os.sep, '/')
+            for directory, _, files in os.walk(self.media) for filename in files
+        )
+
+    def age(self, name, hours):
+        then = time.time() - hours * 3600
+        os.utime(os.path.join(self.media, name), (then, then))
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.with_image('Leche', b'same photo')
+        second = self.with_image('Leche light', b'same photo', 'other.jpg')
+        third = self.with_image('Queso', b'another photo')
+
+        self.assertEqual(first.imagen.name, second.imagen.name)
+        self.assertNotEqual(first.imagen.name, third.imagen.name)
+        self.assertRegex(first.imagen.name, r'^productos/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(self.image_files(), sorted([first.imagen.name, third.imagen.name]))
+
+    def test_gc_media_deletes_only_old_orphans(self):
+        kept = self.with_image('Leche', b'in use')
+        orphan = self.with_image('Queso', b'replaced')
+        orphan_name = orphan.imagen.name
+        orphan.imagen = None
+        orphan.save()
+        recent = self.with_image('Yogur', b'just uploaded')
+        recent_name = recent.imagen.name
+        Lacteo.objects.filter(pk=recent.pk).update(imagen=None)
+        for name in (kept.imagen.name, orphan_name):
+            self.age(name, 48)
+
+        call_command('gc_media', '--dry-run', stdout=StringIO())
+        self.assertEqual(len(self.image_files()), 3)
+        call_command('gc_media', stdout=StringIO())
+
+        self.assertEqual(self.image_files(), sorted([kept.imagen.name, recent_name]))
+        self.assertFalse(os.path.exists(os.path.join(self.media, os.path.dirname(orphan_name))))
+
+    def test_api_links_to_the_image_storage(self):
+        product = self.with_image('Leche', b'photo')
+
+        row = self.client.get('/api/products/', {'fields': 'id,imagen'}).json()['results'][0]
+
+        self.assertEqual(row['imagen'], product.imagen.url)
+
+
+class DriftedTotalsTests(CheckoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product(stock=100)
+        self.customer = customer_for_name('Ana')
+        self.branch = branches()[-1]
+        with branch_scope(self.branch):
+            self.sales = []
+            for quantity in range(1, 6):
+                sale = Sale.objects.create(customer=self.customer, total_amount=0)
+                SaleItem.objects.create(
+                    sale=sale, lacteo=self.product, quantity=quantity,
+                    unit_price=Decimal('3.00'), cost_price=Decimal('2.00'),
+                )
+                sale.calculate_totals()
+                self.sales.append(sale)
+            # Drift three of them the ways a crash between writes could
+            Sale.objects.filter(pk=self.sales[0].pk).update(total_amount=Decimal('0'))
+            Sale.objects.filter(pk=self.sales[2].pk).update(total_cost=Decimal('1.00'), total_profit=Decimal('8.00'))
+            Sale.objects.filter(pk=self.sales[4].pk).update(roi=Decimal('10.00'))
+            # The customer is credited with the stored, drifted totals
+            record_sales(list(Sale.objects.filter(pk__in=[sale.pk for sale in self.sales])))
+        self.drifted = [self.sales[0].pk, self.sales[2].pk, self.sales[4].pk]
+
+    def drifted_ids(self):
+        with branch_scope(self.branch):
+            return drifted_sale_ids(0, self.sales[-1].pk + 1)
+
+    def test_finds_only_drifted_sales(self):
+        self.assertEqual(sorted(self.drifted_ids()), self.drifted)
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+        call_command('reconcile_sales', '--dry-run', '--branch', self.branch, stdout=out)
+
+        self.assertIn('3 sales have drifted totals', out.getvalue())
+        self.assertEqual(sorted(self.drifted_ids()), self.drifted)
+
+    def test_fixed_in_chunks(self):
+        out = StringIO()
+        call_command('reconcile_sales', '--chunk-size', '2', '--branch', self.branch, stdout=out)
+
+        self.assertIn('Fixed 3 of 3 drifted sales', out.getvalue())
+        self.assertEqual(out.getvalue().count('checked ids'), 3)
+        self.assertEqual(self.drifted_ids(), [])
+        with branch_scope(self.branch):
+            sale = Sale.objects.get(pk=self.sales[2].pk)
+        self.assertEqual(
+            (sale.total_amount, sale.total_cost, sale.total_profit, sale.roi),
+            (Decimal('9.00'), Decimal('6.00'), Decimal('3.00'), Decimal('50.00')),
+        )
+        self.customer.refresh_from_db()
+        # 1 + 2 + 3 + 4 + 5 units at 3.00; the first sale was credited as 0.00
+        self.assertEqual(self.customer.lifetime_revenue, Decimal('45.00'))
+
+    def test_customers_untouched_when_the_fix_fails(self):
+        def adjust_then_fail(differences):
+            adjust_totals(differences)
+            raise RuntimeError('branch commit failed')
+
+        with branch_scope(self.branch), unittest.mock.patch('lacteos.reconcile.adjust_totals', adjust_then_fail):
+            # The savepoint stands in for the top-level branch transaction the test case already holds
+            with self.assertRaises(RuntimeError), transaction.atomic(using=branch_database()):
+                fix_sale_totals(self.drifted)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.lifetime_revenue, Decimal('42.00'))
+        self.assertEqual(sorted(self.drifted_ids()), self.drifted)
+
+
+@plain_static_files
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        joined = timezone.now() - timedelta(days=1)
+        # Two groups of users that joined at the same instant, so pages split ties
+        for index in range(7):
+            user = User.objects.create_user(f'user{index}', first_name='Ana' if index < 2 else 'Luis')
+            User.objects.filter(pk=user.pk).update(date_joined=joined - timedelta(hours=index // 4))
+
+    def walk(self, per_page):
+        pages, cursor = [], None
+        while True:
+            page = keyset_paginate(User.objects.all(), 'date_joined', cursor, per_page=per_page)
+            pages.append([user.pk for user in page])
+            if not page.has_next:
+                return pages, page
+            cursor = page.next_cursor
+
+    def test_ties_are_split_without_repeats_or_gaps(self):
+        expected = list(User.objects.order_by('-date_joined', '-pk').values_list('pk', flat=True))
+
+        pages, last = self.walk(per_page=3)
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertIsNone(last.next_cursor)
+        self.assertIsNotNone(last.last_cursor)
+
+    def test_last_page_resumes_empty(self):
+        _, last = self.walk(per_page=7)
+        after = keyset_paginate(User.objects.all(), 'date_joined', last.last_cursor, per_page=7)
+        self.assertEqual(list(after), [])
+        self.assertFalse(after.has_next)
+
+    def test_bad_cursors_start_over(self):
+        first = [user.pk for user in keyset_paginate(User.objects.all(), 'date_joined', None, per_page=3)]
+        for cursor in ('not base64!', encode_cursor('yesterday', 1), encode_cursor(timezone.now().isoformat(), 'x'),
+                       encode_cursor('only one value'), 'bnVsbA'):
+            page = keyset_paginate(User.objects.all(), 'date_joined', cursor, per_page=3)
+            self.assertEqual([user.pk for user in page], first, cursor)
+
+    def test_user_management_pages_and_searches_names(self):
+        self.client.force_login(make_employee('boss', role='admin'))
+
+        response = self.client.get('/users/', {'search': 'ana'})
+        self.assertEqual([user.first_name for user in response.context['users']], ['Ana', 'Ana'])
+        self.assertEqual(self.client.get('/users/', {'cursor': 'garbage'}).status_code, 200)
+
+
+@plain_static_files
+class InputFilterTests(CheckoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.matches = INPUT_FILTER_MATCHES + 10
+        self.products = [make_product(f'Leche {index}') for index in range(self.matches)]
+        make_product('Queso')
+        self.admin = User.objects.create_superuser('root', password='pw')
+
+    def test_same_database_lists_every_match(self):
+        self.client.force_login(self.admin)
+
+        response = self.client.get('/superadmin/lacteos/pricehistory/', {'product': 'leche'})
+
+        self.assertEqual(response.context['cl'].queryset.count(), self.matches)
+        self.assertEqual(list(get_messages(response.wsgi_request)), [])
+
+    @unittest.skipUnless(len(branches()) > 1, 'needs a second branch, run with BRANCHES=norte')
+    def test_other_database_warns_when_cut_off(self):
+        request = RequestFactory().get('/', {'product': 'leche'})
+        request.user = self.admin
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        with branch_scope(branches()[1]):
+            sale = Sale.objects.create(total_amount=0)
+            for product in self.products:
+                SaleItem.objects.create(
+                    sale=sale, lacteo=product, quantity=1, unit_price=Decimal('3.00'), cost_price=Decimal('2.00'),
+                )
+            product_filter = ProductFilter(request, {'product': ['leche']}, SaleItem, None)
+
+            self.assertEqual(product_filter.queryset(request, SaleItem.objects.all()).count(), INPUT_FILTER_MATCHES)
+            self.assertEqual(product_filter.queryset(request, SaleItem.objects.filter(pk=0)).count(), 0)
+
+        warnings = [str(message) for message in get_messages(request)]
+        self.assertEqual(len(warnings), 2)
+        self.assertIn(f'More than {INPUT_FILTER_MATCHES} products match "leche"', warnings[0])
+
+    def test_subclass_must_name_its_field(self):
+        class NoFieldFilter(InputFilter):
+            title = 'nothing'
+            parameter_name = 'nothing'
+
+        with self.assertRaises(ImproperlyConfigured):
+            NoFieldFilter(RequestFactory().get('/'), {}, SaleItem, None)
+
+
+@override_settings(ADMISSION_ENABLED=False)
+class ReorderSuggestionCacheTests(TransactionTestCase):
+    # fan_out reads every branch from its own threads, which only see committed rows
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.product = make_product(stock=10)
+        self.client.force_login(make_employee())
+
+    def test_cached_until_a_sale_or_stock_change(self):
+        with unittest.mock.patch.object(forecasting, 'forecast', wraps=forecasting.forecast) as forecast:
+            forecasting.reorder_suggestions()
+            forecasting.reorder_suggestions()
+            self.assertEqual(forecast.call_count, 1)
+
+            self.client.post('/purchase/', {'item_id': [self.product.pk], 'quantity': ['9']})
+            forecasting.reorder_suggestions()
+            self.assertEqual(forecast.call_count, 2)
+
+            forecasting.reorder_suggestions()
+            self.assertEqual(forecast.call_count, 2)
+            with transaction.atomic():
+                set_stock(self.product, 30)
+                self.product.save()
+            forecasting.reorder_suggestions()
+            self.assertEqual(forecast.call_count, 3)
@@ -1,5 +1,5 @@
 from django.urls import path, include
-from . import views
+from . import api, views
 
 app_name = "lacteos"
 urlpatterns = [
@@ -16,4 +16,14 @@ urlpatterns = [
     path("users/", views.user_management, name="user_management"),
     path("users/<int:pk>/", views.user_detail, name="user_detail"),
     path("users/<int:pk>/delete/", views.user_delete, name="user_delete"),
+    path("profiles/", views.profile_list, name="profile_list"),
+    path("profiles/<str:name>/", views.profile_detail, name="profile_detail"),
+    path("inventory/valuation/", views.inventory_valuation, name="inventory_valuation"),
+    path("metrics", views.metrics_view, name="metrics"),
+    path("api/products/", api.product_list, name="api_product_list"),
+    path("api/products/batch/", api.product_batch, name="api_product_batch"),
+    path("api/products/changes/", api.product_changes, name="api_product_changes"),
+    path("api/sales/batch/", api.sale_batch, name="api_sale_batch"),
+    path("api/analytics/pricing/", api.pricing_simulation, name="api_pricing_simulation"),
+    path("api/changes/", api.change_feed, name="api_change_feed"),
 ]
\ No newline at end of file
@@ -1,15 +1,63 @@
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.shortcuts import render, redirect, get_object_or_404
-from django.db.models import Sum, Count, Avg, Q
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_date
+from django.shortcuts import render, redirect, get_object_or_404
+from django.db.models import Sum, Count, Avg, F, Q
+from django.db.models.functions import TruncDate
+from django.db import IntegrityError, transaction
 from django.contrib import messages
 from django.forms import modelform_factory, formset_factory
 from django.forms.models import inlineformset_factory
 from datetime import timedelta
+from uuid import uuid4
 from decimal import Decimal
-from .models import Lacteo, Sale, SaleItem, PriceHistory, UserProfile
-from .decorators import admin_or_employee_required, admin_required
+from .models import Customer, Lacteo, Sale, SaleItem, PriceHistory, StockMovement, UserProfile
+from . import changes, metrics
+from .decorators import admin_or_employee_required, admin_required, admission_control, in_user_branch, use_replica
+from .archive import product_totals, sales_totals, top_selling_products
+from .branches import branch_of_sale, fan_out
+from .customers import customer_for_name, record_sales_later
+from .dates import in_days, local_today, report_timezone
+from .forecasting import reorder_suggestions
+from .inventory import record_new_product, record_price_change, sale_movements, set_stock, valuation, valuation_moment
+from .checkout import (
+    CheckoutError, clean_idempotency_key, find_idempotent_sale, remember_idempotent_sale, unit_cost,
+)
+from .pagination import cached_count, keyset_paginate
+from .profiling import PROFILE_HEADER, list_profiles, profile_path, profile_token, read_profile
+from .routers import branch_database, branch_scope
+
+
+USERS_PER_PAGE = 50
+
+
+def card_variant(user):
+    """Which version of a cached product/sale card this user should see"""
+    if not user.is_authenticated:
+        return 'guest'
+    if not hasattr(user, 'profile'):
+        return 'customer'
+    if user.profile.is_admin():
+        return 'admin'
+    if user.profile.is_employee():
+        return 'staff'
+    return 'customer'
+
+
+def period_totals(first_day, last_day=None):
+    """Sale count, revenue and profit of the current branch for local days first_day to last_day"""
+    totals = Sale.objects.filter(in_days('sale_date', first_day, last_day)).aggregate(
+        count=Count('id'), revenue=Sum('total_amount'), profit=Sum('total_profit')
+    )
+    return {
+        'count': totals['count'],
+        'revenue': totals['revenue'] or Decimal('0'),
+        'profit': totals['profit'] or Decimal('0'),
+    }
 
 
 @login_required
@@ -17,22 +65,58 @@ def index(request):
     return render(request, "admin/index.html", {})
 
 
+def branch_dashboard(today, include_archive=False):
+    """Dashboard figures of the current branch, merged across branches by dashboard()"""
+    daily = (
+        Sale.objects.filter(in_days('sale_date', today - timedelta(days=6), today))
+        .annotate(day=TruncDate('sale_date', tzinfo=report_timezone()))
+        .values('day')
+        .annotate(count=Count('id'), revenue=Sum('total_amount'), profit=Sum('total_profit'))
+        .order_by()
+    )
+    return {
+        'latest': list(Sale.objects.prefetch_related('saleitem_set__lacteo')[:10]),
+        'totals': sales_totals(),
+        'recent': period_totals(today - timedelta(days=7), today),
+        'monthly': period_totals(today - timedelta(days=30), today),
+        'today': period_totals(today),
+        'daily': list(daily),
+        'products': product_totals(include_archive=include_archive),
+    }
+
+
+def _sum_totals(rows):
+    """Add up dicts of counts and amounts key by key"""
+    merged = {}
+    for row in rows:
+        for key, value in row.items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+
 @login_required
 @admin_required
+@use_replica
 def dashboard(request):
-    # Date ranges
-    today = timezone.now().date()
-    week_ago = today - timedelta(days=7)
-    month_ago = today - timedelta(days=30)
+    # Date ranges, in the shop's local calendar days
+    today = local_today()
     
-    # Latest sales (last 10)
-    latest_sales = Sale.objects.select_related('created_by').prefetch_related('saleitem_set__lacteo')[:10]
+    # Every branch database is queried at once, then the figures are merged
+    include_archive = request.GET.get('archive') == '1'
+    branches = fan_out(lambda: branch_dashboard(today, include_archive))
     
-    # Sales statistics
-    total_sales = Sale.objects.count()
-    total_revenue = Sale.objects.aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
-    total_profit = Sale.objects.aggregate(total=Sum('total_profit'))['total'] or Decimal('0')
-    total_cost = Sale.objects.aggregate(total=Sum('total_cost'))['total'] or Decimal('0')
+    # Latest sales (last 10)
+    latest_sales = sorted(
+        (sale for stats in branches.values() for sale in stats['latest']),
+        key=lambda sale: sale.sale_date, reverse=True,
+    )[:10]
+    
+    # Sales statistics (live sales plus archived monthly summaries)
+    totals = _sum_totals(stats['totals'] for stats in branches.values())
+    total_sales = totals['count']
+    total_revenue = totals['revenue']
+    total_profit = totals['profit']
+    total_cost = totals['cost']
     
     # Calculate overall ROI
     overall_roi = 0
@@ -40,59 +124,71 @@ def dashboard(request):
         overall_roi = (total_profit / total_cost) * 100
     
     # Recent sales (last 7 days)
-    recent_sales_count = Sale.objects.filter(sale_date__date__gte=week_ago).count()
-    recent_revenue = Sale.objects.filter(sale_date__date__gte=week_ago).aggregate(
-        total=Sum('total_amount')
-    )['total'] or Decimal('0')
-    recent_profit = Sale.objects.filter(sale_date__date__gte=week_ago).aggregate(
-        total=Sum('total_profit')
-    )['total'] or Decimal('0')
+    recent = _sum_totals(stats['recent'] for stats in branches.values())
+    recent_sales_count = recent['count']
+    recent_revenue = recent['revenue']
+    recent_profit = recent['profit']
     
     # Monthly sales (last 30 days)
-    monthly_sales_count = Sale.objects.filter(sale_date__date__gte=month_ago).count()
-    monthly_revenue = Sale.objects.filter(sale_date__date__gte=month_ago).aggregate(
-        total=Sum('total_amount')
-    )['total'] or Decimal('0')
-    monthly_profit = Sale.objects.filter(sale_date__date__gte=month_ago).aggregate(
-        total=Sum('total_profit')
-    )['total'] or Decimal('0')
+    monthly = _sum_totals(stats['monthly'] for stats in branches.values())
+    monthly_sales_count = monthly['count']
+    monthly_revenue = monthly['revenue']
+    monthly_profit = monthly['profit']
     
     # Today's sales
-    today_sales = Sale.objects.filter(sale_date__date=today)
-    today_count = today_sales.count()
-    today_revenue = today_sales.aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
-    today_profit = today_sales.aggregate(total=Sum('total_profit'))['total'] or Decimal('0')
+    today_totals = _sum_totals(stats['today'] for stats in branches.values())
+    today_count = today_totals['count']
+    today_revenue = today_totals['revenue']
+    today_profit = today_totals['profit']
     
     # Average sale amount
-    avg_sale_amount = Sale.objects.aggregate(avg=Avg('total_amount'))['avg'] or Decimal('0')
-    avg_profit_per_sale = Sale.objects.aggregate(avg=Avg('total_profit'))['avg'] or Decimal('0')
-    avg_roi = Sale.objects.aggregate(avg=Avg('roi'))['avg'] or Decimal('0')
-    
-    # Top selling products
-    top_products = SaleItem.objects.values('lacteo__name').annotate(
-        total_quantity=Sum('quantity'),
-        total_revenue=Sum('subtotal'),
-        total_profit=Sum('profit')
-    ).order_by('-total_quantity')[:10]
-    
-    # Sales by day (last 7 days)
+    avg_sale_amount = Decimal('0')
+    avg_profit_per_sale = Decimal('0')
+    avg_roi = Decimal('0')
+    if total_sales:
+        avg_sale_amount = total_revenue / total_sales
+        avg_profit_per_sale = total_profit / total_sales
+        avg_roi = totals['roi_sum'] / total_sales
+    
+    # Top selling products (archived items only when asked, it is a larger scan)
+    top_products = top_selling_products((stats['products'] for stats in branches.values()), 10)
+    
+    # Sales by day (last 7 days), one grouped query per branch over the week
+    daily_totals = {}
+    for stats in branches.values():
+        for row in stats['daily']:
+            day = daily_totals.setdefault(row['day'], {'count': 0, 'revenue': Decimal('0'), 'profit': Decimal('0')})
+            day['count'] += row['count']
+            day['revenue'] += row['revenue'] or 0
+            day['profit'] += row['profit'] or 0
     sales_by_day = []
     for i in range(6, -1, -1):
         date = today - timedelta(days=i)
-        day_sales = Sale.objects.filter(sale_date__date=date)
+        day_sales = daily_totals.get(date, {})
         sales_by_day.append({
             'date': date,
-            'count': day_sales.count(),
-            'revenue': day_sales.aggregate(total=Sum('total_amount'))['total'] or Decimal('0'),
-            'profit': day_sales.aggregate(total=Sum('total_profit'))['total'] or Decimal('0'),
+            'count': day_sales.get('count', 0),
+            'revenue': day_sales.get('revenue') or Decimal('0'),
+            'profit': day_sales.get('profit') or Decimal('0'),
         })
     
+    # Last 30 days of each shop, shown when there is more than one
+    branch_sales = [
+        {'branch': branch, **stats['monthly']} for branch, stats in branches.items()
+    ] if len(branches) > 1 else []
+    
     # Calculate max revenue for chart scaling
     max_revenue = max([day['revenue'] for day in sales_by_day], default=Decimal('1'))
     
+    # Best customers, read from their maintained lifetime totals
+    top_customers = Customer.objects.order_by('-lifetime_revenue')[:10]
+    
     # Low stock products
     low_stock_products = Lacteo.objects.filter(stock__lt=10).order_by('stock')[:5]
     
+    # Forecast based reorder suggestions (cached until the next sale)
+    reorder_products = reorder_suggestions(limit=10)
+    
     context = {
         'latest_sales': latest_sales,
         'total_sales': total_sales,
@@ -112,9 +208,13 @@ def dashboard(request):
         'avg_profit_per_sale': avg_profit_per_sale,
         'avg_roi': avg_roi,
         'top_products': top_products,
+        'top_customers': top_customers,
         'sales_by_day': sales_by_day,
         'max_revenue': max_revenue,
         'low_stock_products': low_stock_products,
+        'reorder_products': reorder_products,
+        'include_archive': include_archive,
+        'branch_sales': branch_sales,
     }
     
     return render(request, 'dashboard.html', context)
@@ -144,6 +244,8 @@ def product_list(request):
         'categories': categories,
         'selected_category': category,
         'search_query': search_query,
+        'card_variant': card_variant(request.user),
+        'checkout_key': uuid4().hex,
     }
     return render(request, 'products/list.html', context)
 
@@ -153,17 +255,47 @@ def product_detail(request, pk):
     product = get_object_or_404(Lacteo, pk=pk)
     context = {
         'product': product,
+        'checkout_key': uuid4().hex,
     }
     return render(request, 'products/detail.html', context)
 
 
+def _replay_sale(request, idempotency_key):
+    """Redirect to the sale already recorded under this key, if there is one"""
+    found = find_idempotent_sale(idempotency_key)
+    if found is None:
+        return None
+    sale_id, created_by_id = found
+    if created_by_id != request.user.pk:
+        messages.error(request, 'This purchase key was already used.')
+        return redirect('lacteos:product_list')
+    messages.info(request, f'Sale #{sale_id} was already recorded.')
+    return redirect('lacteos:sale_detail', pk=sale_id)
+
+
 @login_required
+@admission_control('checkout')
+@in_user_branch
 def create_sale(request):
     """Create a new sale with items"""
     if request.method == 'POST':
         customer_name = request.POST.get('customer_name', '')
         notes = request.POST.get('notes', '')
         
+        try:
+            idempotency_key = clean_idempotency_key(
+                request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+            )
+        except CheckoutError as e:
+            messages.error(request, str(e))
+            return redirect('lacteos:product_list')
+        
+        # A retried submission gets the sale recorded the first time
+        if idempotency_key:
+            replay = _replay_sale(request, idempotency_key)
+            if replay:
+                return replay
+        
         # Get items from POST data
         item_ids = request.POST.getlist('item_id')
         quantities = request.POST.getlist('quantity')
@@ -172,56 +304,86 @@ def create_sale(request):
             messages.error(request, 'Please select at least one item to purchase.')
             return redirect('lacteos:product_list')
         
-        # Create sale
-        sale = Sale.objects.create(
-            customer_name=customer_name,
-            total_amount=Decimal('0'),
-            created_by=request.user,
-            notes=notes
-        )
-        
-        # Create sale items
-        total_items = 0
-        for item_id, quantity in zip(item_ids, quantities):
-            try:
-                lacteo = Lacteo.objects.get(pk=item_id)
-                qty = int(quantity)
+        try:
+            # The sale lives in the branch database, products and customers in default
+            with transaction.atomic(), transaction.atomic(using=branch_database(), savepoint=False):
+                # Create sale
+                sale = Sale.objects.create(
+                    customer_name=customer_name,
+                    customer=customer_for_name(customer_name),
+                    total_amount=Decimal('0'),
+                    created_by=request.user,
+                    notes=notes,
+                    idempotency_key=idempotency_key,
+                    checkout=True,
+                )
                 
-                if qty <= 0:
-                    continue
+                # Create sale items
+                total_items = 0
+                sold = {}
+                for item_id, quantity in zip(item_ids, quantities):
+                    try:
+                        # Locked until commit, so concurrent checkouts take turns on a product
+                        lacteo = Lacteo.objects.select_for_update().get(pk=item_id)
+                        qty = int(quantity)
+                        
+                        if qty <= 0:
+                            continue
+                        
+                        if qty > lacteo.stock:
+                            metrics.inc('lacteos_checkout_stock_rejections_total', ('web',))
+                            messages.warning(
+                                request, 
+                                f'Only {lacteo.stock} units available for {lacteo.name}. Adjusted quantity.'
+                            )
+                            qty = lacteo.stock
+                        
+                        if qty > 0:
+                            # Decrement in SQL, as submit_sales does, so the stock always
+                            # equals the sum of its movements
+                            updated = Lacteo.objects.filter(pk=lacteo.pk, stock__gte=qty).update(
+                                stock=F('stock') - qty, updated_at=timezone.now()
+                            )
+                            if not updated:
+                                continue
+                            changes.record_rows(Lacteo, [lacteo.pk])
+                            cost_price = unit_cost(lacteo)
+                            SaleItem.objects.create(
+                                sale=sale,
+                                lacteo=lacteo,
+                                quantity=qty,
+                                unit_price=lacteo.price,
+                                cost_price=cost_price
+                            )
+                            sold[lacteo.pk] = sold.get(lacteo.pk, 0) + qty
+                            
+                            total_items += qty
+                    except (Lacteo.DoesNotExist, ValueError):
+                        continue
                 
-                if qty > lacteo.stock:
-                    messages.warning(
-                        request, 
-                        f'Only {lacteo.stock} units available for {lacteo.name}. Adjusted quantity.'
-                    )
-                    qty = lacteo.stock
+                if total_items == 0:
+                    # Undo the sale (and any new customer) in both databases
+                    transaction.set_rollback(True)
+                    transaction.set_rollback(True, using=branch_database())
+                    messages.error(request, 'No valid items were added to the sale.')
+                    return redirect('lacteos:product_list')
                 
-                if qty > 0:
-                    cost_price = lacteo.cost_price if lacteo.cost_price > 0 else lacteo.price * Decimal('0.6')
-                    SaleItem.objects.create(
-                        sale=sale,
-                        lacteo=lacteo,
-                        quantity=qty,
-                        unit_price=lacteo.price,
-                        cost_price=cost_price
-                    )
-                    
-                    # Update stock
-                    lacteo.stock -= qty
-                    lacteo.save()
-                    
-                    total_items += qty
-            except (Lacteo.DoesNotExist, ValueError):
-                continue
-        
-        if total_items == 0:
-            sale.delete()
-            messages.error(request, 'No valid items were added to the sale.')
-            return redirect('lacteos:product_list')
+                StockMovement.objects.bulk_create(sale_movements(sale.id, sold, request.user))
+                
+                # Recalculate totals
+                sale.calculate_totals()
+                # Customer totals are updated by a background job (run_workers)
+                record_sales_later([sale])
+        except IntegrityError:
+            # A concurrent retry with the same key committed first
+            replay = _replay_sale(request, idempotency_key) if idempotency_key else None
+            if replay is None:
+                raise
+            return replay
         
-        # Recalculate totals
-        sale.calculate_totals()
+        if idempotency_key:
+            remember_idempotent_sale(idempotency_key, sale.id, request.user.pk)
+        metrics.inc('lacteos_sales_created_total', ('web',))
         
         messages.success(
             request, 
@@ -235,8 +397,13 @@ def create_sale(request):
 @login_required
 def sale_detail(request, pk):
     """View details of a sale"""
-    sale = get_object_or_404(Sale, pk=pk)
-    items = sale.saleitem_set.select_related('lacteo').all()
+    branch = branch_of_sale(pk)
+    if branch is None:
+        raise Http404
+    with branch_scope(branch):
+        sale = get_object_or_404(Sale, pk=pk)
+    # Products are in the shared database, so they cannot be joined in
+    items = sale.saleitem_set.prefetch_related('lacteo')
     
     context = {
         'sale': sale,
@@ -247,11 +414,31 @@ def sale_detail(request, pk):
 
 @login_required
 def my_sales(request):
-    """View user's sales history"""
-    sales = Sale.objects.filter(created_by=request.user).order_by('-sale_date')
+    """View user's sales history, from every branch"""
+    per_branch = fan_out(lambda: (
+        list(Sale.objects.filter(created_by=request.user)),
+        list(SaleItem.objects.filter(sale__created_by=request.user).values_list('sale_id', 'lacteo_id')),
+    ))
+    sales = sorted(
+        (sale for branch_sales, _ in per_branch.values() for sale in branch_sales),
+        key=lambda sale: sale.sale_date, reverse=True,
+    )
+    # The cached cards show product names, so they are keyed on their products' last update too
+    items = [item for _, branch_items in per_branch.values() for item in branch_items]
+    product_updates = dict(
+        Lacteo.objects.filter(pk__in={lacteo_id for _, lacteo_id in items}).values_list('pk', 'updated_at')
+    )
+    products_updated_at = {}
+    for sale_id, lacteo_id in items:
+        updated_at = product_updates.get(lacteo_id)
+        if updated_at and (sale_id not in products_updated_at or updated_at > products_updated_at[sale_id]):
+            products_updated_at[sale_id] = updated_at
+    for sale in sales:
+        sale.products_updated_at = products_updated_at.get(sale.pk)
     
     context = {
         'sales': sales,
+        'card_variant': card_variant(request.user),
     }
     return render(request, 'sales/list.html', context)
 
@@ -260,26 +447,33 @@ def my_sales(request):
 @admin_required
 def user_management(request):
     """Admin view to manage users"""
-    search_query = request.GET.get('search', '')
+    search_query = request.GET.get('search', '').strip()
     role_filter = request.GET.get('role', '')
+    cursor = request.GET.get('cursor', '')
     
-    users = User.objects.all().select_related('profile')
+    users = User.objects.select_related('profile').only(
+        'username', 'email', 'first_name', 'last_name', 'is_active', 'date_joined', 'profile__role'
+    )
     
     if search_query:
+        # Prefix match so the NOCASE indexes on username, email and names can be used
         users = users.filter(
-            Q(username__icontains=search_query) |
-            Q(email__icontains=search_query) |
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query)
+            Q(username__istartswith=search_query) |
+            Q(email__istartswith=search_query) |
+            Q(first_name__istartswith=search_query) |
+            Q(last_name__istartswith=search_query)
         )
     
     if role_filter:
         users = users.filter(profile__role=role_filter)
     
-    users = users.order_by('-date_joined')
+    total_users = cached_count(users)
+    page = keyset_paginate(users, 'date_joined', cursor, per_page=USERS_PER_PAGE)
     
     context = {
-        'users': users,
+        'users': page,
+        'page': page,
+        'total_users': total_users,
         'search_query': search_query,
         'role_filter': role_filter,
         'role_choices': UserProfile.ROLE_CHOICES,
@@ -339,6 +533,60 @@ def user_delete(request, pk):
     return render(request, 'users/delete.html', context)
 
 
+@login_required
+@admin_required
+def profile_list(request):
+    """Admin view listing stored request profiles, slowest first"""
+    token = None
+    if request.method == 'POST':
+        token = profile_token(request.user)
+    
+    context = {
+        'profiles': list_profiles(),
+        'profiling_enabled': settings.PROFILING_ENABLED,
+        'sample_rate': settings.PROFILING_SAMPLE_RATE,
+        'profile_header': PROFILE_HEADER,
+        'token': token,
+    }
+    return render(request, 'admin/profiles.html', context)
+
+
+@login_required
+@admin_required
+def profile_detail(request, name):
+    """Admin view of one request profile; ?download=1 returns the .prof file"""
+    if request.GET.get('download') == '1':
+        path = profile_path(name, '.prof')
+        if path is None:
+            raise Http404
+        return FileResponse(path.open('rb'), as_attachment=True, filename=path.name)
+    
+    summary = read_profile(name)
+    if summary is None:
+        raise Http404
+    return render(request, 'admin/profile_detail.html', {'profile': summary})
+
+
+@login_required
+@admin_required
+def inventory_valuation(request):
+    """Admin view of the inventory value at the close of ?date= (default today)"""
+    today = local_today()
+    try:
+        day = min(parse_date(request.GET.get('date', '')) or today, today)
+    except ValueError:
+        day = today
+    rows, total = valuation(valuation_moment(day))
+    
+    context = {
+        'day': day,
+        'today': today,
+        'rows': rows,
+        'total': total,
+    }
+    return render(request, 'admin/valuation.html', context)
+
+
 @login_required
 @admin_or_employee_required
 def product_create(request):
@@ -358,21 +606,24 @@ def product_create(request):
             return render(request, 'products/create.html')
         
         try:
-            product = Lacteo.objects.create(
-                name=name,
-                category=category,
-                price=Decimal(price),
-                cost_price=Decimal(cost_price) if cost_price else Decimal('0'),
-                stock=int(stock),
-                unit=unit,
-                expiration_date=expiration_date if expiration_date else None,
-                description=description
-            )
+            # Atomic so the product and its change-feed events commit together
+            with transaction.atomic():
+                product = Lacteo.objects.create(
+                    name=name,
+                    category=category,
+                    price=Decimal(price),
+                    cost_price=Decimal(cost_price) if cost_price else Decimal('0'),
+                    stock=int(stock),
+                    unit=unit,
+                    expiration_date=expiration_date if expiration_date else None,
+                    description=description
+                )
 
-            if 'imagen' in request.FILES:
-                product.imagen = request.FILES['imagen']
+                if 'imagen' in request.FILES:
+                    product.imagen = request.FILES['imagen']
 
-            product.save()
+                product.save()
+                record_new_product(product, request.user)
             messages.success(request, f'Producto "{product.name}" creado exitosamente.')
             return redirect('lacteos:product_detail', pk=product.pk)
         except (ValueError, Exception) as e:
@@ -402,11 +653,12 @@ def product_edit(request, pk):
             return render(request, 'products/edit.html', {'product': product})
         
         try:
+            old_price, old_cost = product.price, product.cost_price
             product.name = name
             product.category = category
             product.price = Decimal(price)
             product.cost_price = Decimal(cost_price) if cost_price else Decimal('0')
-            product.stock = int(stock)
+            counted = int(stock)
             product.unit = unit
             product.expiration_date = expiration_date if expiration_date else None
             product.description = description
@@ -414,7 +666,11 @@ def product_edit(request, pk):
             if 'imagen' in request.FILES:
                 product.imagen = request.FILES['imagen']
             
-            product.save()
+            # Stock changes and new prices go to the ledger with the product
+            with transaction.atomic():
+                set_stock(product, counted, request.user, 'Product edited')
+                product.save()
+                record_price_change(product, old_price, old_cost, request.user, 'Product edited')
             
             messages.success(request, f'Producto "{product.name}" actualizado exitosamente.')
             return redirect('lacteos:product_detail', pk=product.pk)
@@ -442,4 +698,18 @@ def product_delete(request, pk):
     context = {
         'product': product,
     }
-    return render(request, 'products/delete.html', context)
\ No newline at end of file
+    return render(request, 'products/delete.html', context)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; needs METRICS_TOKEN as a bearer token, or an admin session"""
+    token = settings.METRICS_TOKEN
+    scraper = token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    admin = request.user.is_authenticated and hasattr(request.user, 'profile') and request.user.profile.is_admin()
+    if not (scraper or admin):
+        return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+    
+    return HttpResponse(
+        metrics.render_text(metrics.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
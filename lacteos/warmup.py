@@ -0,0 +1,151 @@
+"""
+Warming a worker process up before it takes traffic.
+
+config/wsgi.py and config/asgi.py call warm_up_worker() once the Django
+application is built, so the first requests a new worker serves do not
+pay for work every process does once: compiling the URL patterns, parsing
+the templates into the cached loader, importing the database backends and
+opening their connections, and filling the per-process caches (catalog
+product cards, reorder suggestions). Each step is timed; the timings are
+kept in last_report and shown by `manage.py startup_report`.
+
+A step that fails is logged and skipped: a worker that cannot warm up
+still serves requests, only slower at first. WARMUP_ENABLED turns the
+whole thing off (for example while running migrations in a container
+whose entrypoint imports the WSGI module).
+
+The opened connections only last until the first request with
+DB_CONN_MAX_AGE set; with the default of 0 Django closes them when a
+request starts, and warming only saves the backend imports and setup.
+"""
+import logging
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+# [(step, seconds, detail)] of the last warm-up in this process
+last_report = []
+
+
+def warm_urls():
+    """Compile every URL pattern and build the reverse() lookup tables"""
+    from django.urls import URLResolver, get_resolver
+
+    resolver = get_resolver()
+    pending = [resolver]
+    compiled = 0
+    while pending:
+        current = pending.pop()
+        for pattern in current.url_patterns:
+            pattern.pattern.regex
+            compiled += 1
+            if isinstance(pattern, URLResolver):
+                pending.append(pattern)
+    # Populates reverse_dict, namespace_dict and app_dict in one pass
+    resolver.reverse_dict
+    return f'{compiled} patterns'
+
+
+def template_names(directory):
+    """Names of the .html templates under directory, as get_template() takes them"""
+    root = Path(directory)
+    return sorted(path.relative_to(root).as_posix() for path in root.rglob('*.html'))
+
+
+def warm_templates():
+    """Parse every project and app template into the cached loader"""
+    from django.template import TemplateSyntaxError, engines
+    from django.template.utils import get_app_template_dirs
+
+    loaded = failed = 0
+    for backend in engines.all():
+        directories = list(backend.dirs) + list(get_app_template_dirs('templates'))
+        for directory in directories:
+            for name in template_names(directory):
+                try:
+                    backend.get_template(name)
+                    loaded += 1
+                except TemplateSyntaxError:
+                    # Fragments that only parse where they are included
+                    logger.debug('Skipping template %s', name, exc_info=True)
+                    failed += 1
+    return f'{loaded} templates' + (f', {failed} skipped' if failed else '')
+
+
+def warm_databases():
+    """Open a connection to every database and read from the product table"""
+    from .models import Lacteo
+
+    for alias in connections:
+        connection = connections[alias]
+        connection.ensure_connection()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    Lacteo.objects.exists()
+    return f'{len(connections.settings)} databases'
+
+
+def warm_caches():
+    """Render the public catalog's product cards and compute the reorder suggestions"""
+    from django.contrib.auth.models import AnonymousUser
+    from django.http import HttpRequest
+    from django.template.loader import render_to_string
+
+    from .forecasting import reorder_suggestions
+    from .models import Lacteo
+
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = '/'
+    request.META = {'SERVER_NAME': 'localhost', 'SERVER_PORT': '80'}
+    request.user = AnonymousUser()
+    products = Lacteo.objects.filter(stock__gt=0)
+    render_to_string('products/list.html', {
+        'products': products,
+        'categories': Lacteo.objects.values_list('category', flat=True).distinct(),
+        'card_variant': 'guest',
+    }, request)
+    reorder_suggestions(limit=10)
+    return f'{products.count()} product cards'
+
+
+STEPS = [
+    ('urls', warm_urls),
+    ('templates', warm_templates),
+    ('databases', warm_databases),
+    ('caches', warm_caches),
+]
+
+
+def warm_up_worker(setup_seconds=None):
+    """
+    Run the warm-up steps, returning [(step, seconds, detail)].
+
+    setup_seconds is how long building the application took, reported as
+    the first row.
+    """
+    if not settings.WARMUP_ENABLED:
+        return []
+    report = []
+    if setup_seconds is not None:
+        report.append(('setup', setup_seconds, 'django.setup() and middleware'))
+    for name, step in STEPS:
+        started = time.perf_counter()
+        try:
+            detail = step()
+        except Exception:
+            logger.exception('Warm-up step %s failed', name)
+            detail = 'failed'
+        report.append((name, time.perf_counter() - started, detail))
+    last_report[:] = report
+    logger.info(
+        'Worker warmed up in %.3fs: %s',
+        sum(seconds for _, seconds, _ in report),
+        ', '.join(f'{name} {seconds:.3f}s' for name, seconds, _ in report),
+    )
+    return report
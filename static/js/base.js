@@ -0,0 +1,39 @@
+function toggleMenu() {
+    const navLinks = document.getElementById('navLinks');
+    const hamburger = document.querySelector('.hamburger');
+    navLinks.classList.toggle('active');
+    hamburger.classList.toggle('active');
+}
+
+// Close menu when clicking outside
+document.addEventListener('click', function(event) {
+    const navLinks = document.getElementById('navLinks');
+    const hamburger = document.querySelector('.hamburger');
+    const isClickInside = navLinks.contains(event.target) || hamburger.contains(event.target);
+
+    if (!isClickInside && navLinks.classList.contains('active')) {
+        navLinks.classList.remove('active');
+        hamburger.classList.remove('active');
+    }
+});
+
+// Close menu when clicking on a link
+document.querySelectorAll('.nav-links a').forEach(link => {
+    link.addEventListener('click', function() {
+        const navLinks = document.getElementById('navLinks');
+        const hamburger = document.querySelector('.hamburger');
+        navLinks.classList.remove('active');
+        hamburger.classList.remove('active');
+    });
+});
+
+// A page restored from the back/forward cache still holds the checkout key of
+// a purchase that may already be recorded, give it a fresh one
+window.addEventListener('pageshow', function(event) {
+    if (!event.persisted || !window.crypto || !crypto.randomUUID) {
+        return;
+    }
+    document.querySelectorAll('input[name="idempotency_key"]').forEach(input => {
+        input.value = crypto.randomUUID().replace(/-/g, '');
+    });
+});
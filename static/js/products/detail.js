@@ -0,0 +1,10 @@
+const quantityInput = document.getElementById('quantity');
+
+if (quantityInput) {
+    quantityInput.addEventListener('input', function() {
+        const qty = parseInt(this.value) || 1;
+        const price = parseFloat(this.dataset.price);
+        const total = (qty * price).toFixed(2);
+        document.getElementById('total-price').textContent = total;
+    });
+}
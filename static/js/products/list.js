@@ -0,0 +1,80 @@
+let cart = {};
+
+function addToCart(productId, productName, price, maxStock) {
+    const qtyInput = document.getElementById('qty-' + productId);
+    const quantity = parseInt(qtyInput.value) || 1;
+    
+    if (quantity <= 0 || quantity > maxStock) {
+        alert('Cantidad inválida. Máximo disponible: ' + maxStock);
+        return;
+    }
+    
+    if (cart[productId]) {
+        const newQty = cart[productId].quantity + quantity;
+        if (newQty > maxStock) {
+            alert('No hay suficiente stock. Máximo disponible: ' + maxStock);
+            return;
+        }
+        cart[productId].quantity = newQty;
+    } else {
+        cart[productId] = {
+            name: productName,
+            price: price,
+            quantity: quantity
+        };
+    }
+    
+    qtyInput.value = 1;
+    updateCart();
+}
+
+function updateCart() {
+    const cartItems = document.getElementById('cart-items');
+    const cartTotal = document.getElementById('cart-total');
+    const totalAmount = document.getElementById('total-amount');
+    const purchaseBtn = document.getElementById('purchase-btn');
+    
+    cartItems.innerHTML = '';
+    
+    let total = 0;
+    let hasItems = false;
+    
+    for (const [productId, item] of Object.entries(cart)) {
+        if (item.quantity > 0) {
+            hasItems = true;
+            const itemTotal = item.price * item.quantity;
+            total += itemTotal;
+            
+            const cartItem = document.createElement('div');
+            cartItem.className = 'cart-item';
+            cartItem.innerHTML = `
+                <div>
+                    <strong>${item.name}</strong><br>
+                    <small>${item.quantity} x $${item.price.toFixed(2)}</small>
+                </div>
+                <div style="display: flex; align-items: center; gap: 0.75rem;">
+                    <strong>$${itemTotal.toFixed(2)}</strong>
+                    <button type="button" onclick="removeFromCart(${productId})">×</button>
+                </div>
+                <input type="hidden" name="item_id" value="${productId}">
+                <input type="hidden" name="quantity" value="${item.quantity}">
+            `;
+            cartItems.appendChild(cartItem);
+        }
+    }
+    
+    if (!hasItems) {
+        cartItems.innerHTML = '<p class="no-products">Selecciona productos para comprar</p>';
+        cartTotal.style.display = 'none';
+        purchaseBtn.disabled = true;
+    } else {
+        totalAmount.textContent = '$' + total.toFixed(2);
+        cartTotal.style.display = 'flex';
+        purchaseBtn.disabled = false;
+    }
+}
+
+function removeFromCart(productId) {
+    delete cart[productId];
+    updateCart();
+}